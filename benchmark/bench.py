@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+
+"""
+WxGL端到端渲染基准测试
+
+在没有显示设备的环境中以离屏场景（Mesa llvmpipe的EGL上下文，或OSMesa上下文）绘制参数化场景，测量模型装配耗时、
+稳定帧耗时、拾取延迟和帧捕捉吞吐量，结果写入JSON文件；compare命令对比基准结果，标记性能退化。
+
+    python bench.py run -o result.json                                  # 以默认参数运行全部场景
+    python bench.py run --scenes scatter,mesh --scatter 1e5,1e6 -o a.json # 指定场景和参数（逗号分隔多个参数）
+    python bench.py run --osmesa -o result.json                         # 使用OSMesa上下文
+    python bench.py compare baseline.json result.json --threshold 0.2   # 对比基准结果，存在性能退化时返回1
+
+场景参数：scatter（散列点数量N）、mesh（网格面行列数M）、spheres（球的数量K）、isosurface（等值面数据集的边长）、text（2D文字数量T）
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import platform
+import argparse
+import numpy as np
+
+SCENES = ('scatter', 'mesh', 'spheres', 'isosurface', 'text')
+DEFAULTS = {'scatter': '100000', 'mesh': '300', 'spheres': '200', 'isosurface': '64', 'text': '100'}
+
+METRICS = [                                             # 对比的指标：键路径、较小为优（False表示较大为优）
+    (('assemble_ms',), True),
+    (('frame_ms', 'median'), True),
+    (('pick_ms', 'median'), True),
+    (('capture_fps',), False)
+]
+COUNTERS = ('draws', 'vertices', 'indices', 'programs', 'textures', 'uniforms', 'uploads')
+
+def build_scatter(app, n, rng):
+    """N个随机分布的散列点"""
+
+    app.scatter(rng.uniform(-1, 1, (n, 3)), color='#30a0f0', size=3)
+
+def build_mesh(app, m, rng):
+    """M×M网格面"""
+
+    z, x = np.mgrid[-np.pi:np.pi:m*1j, -np.pi:np.pi:m*1j]
+    app.mesh(x, np.sin(x) + np.cos(z), z, color='#30a0f0')
+
+def build_spheres(app, k, rng):
+    """K个随机分布的球"""
+
+    for center in rng.uniform(-3, 3, (k, 3)):
+        app.sphere(center, 0.2, color='#f0a030')
+
+def build_isosurface(app, v, rng):
+    """边长为v的三维数据集的等值面"""
+
+    g = np.linspace(-np.pi, np.pi, v)
+    x, y, z = np.meshgrid(g, g, g, indexing='ij')
+    data = np.sin(x)*np.cos(y) + np.sin(y)*np.cos(z) + np.sin(z)*np.cos(x) # 螺旋二十四面体（gyroid）
+    app.isosurface(data, 0.0, color='#ccc6b0', xr=(-1,1), yr=(-1,1), zr=(-1,1))
+
+def build_text(app, t, rng):
+    """T个随机分布的2D文字"""
+
+    for i, pos in enumerate(rng.uniform(-1, 1, (t, 3))):
+        app.text('label %d'%i, pos, size=16)
+
+def timing(samples):
+    """返回耗时采样（秒）的统计结果（毫秒）"""
+
+    ms = np.array(samples) * 1000
+    return {
+        'mean': float(ms.mean()),
+        'median': float(np.median(ms)),
+        'p95': float(np.percentile(ms, 95)),
+        'min': float(ms.min())
+    }
+
+def run_one(scene, param, args):
+    """运行一个场景的基准测试，返回测试结果字典"""
+
+    import wxgl
+    from OpenGL.GL import glFinish, glGetString, GL_RENDERER, GL_VERSION
+    from wxgl.offscreen import OffscreenScene
+
+    rng = np.random.default_rng(args.seed)
+    app = wxgl.App(backend='offscreen', size=args.size, pick_mode=args.pick_mode)
+
+    t0 = time.perf_counter()
+    globals()['build_%s'%scene](app, param, rng)
+    build = time.perf_counter() - t0
+
+    fig = OffscreenScene(app, **app.kwds)
+    fig._create_context()
+    fig._create_fbo()
+    fig._resize()
+    fig._initialize_gl()
+
+    try:
+        t0 = time.perf_counter()
+        fig._assemble()
+        glFinish()
+        assemble = time.perf_counter() - t0
+
+        fig.increment = False
+        fig.duration = 0
+
+        t0 = time.perf_counter()
+        fig._paint()
+        glFinish()
+        first = time.perf_counter() - t0
+
+        for i in range(args.warmup):
+            fig._paint()
+            glFinish()
+
+        frames = list()
+        for i in range(args.frames):
+            t0 = time.perf_counter()
+            fig._paint()
+            glFinish()
+            frames.append(time.perf_counter() - t0)
+        counters = fig.render_stats()
+
+        vx, vy, vw, vh = fig.viewport[0]
+        picks = list()
+        for x, y in rng.uniform(0.25, 0.75, (args.picks, 2)) * (vw, vh) + (vx, vy):
+            t0 = time.perf_counter()
+            fig._pick(int(x), int(y))
+            glFinish()
+            picks.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        nbytes = sum(im.nbytes for im in fig.record([0]*args.captures, mode='RGB'))
+        capture = time.perf_counter() - t0
+
+        result = {
+            'scene': scene,
+            'param': param,
+            'build_ms': build * 1000,
+            'assemble_ms': assemble * 1000,
+            'first_frame_ms': first * 1000,
+            'frame_ms': timing(frames),
+            'fps': args.frames / sum(frames),
+            'pick_ms': timing(picks),
+            'capture_fps': args.captures / capture,
+            'capture_mbps': nbytes / capture / 2**20,
+            'counters': counters,
+            'renderer': glGetString(GL_RENDERER).decode(),
+            'gl_version': glGetString(GL_VERSION).decode()
+        }
+    finally:
+        fig.close()
+
+    return result
+
+def cmd_run(args):
+    """run命令：运行基准测试，结果写入JSON文件"""
+
+    if args.osmesa:
+        os.environ['PYOPENGL_PLATFORM'] = 'osmesa'      # 须在导入PyOpenGL之前设置
+
+    import wxgl
+
+    scenes = args.scenes.split(',')
+    for scene in scenes:
+        if scene not in SCENES:
+            raise ValueError('不支持的场景：%s'%scene)
+
+    results = dict()
+    for scene in scenes:
+        for param in getattr(args, scene).split(','):
+            param = int(float(param))
+            key = '%s-%d'%(scene, param)
+            print('%-20s'%key, end='', flush=True)
+
+            results[key] = run_one(scene, param, args)
+            gc.collect()
+
+            r = results[key]
+            print('assemble %9.1fms  frame %8.2fms  pick %7.2fms  capture %6.1ffps' % (
+                r['assemble_ms'], r['frame_ms']['median'], r['pick_ms']['median'], r['capture_fps']
+            ))
+
+    renderer = next(iter(results.values()))['renderer'] if results else None
+    report = {
+        'meta': {
+            'wxgl': wxgl.version,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'renderer': renderer,
+            'lp_num_threads': os.environ.get('LP_NUM_THREADS'),
+            'size': list(args.size),
+            'frames': args.frames,
+            'warmup': args.warmup,
+            'picks': args.picks,
+            'captures': args.captures,
+            'pick_mode': args.pick_mode,
+            'seed': args.seed,
+            'date': time.strftime('%Y-%m-%d %H:%M:%S')
+        },
+        'results': results
+    }
+
+    with open(args.output, 'w', encoding='utf-8') as fp:
+        json.dump(report, fp, indent=2, ensure_ascii=False)
+
+    print('结果已写入%s'%args.output)
+
+def lookup(result, path):
+    """按键路径取出指标值，不存在时返回None"""
+
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+
+    return result
+
+def compare(baseline, current, threshold=0.2, min_ms=0.5):
+    """对比两次基准测试的结果，返回对比记录的列表和性能退化的数量
+
+    耗时类指标增加超过threshold（相对值）且超过min_ms（绝对值）、吞吐量类指标减少超过threshold时，记为性能退化；
+    绘制计数（绘制调用、顶点数量等）由场景确定，增加即记为退化
+    baseline    - 基准结果字典
+    current     - 当前结果字典
+    threshold   - 相对变化阈值
+    min_ms      - 耗时类指标的绝对变化阈值（毫秒），忽略噪声量级的波动
+    """
+
+    rows, regressions = list(), 0
+    for key, base in baseline['results'].items():
+        cur = current['results'].get(key)
+        if cur is None:
+            rows.append((key, '-', None, None, None, '缺失'))
+            continue
+
+        for path, lower in METRICS:
+            b, c = lookup(base, path), lookup(cur, path)
+            if b is None or c is None:
+                continue
+
+            change = (c - b) / b if b else 0.0
+            if lower:
+                worse = change > threshold and c - b > min_ms
+                better = change < -threshold and b - c > min_ms
+            else:
+                worse = change < -threshold
+                better = change > threshold
+
+            status = '退化' if worse else '改善' if better else ''
+            regressions += worse
+            rows.append((key, '.'.join(path), b, c, change, status))
+
+        for name in COUNTERS:
+            b, c = lookup(base, ('counters', name)), lookup(cur, ('counters', name))
+            if b is None or c is None or b == c:
+                continue
+
+            change = (c - b) / b if b else float('inf')
+            regressions += c > b
+            rows.append((key, 'counters.'+name, b, c, change, '退化' if c > b else '改善'))
+
+    return rows, regressions
+
+def cmd_compare(args):
+    """compare命令：对比基准结果，存在性能退化时返回1"""
+
+    with open(args.baseline, encoding='utf-8') as fp:
+        baseline = json.load(fp)
+    with open(args.current, encoding='utf-8') as fp:
+        current = json.load(fp)
+
+    for key in ('renderer', 'size', 'cpus'):
+        if baseline['meta'].get(key) != current['meta'].get(key):
+            print('注意：两次测试的%s不同（%s | %s），对比结果仅供参考'%(key, baseline['meta'].get(key), current['meta'].get(key)))
+
+    rows, regressions = compare(baseline, current, threshold=args.threshold, min_ms=args.min_ms)
+    print('%-20s %-20s %12s %12s %9s  %s'%('benchmark', 'metric', 'baseline', 'current', 'change', 'status'))
+    for key, metric, b, c, change, status in rows:
+        if b is None:
+            print('%-20s %-20s %12s %12s %9s  %s'%(key, metric, '-', '-', '-', status))
+        elif args.all or status:
+            print('%-20s %-20s %12.2f %12.2f %+8.1f%%  %s'%(key, metric, b, c, 100*change, status))
+
+    print('性能退化：%d项'%regressions)
+    return 1 if regressions else 0
+
+def main():
+    parser = argparse.ArgumentParser(description='WxGL端到端渲染基准测试（离屏渲染，不需要显示设备）')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help='运行基准测试，结果写入JSON文件')
+    run.add_argument('-o', '--output', default='bench.json', help='输出文件名，默认bench.json')
+    run.add_argument('--scenes', default=','.join(SCENES), help='逗号分隔的场景列表，默认全部场景')
+    for scene in SCENES:
+        run.add_argument('--%s'%scene, default=DEFAULTS[scene], help='%s场景的参数，逗号分隔多个参数，默认%s'%(scene, DEFAULTS[scene]))
+    run.add_argument('--size', type=lambda s: tuple(int(v) for v in s.split('x')), default=(960, 640), help='画布分辨率，默认960x640')
+    run.add_argument('--frames', type=int, default=30, help='计时的帧数，默认30')
+    run.add_argument('--warmup', type=int, default=5, help='计时之前绘制的帧数，默认5')
+    run.add_argument('--picks', type=int, default=10, help='拾取次数，默认10')
+    run.add_argument('--captures', type=int, default=30, help='测量捕捉吞吐量的帧数，默认30')
+    run.add_argument('--pick-mode', default='gpu', choices=('gpu', 'cpu'), help='拾取模式，默认gpu')
+    run.add_argument('--seed', type=int, default=0, help='随机数种子，默认0')
+    run.add_argument('--osmesa', action='store_true', help='使用OSMesa上下文（默认使用EGL上下文）')
+
+    cmp = sub.add_parser('compare', help='对比基准结果，存在性能退化时返回1')
+    cmp.add_argument('baseline', help='基准结果文件')
+    cmp.add_argument('current', help='当前结果文件')
+    cmp.add_argument('--threshold', type=float, default=0.2, help='相对变化阈值，默认0.2')
+    cmp.add_argument('--min-ms', type=float, default=0.5, help='耗时类指标的绝对变化阈值（毫秒），默认0.5')
+    cmp.add_argument('--all', action='store_true', help='显示全部指标（默认只显示退化和改善的指标）')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        cmd_run(args)
+    else:
+        sys.exit(cmd_compare(args))
+
+if __name__ == '__main__':
+    main()
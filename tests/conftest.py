@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+
+"""测试公用的夹具：以离屏场景绘制，没有可用的EGL或OSMesa上下文时跳过"""
+
+import pytest
+
+offscreen = pytest.importorskip('wxgl.offscreen')
+
+@pytest.fixture
+def render():
+    """返回离屏绘制函数：render(app)创建离屏场景并绘制一帧，返回场景和RGB图像数组；测试结束后关闭全部场景"""
+
+    figs = list()
+
+    def _render(app):
+        fig = offscreen.OffscreenScene(app, **app.kwds)
+        figs.append(fig)
+        try:
+            fig.setup()
+        except RuntimeError as e:
+            pytest.skip(str(e))
+
+        return fig, fig.render(0, mode='RGB')
+
+    yield _render
+
+    for fig in figs:
+        fig.close()
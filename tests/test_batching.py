@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+
+"""合批回归测试"""
+
+import numpy as np
+import wxgl
+
+def two_cubes(batching):
+    app = wxgl.App(size=(160, 120), batching=batching)
+    app.cube((-0.6, 0, 0), 0.5, color='red', name='a')
+    app.cube((0.6, 0, 0), 0.5, color='red', name='b')
+    return app
+
+def test_update_batched_member(render):
+    """更新合批成员模型的顶点属性后，该模型移出合批，绘制结果与不合批时相同"""
+
+    images = list()
+    for batching in (False, True):
+        app = two_cubes(batching)
+        fig, im = render(app)
+        if batching:
+            assert fig.batches, '两个立方体应当合批'
+
+        m = app.models[0][app.widgets['b'][0]]
+        key = [k for k, v in m.attribute.items() if v['tag'] == 'color'][0]
+        m.update_attribute(key, np.tile([0.0, 1.0, 0.0], (m.vshape[0], 1)))
+
+        images.append(fig.render(0, mode='RGB'))
+        fig.close()
+
+    unbatched, batched = images
+    assert (unbatched[..., 1] > 100).any(), '更新后的立方体应当为绿色'
+    assert np.abs(unbatched.astype(int) - batched).max() <= 1
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+"""拾取测试：模板缓冲区拾取、逐模型深度拾取和CPU射线拾取的结果应当相同"""
+
+import wxgl
+
+def picks(fig, x, y):
+    assert fig._create_pick_fbo(), '不支持离屏帧缓冲区'
+    hit = fig._raycast(x, y)
+    return fig._pick_by_id(x, y), fig._pick_by_depth(x, y), hit[0] if hit else None
+
+def test_pick_nearest(render):
+    """拾取点上有前后两个立方体时拾取前面的立方体，空白处未命中"""
+
+    app = wxgl.App(size=(160, 120))
+    app.cube((0, 0, -0.6), 0.8, color='red', name='back')
+    app.cube((0, 0, 0.6), 0.4, color='green', name='front')
+    fig, im = render(app)
+    w, h = fig.csize
+
+    front = app.widgets['front'][0]
+    assert picks(fig, w//2, h//2) == (front, front, front)
+    assert picks(fig, 2, 2) == (None, None, None)
+
+def test_pick_behind_grid(render):
+    """网格朝向相机的面被剔除且不填充，拾取网格内的球体"""
+
+    app = wxgl.App(size=(160, 120))
+    app.sphere((0, 0, 0), 0.6, color='red', name='ball')
+    app.grid()
+    fig, im = render(app)
+    w, h = fig.csize
+
+    ball = app.widgets['ball'][0]
+    assert picks(fig, w//2, h//2) == (ball, ball, ball)
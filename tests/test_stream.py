@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+"""流式数据环形缓冲区测试"""
+
+import numpy as np
+import wxgl
+
+def spiral(n):
+    t = np.linspace(0, 4*np.pi, n)
+    return np.stack((np.cos(t)*t/15, np.sin(t)*t/15, np.zeros(n)), axis=1)
+
+def test_append_wrap(render):
+    """装配后追加数据超出容量，环形缓冲区回绕，绘制结果与装配前只追加最近capacity个顶点的结果相同"""
+
+    capacity, vs = 16, spiral(40)
+    for style in ('line', 'point'):
+        app = wxgl.App(size=(160, 120))
+        app.stream([], capacity, style=style, color='red', size=5, name='s')
+        app.append('s', vs[-capacity:])
+        fig, expected = render(app)
+        fig.close()
+        assert (expected[..., 0] > 100).any()
+
+        app = wxgl.App(size=(160, 120))
+        app.stream([], capacity, style=style, color='red', size=5, name='s')
+        m = app.models[0][app.widgets['s'][0]]
+        fig, im = render(app)
+        for k in range(0, 40, 7):
+            app.append('s', vs[k:k+7])
+            im = fig.render(0, mode='RGB')
+        fig.close()
+
+        assert m.stream == (capacity, 40 % capacity, capacity)
+        assert np.abs(im.astype(int) - expected).max() <= 1, style
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+"""顶点属性和顶点索引的局部更新测试"""
+
+import numpy as np
+import wxgl
+
+def half_sphere(app, m):
+    """将球体后一半顶点改为绿色，并将后一半索引置为0（退化为不可见的图元）"""
+
+    key = [k for k, v in m.attribute.items() if v['tag'] == 'color'][0]
+    n, k = m.vshape[0], m.indices['n']
+    m.update_attribute(key, np.tile([0.0, 1.0, 0.0], (n-n//2, 1)), offset=n//2)
+    m.update_indices(np.zeros(k-k//2, dtype=np.int32), offset=k//2)
+
+def sphere_app(interleaved):
+    app = wxgl.App(size=(160, 120), interleaved=interleaved)
+    app.sphere((0, 0, 0), 0.8, color='red', name='s')
+    return app, app.models[0][app.widgets['s'][0]]
+
+def test_partial_update_interleaved(render):
+    """交错存储和分别存储的模型局部更新顶点属性和顶点索引后，绘制结果与装配前更新的结果相同"""
+
+    app, m = sphere_app(False)
+    half_sphere(app, m)
+    fig, expected = render(app)
+    assert (expected[..., 1] > 100).any() and (expected[..., 0] > 100).any(), '球体应当一半红色一半绿色'
+
+    for interleaved in (False, True):
+        app, m = sphere_app(interleaved)
+        fig, before = render(app)
+        assert not (before[..., 1] > 100).any()
+
+        half_sphere(app, m)
+        im = fig.render(0, mode='RGB')
+        fig.close()
+
+        assert np.abs(im.astype(int) - expected).max() <= 1, 'interleaved=%s'%interleaved
@@ -4,7 +4,7 @@ from OpenGL.GL import *
 from wxgl.app import App
 from wxgl.scheme import Scheme
 from wxgl.texture import Texture
-from wxgl.model import Model
+from wxgl.model import Model, CAMERA_BLOCK
 from wxgl.light import BaseLight, SunLight, LampLight, SkyLight, SphereLight
 from wxgl.util import font_list, color_list, cm_list, cmap, read_pcfile
 
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import os, sys
+import numpy as np
 from . scheme import Scheme
 
 try:
@@ -21,13 +22,20 @@ try:
 except:
     glut_is_available = False
 
+try:
+    from . offscreen import show_offscreen, render_frames
+    offscreen_is_available = True
+except ImportError as e:
+    offscreen_is_available = False
+    offscreen_import_error = e
+
 class App(Scheme):
     """应用程序类"""
 
     def __init__(self, backend='auto', **kwds):
         """构造函数
 
-        backend     - 后端GUI库，可选wx或qt，默认auto（按照wx/qt优先级自动选择）
+        backend     - 后端GUI库，可选wx、qt或offscreen（EGL/OSMesa离屏渲染），默认auto（按照wx/qt优先级自动选择）
         kwds        - 关键字参数
             size        - 窗口分辨率，默认(960, 640)
             bg          - 画布背景色，默认(0.0, 0.0, 0.0)
@@ -38,21 +46,33 @@ class App(Scheme):
             azim_range  - 方位角变化范围，默认-180°～180°
             elev_range  - 高度角变化范围，默认-180°～180°
             smooth      - 直线和点的反走样，默认True
+            shader_cache - 着色器程序二进制文件的缓存路径，默认None（不使用磁盘缓存）
+            interleaved - 全部模型的顶点属性交错存储于同一个缓冲区，默认False
+            pick_mode   - 拾取模式，可选gpu（离屏帧缓冲区拾取）或cpu（射线与BVH求交），默认gpu
+            culling     - 视椎体剔除，跳过世界坐标包围盒完全位于视野之外的模型，默认True
+            transparency - 半透明模型绘制模式，可选sort（按深度排序）或oit（加权混合顺序无关透明），默认sort
+            target_fps  - 动画播放时的目标帧率，默认60；静态场景只在相机、拾取、可见性或窗口改变时重绘
+            batching    - 静态模型合批，将光照模型和绘制状态相同的不透明静态模型合并到共享的缓冲区中绘制，默认False
+            lod         - 球、球环、圆柱、圆锥和圆管生成多个细分层次，绘制时按屏幕空间误差选择，默认False
+            lod_error   - 细节层次的屏幕空间误差阈值（像素），默认1.0
+            profile     - 逐模型性能分析，可选False、True或overlay（同时在画布左上角显示耗时最多的模型），默认False
+            budgets     - 逐帧计数预算，计数名到上限的字典，如{'draws':2000, 'vertices':5000000}，计数超出预算时以logging记录警告，默认None
+            frame_callback - 每帧绘制完成后调用的函数，参数为与render_stats返回值相同的逐帧计数字典，默认None
         """
 
         for key in kwds:
-            if key not in ['size', 'bg', 'haxis', 'fovy', 'azim', 'elev', 'azim_range', 'elev_range', 'smooth']:
+            if key not in ['size', 'bg', 'haxis', 'fovy', 'azim', 'elev', 'azim_range', 'elev_range', 'smooth', 'shader_cache', 'interleaved', 'pick_mode', 'culling', 'transparency', 'target_fps', 'batching', 'lod', 'lod_error', 'profile', 'budgets', 'frame_callback']:
                 raise KeyError('不支持的关键字参数：%s'%key)
  
         self.backend = backend.lower()
         self.kwds = kwds
-        Scheme.__init__(self, haxis=kwds.get('haxis', 'y'), bg=kwds.get('bg', (0.0, 0.0, 0.0)))
+        Scheme.__init__(self, haxis=kwds.get('haxis', 'y'), bg=kwds.get('bg', (0.0, 0.0, 0.0)), lod=kwds.get('lod', False))
 
         self.tinfo = None
         self.cinfo = None
 
-    def savefig(self, outfile, dpi=None, fps=25, frames=100, loop=0, quality=100):
-        """保存画布为图像文件或动画文件
+    def savefig(self, outfile, dpi=None, fps=25, frames=100, loop=0, quality=100, backend=None, workers=1):
+        """保存画布为图像文件或动画文件；离屏渲染时返回最后一帧图像的numpy数组
 
         outfile     - 输出文件名，支持的文件格式：'.png', '.jpg', '.jpeg', '.gif', '.webp', '.mp4', '.avi', '.wmv', '.mov' 
         dpi         - 图像文件每英寸像素数
@@ -60,6 +80,8 @@ class App(Scheme):
         frames      - 动画文件总帧数
         loop        - gif文件播放次数，0表示循环播放
         quality     - webp文件质量，100表示最高品质
+        backend     - 本次保存使用的后端，None表示使用构造函数指定的后端；offscreen表示不打开窗口，直接在EGL或OSMesa上下文中离屏渲染
+        workers     - 离屏渲染动画文件的渲染进程数，大于1时各进程以fork方式继承展示方案，分段渲染后按顺序合并编码
         """
         
         if outfile is None:
@@ -77,17 +99,23 @@ class App(Scheme):
             if fpath and not os.path.isdir(fpath):
                 os.makedirs(fpath)
 
-        if self.backend == 'wx':
+        backend = self.backend if backend is None else backend.lower()
+        if backend == 'offscreen':
+            if offscreen_is_available:
+                return show_offscreen(self, outfile=outfile, ext=ext, dpi=dpi, fps=fps, frames=frames, loop=loop, quality=quality, workers=workers)
+            else:
+                print('当前系统导入离屏渲染模块失败：%s'%offscreen_import_error)
+        elif backend == 'wx':
             if wx_is_available:
                 show_wxfigure(self, outfile=outfile, ext=ext, dpi=dpi, fps=fps, frames=frames, loop=loop, quality=quality)
             else:
                 print('当前系统导入wxpython失败，请检查或重新安装wxpython')
-        elif self.backend =='qt':
+        elif backend =='qt':
             if qt_is_available:
                 show_qtfigure(self, outfile=outfile, ext=ext, dpi=dpi, fps=fps, frames=frames, loop=loop, quality=quality)
             else:
                 print('当前系统导入pyqt6失败，请检查或重新安装pyqt6')
-        elif self.backend == 'glut':
+        elif backend == 'glut':
             if glut_is_available:
                 show_figure(self, outfile=outfile, ext=ext, dpi=dpi, fps=fps, frames=frames, loop=loop, quality=quality)
             else:
@@ -103,6 +131,26 @@ class App(Scheme):
             else:
                 print('未发现可用的显示后端，建议安装wxpython或pyqt6')
 
+    def render_frames(self, t0, t1, fps=25, mode='RGB', crop=False, workers=1):
+        """离线渲染动画，依次生成t0到t1（不含）之间各帧图像的numpy数组
+
+        各帧的渲染时长为t0+i*1000/fps，与实际流逝的时间无关，不需要GUI事件循环，渲染速度只取决于硬件
+        t0          - 起始时刻（毫秒）
+        t1          - 结束时刻（毫秒）
+        fps         - 帧率
+        mode        - 'RGB'或'RGBA'
+        crop        - 是否将宽高裁切为16的倍数
+        workers     - 渲染进程数，大于1时各进程以fork方式继承展示方案，分段渲染后按顺序生成
+        """
+
+        if not offscreen_is_available:
+            raise RuntimeError('当前系统导入离屏渲染模块失败：%s'%offscreen_import_error)
+
+        n = max(0, int(np.ceil((t1-t0)*fps/1000 - 1e-6)))
+        durations = t0 + np.arange(n)*1000/fps
+
+        return render_frames(self, durations.tolist(), mode=mode, crop=crop, workers=workers)
+
     def show(self):
         """显示画布"""
 
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from OpenGL.GL import *
+from . model import Model
+from . bvh import triangulate
+
+def list_primitive(gltype, n, indices=None, fill=True):
+    """将条带、扇形和闭合线转为独立图元，返回图元类型和顶点索引组成的元组；无法转换时返回None
+
+    gltype      - GL基本图元
+    n           - 顶点数量
+    indices     - 顶点索引数据
+    fill        - 多边形为填充模式（非填充模式下三角化会显示多余的边）
+    """
+
+    seq = np.arange(n, dtype=np.int64) if indices is None else np.array(indices, dtype=np.int64).ravel()
+
+    if gltype in (GL_POINTS, GL_LINES, GL_TRIANGLES, GL_QUADS):
+        return gltype, seq
+
+    if gltype in (GL_LINE_STRIP, GL_LINE_LOOP):
+        if gltype == GL_LINE_LOOP and seq.shape[0] > 2:
+            seq = np.append(seq, seq[0])
+        return GL_LINES, np.stack((seq[:-1], seq[1:]), axis=1).ravel()
+
+    if fill and gltype in (GL_TRIANGLE_STRIP, GL_TRIANGLE_FAN, GL_QUAD_STRIP):
+        return GL_TRIANGLES, triangulate(gltype, n, indices).ravel()
+
+    return None
+
+def batch_key(m):
+    """返回模型的合批键，键相同的模型可以合并为一个顶点缓冲区绘制；模型不能合批时返回None
+
+    可合批的模型：不透明、无纹理、无幻灯片函数、非实例化、无细节层次、非流式数据，uniform变量不随时间变化，全部顶点属性逐顶点存储
+    """
+
+    if not m.opacity or m.slide or m.instances or m.lods or m.stream or m.before or m.after or m.vshape is None:
+        return None
+
+    state = sorted(m.state.items())
+    fill = m.state.get('polygon', (GL_FILL, GL_FILL)) == (GL_FILL, GL_FILL)
+    primitive = list_primitive(m.gltype, 0, fill=fill)
+    if primitive is None:
+        return None
+
+    attrs = list()
+    for key in sorted(m.attribute):
+        item = m.attribute[key]
+        if 'divisor' in item or item['data'].dtype != np.float32 or item['data'].size != m.vshape[0]*item['un']:
+            return None
+        attrs.append((key, item['tag'], item['un']))
+
+    uniforms = list()
+    for key in sorted(m.uniform):
+        item = m.uniform[key]
+        if 'f' in item or item['tag'] in ('texture', 'tsize', 'ae', 'timestamp'):
+            return None
+        v = item.get('v')
+        uniforms.append((key, item['tag'], (v.dtype.str, v.shape, v.tobytes()) if isinstance(v, np.ndarray) else repr(v)))
+
+    return (tuple(m.shaders), primitive[0], tuple(attrs), tuple(uniforms), str(state), m.camera_block)
+
+def merge_models(models):
+    """合并可合批的模型，返回合并后的模型和各模型在索引缓冲区中的起始位置和数量组成的列表
+
+    models      - 合批键相同的模型列表
+    """
+
+    m0 = models[0]
+    fill = m0.state.get('polygon', (GL_FILL, GL_FILL)) == (GL_FILL, GL_FILL)
+
+    indices, spans = list(), list()
+    base, first = 0, 0
+    for m in models:
+        gltype, seq = list_primitive(m.gltype, m.vshape[0], None if m.indices is None else m.indices['data'], fill=fill)
+        indices.append(seq + base)
+        spans.append((first, seq.shape[0]))
+        base += m.vshape[0]
+        first += seq.shape[0]
+
+    b = Model(gltype, m0.shaders[0][0], m0.shaders[1][0])
+    b.shaders = list(m0.shaders)
+    b.camera_block = m0.camera_block
+    b.state = dict(m0.state)
+    b.vshape = (base, m0.vshape[1])
+    b.indices = {'data':np.concatenate(indices).astype(np.int32), 'n':first}
+
+    for key, item in m0.attribute.items():
+        data = np.vstack([m.attribute[key]['data'].reshape(m.vshape[0], -1) for m in models])
+        b.attribute.update({key: {'tag':item['tag'], 'data':data, 'un':item['un'], 'usize':item['usize']}})
+
+    for key, item in m0.uniform.items():
+        b.uniform.update({key: {k: v for k, v in item.items() if k != 'loc'}})
+
+    return b, spans
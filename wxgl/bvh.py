@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from OpenGL.GL import *
+
+def triangulate(gltype, n, indices=None):
+    """返回由顶点索引组成的三角形数组，shape为(m,3)；非面片图元返回None
+
+    gltype      - GL基本图元
+    n           - 顶点数量
+    indices     - 顶点索引数据
+    """
+
+    seq = np.arange(n, dtype=np.int64) if indices is None else np.array(indices, dtype=np.int64).ravel()
+    k = seq.shape[0]
+
+    if gltype == GL_TRIANGLES:
+        tris = seq[:k-k%3].reshape(-1, 3)
+    elif gltype == GL_TRIANGLE_STRIP:
+        i = np.arange(k-2)
+        a, b, c = seq[i], seq[i+1], seq[i+2]
+        odd = i%2 == 1
+        a[odd], b[odd] = b[odd], a[odd].copy()
+        tris = np.stack((a, b, c), axis=1)
+    elif gltype == GL_TRIANGLE_FAN:
+        i = np.arange(1, k-1)
+        tris = np.stack((np.repeat(seq[0], k-2), seq[i], seq[i+1]), axis=1) if k > 2 else np.zeros((0,3), dtype=np.int64)
+    elif gltype == GL_QUADS:
+        q = seq[:k-k%4].reshape(-1, 4)
+        tris = np.vstack((q[:,[0,1,2]], q[:,[0,2,3]]))
+    elif gltype == GL_QUAD_STRIP:
+        i = np.arange(0, k-3, 2)
+        a, b, c, d = seq[i], seq[i+1], seq[i+3], seq[i+2]
+        tris = np.vstack((np.stack((a, b, c), axis=1), np.stack((a, c, d), axis=1)))
+    else:
+        return None
+
+    return tris
+
+class BVH:
+    """三角面的包围体层次结构（BVH），用于射线求交"""
+
+    _LEAF_SIZE = 16
+
+    def __init__(self, vs, tris):
+        """构造函数
+
+        vs          - 顶点坐标，shape为(n,3)
+        tris        - 由顶点索引组成的三角形数组，shape为(m,3)
+        """
+
+        vs = np.array(vs, dtype=np.float64)
+        if vs.shape[-1] == 2:
+            vs = np.hstack((vs, np.zeros((vs.shape[0], 1))))
+
+        tris = np.array(tris, dtype=np.int64).reshape(-1, 3)
+        tris = tris[np.all(tris < vs.shape[0], axis=1)]
+
+        v0, v1, v2 = vs[tris[:,0]], vs[tris[:,1]], vs[tris[:,2]]
+        lo = np.minimum(np.minimum(v0, v1), v2)
+        hi = np.maximum(np.maximum(v0, v1), v2)
+
+        code = self._morton((lo + hi)/2)
+        order = np.argsort(code, kind='stable')         # 按三角形中心的莫顿码排序，相邻三角形空间上也相邻
+        code = code[order]
+
+        levels = list()                                 # 逐层（广度优先）的节点：起始位置、三角形数量、是否为叶节点、左子节点
+        starts, counts = np.array([0]), np.array([tris.shape[0]])
+        base = 0
+        while tris.shape[0] and starts.shape[0]:
+            split = counts > self._LEAF_SIZE
+            half = self._split(code, starts, counts)
+            left = base + starts.shape[0] + 2*np.cumsum(split) - 2
+            levels.append((starts, counts, ~split, np.where(split, left, -1)))
+
+            base += starts.shape[0]
+            starts = np.vstack((starts[split], starts[split]+half[split])).T.ravel()
+            counts = np.vstack((half[split], counts[split]-half[split])).T.ravel()
+
+        self.tris = tris[order]                         # 按叶节点顺序排列的三角形
+        self.v0 = v0[order]                             # 三角形第1个顶点
+        self.e1 = v1[order] - self.v0                   # 三角形第1条边
+        self.e2 = v2[order] - self.v0                   # 三角形第2条边
+
+        self.lo, self.hi, self.span, self.children = list(), list(), list(), list()
+        if not levels:
+            return
+
+        start, count, leaf, left = [np.concatenate(item) for item in zip(*levels)]
+
+        # 叶节点恰好按顺序划分全部三角形，一次归约即可得到全部叶节点的包围盒，再由下向上逐层合并
+        node_lo, node_hi = np.empty((start.shape[0], 3)), np.empty((start.shape[0], 3))
+        leaves = np.where(leaf)[0]
+        leaves = leaves[np.argsort(start[leaves])]
+        node_lo[leaves] = np.minimum.reduceat(lo[order], start[leaves], axis=0)
+        node_hi[leaves] = np.maximum.reduceat(hi[order], start[leaves], axis=0)
+
+        base = start.shape[0]
+        for item in levels[::-1]:
+            nids = np.arange(base-item[0].shape[0], base)
+            base -= item[0].shape[0]
+            inner = nids[~item[2]]
+            if inner.shape[0]:
+                node_lo[inner] = np.minimum(node_lo[left[inner]], node_lo[left[inner]+1])
+                node_hi[inner] = np.maximum(node_hi[left[inner]], node_hi[left[inner]+1])
+
+        self.lo = node_lo.tolist()                      # 节点包围盒下界
+        self.hi = node_hi.tolist()                      # 节点包围盒上界
+        self.span = list(zip(start.tolist(), np.where(leaf, count, 0).tolist())) # 叶节点三角形的起始位置和数量，非叶节点数量为0
+        self.children = left.tolist()                   # 左子节点，右子节点紧随其后
+
+    def _split(self, code, starts, counts):
+        """返回各节点左子节点的三角形数量：在莫顿码最高的不同位处分割，莫顿码全部相同时对半分割"""
+
+        ends = starts + counts - 1
+        c0, c1 = code[starts], code[np.maximum(ends, starts)]
+        diff = c0 ^ c1
+        bit = np.zeros(diff.shape, dtype=np.uint64)
+        for k in range(30):
+            bit[(diff >> np.uint64(k)) > 0] = k
+
+        target = ((c0 >> bit) | np.uint64(1)) << bit
+        pos = np.searchsorted(code, target) - starts
+
+        return np.where(diff > 0, pos, counts//2)
+
+    def _morton(self, points):
+        """返回点的30位莫顿码"""
+
+        r0, r1 = points.min(axis=0), points.max(axis=0)
+        q = np.uint64((points - r0) / np.where(r1 > r0, r1 - r0, 1) * 1023)
+
+        code = np.zeros(points.shape[0], dtype=np.uint64)
+        for bit in range(10):
+            for k in range(3):
+                code |= ((q[:,k] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(3*bit + 2 - k)
+
+        return code
+
+    def _slab(self, nid, origin, inv):
+        """射线与节点包围盒求交，返回射线进入包围盒的参数t，不相交返回None"""
+
+        tmin, tmax = 0.0, np.inf
+        for k in range(3):
+            t1 = (self.lo[nid][k] - origin[k]) * inv[k]
+            t2 = (self.hi[nid][k] - origin[k]) * inv[k]
+            if t1 > t2:
+                t1, t2 = t2, t1
+            if t1 > tmin:
+                tmin = t1
+            if t2 < tmax:
+                tmax = t2
+            if tmin > tmax:
+                return None
+
+        return tmin
+
+    def intersect(self, origin, direction, cull=None):
+        """返回射线与三角面最近的交点参数t和三角形顶点索引组成的元组，未相交返回None
+
+        origin      - 射线起点
+        direction   - 射线方向
+        cull        - 剔除的面：'front'（正面，即逆时针面向射线起点）、'back'（背面）或None（不剔除）
+        """
+
+        if not self.span:
+            return None
+
+        origin = np.array(origin, dtype=np.float64)
+        direction = np.array(direction, dtype=np.float64)
+        with np.errstate(divide='ignore'):
+            inv = tuple(np.where(direction == 0, 1e300, 1/direction)) # 避免0*inf产生nan
+        o = tuple(origin)
+
+        best_t, best_i = np.inf, -1
+        t = self._slab(0, o, inv)
+        stack = [] if t is None else [(t, 0)]
+
+        while stack:
+            t, nid = stack.pop()
+            if t > best_t:
+                continue
+
+            start, count = self.span[nid]
+            if count:
+                v0, e1, e2 = self.v0[start:start+count], self.e1[start:start+count], self.e2[start:start+count]
+                p = np.cross(direction, e2)
+                det = np.einsum('ij,ij->i', e1, p)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    inv_det = 1/det
+                    s = origin - v0
+                    u = np.einsum('ij,ij->i', s, p) * inv_det
+                    q = np.cross(s, e1)
+                    v = np.einsum('j,ij->i', direction, q) * inv_det
+                    d = np.einsum('ij,ij->i', e2, q) * inv_det
+                    if cull == 'front':
+                        facing = det < -1e-12
+                    elif cull == 'back':
+                        facing = det > 1e-12
+                    else:
+                        facing = np.abs(det) > 1e-12
+                    hit = facing & (u >= 0) & (v >= 0) & (u + v <= 1) & (d > 0) & (d < best_t)
+                if hit.any():
+                    k = np.argmin(np.where(hit, d, np.inf))
+                    best_t, best_i = d[k], start + k
+            else:
+                near = list()
+                for child in (self.children[nid], self.children[nid]+1):
+                    tc = self._slab(child, o, inv)
+                    if tc is not None and tc <= best_t:
+                        near.append((tc, child))
+                stack.extend(sorted(near, reverse=True))
+
+        if best_i < 0:
+            return None
+
+        return float(best_t), tuple(int(i) for i in self.tris[best_i])
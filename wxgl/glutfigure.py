@@ -1,14 +1,9 @@
 #!/usr/bin/env python3
 
 import sys, time
-import numpy as np
-import threading
-import imageio
 from OpenGL.GLUT import *
 from . scene import BaseScene
-
-if sys.platform.lower() != 'darwin':
-    import webp
+from . recorder import FrameRecorder
 
 class GlutFigure(BaseScene):
     """基于OpenGl.GLUT的画布类"""
@@ -37,13 +32,7 @@ class GlutFigure(BaseScene):
 
         super().__init__(scheme, **scheme.kwds)
         
-        if not self.outfile is None:
-            self.cn = 0
-            self.finished = False
-            
-            threading_record = threading.Thread(target=self.create_file)
-            threading_record.setDaemon(True)
-            threading_record.start()
+        self.recorder = None if self.outfile is None else FrameRecorder(self, **kwds)
 
     def _init_gl(self):
         """初始化GL"""
@@ -106,83 +95,35 @@ class GlutFigure(BaseScene):
         """重绘事件函数"""
 
         self._paint()
+
+        if self.recorder:
+            self.recorder.capture(buffer='back')
+
         glutSwapBuffers() # 交换缓冲区
 
-        if self.outfile:
-            mode = 'RGB' if self.ext in ('.jpg', '.jpeg') else 'RGBA'
-            crop = True if self.ext in ('.mp4', '.avi', '.wmv', '.mov') else False
-            self.im_pil = self._get_buffer(mode=mode, crop=crop)
+    def _request_redraw(self):
+        """请求重绘"""
+
+        glutPostRedisplay()
 
     def idle(self):
-        """idle事件函数"""
+        """idle事件函数：仅在生成文件时注册，逐帧录制，全部帧录制完成后销毁窗口"""
 
-        glutPostRedisplay()
-        if self.outfile and self.finished:
+        if self.recorder.next_frame():
+            glutPostRedisplay()
+        else:
+            glutIdleFunc(None)
+            self.recorder.finish()
+            self.recorder = None
             glutDestroyWindow(glutGetWindow())
 
-    def create_file(self):
-        """生成图像或动画文件的线程函数"""
- 
-        self.increment = False
-        self.duration = 0
-        ft = round(1000/self.fps)
-
-        while not self.gl_init_done:
-            time.sleep(0.01)
-
-        if self.ext in ('.png', '.jpg', '.jpeg'):
-            self.duration = 0
-            time.sleep(0.05)
-
-            self.im_pil = None
-            while self.im_pil is None:
-                time.sleep(0.01)
-
-            if isinstance(self.dpi, (int, float)):
-                self.im_pil.save(self.outfile, dpi=(self.dpi, self.dpi))
-            else:
-                self.im_pil.save(self.outfile)
-        elif self.ext == '.webp':
-            enc = webp.WebPAnimEncoder.new(*self.csize)
-            cfg = webp.WebPConfig.new(quality=100)
-            timestamp_ms = 0
-            while self.cn < self.frames:
-                self.duration = self.cn * ft 
-                time.sleep(0.05)
-
-                self.im_pil = None
-                while self.im_pil is None:
-                    time.sleep(0.01)
-
-                pic = webp.WebPPicture.from_pil(self.im_pil)
-                enc.encode_frame(pic, timestamp_ms, cfg)
-                timestamp_ms += ft
-                self.cn += 1
-
-            anim_data = enc.assemble(timestamp_ms)
-            with open(self.outfile, 'wb') as fp:
-                fp.write(anim_data.buffer())
-        else:
-            if self.ext == '.gif':
-                writer = imageio.get_writer(self.outfile, fps=self.fps, loop=self.loop)
-            else:
-                writer = imageio.get_writer(self.outfile, fps=self.fps)
- 
-            while self.cn < self.frames:
-                self.duration = self.cn * ft
-                time.sleep(0.05)
+    def tick(self, value):
+        """动画定时器函数：仅在场景需要重绘时刷新；静态场景不启动定时器，由鼠标事件和模型数据更新请求重绘"""
 
-                self.im_pil = None
-                while self.im_pil is None:
-                    time.sleep(0.01)
+        if self._frame_due():
+            glutPostRedisplay()
 
-                im = np.array(self.im_pil)
-                writer.append_data(im)
-                self.cn +=1
- 
-            writer.close()
-        
-        self.finished = True
+        glutTimerFunc(self._frame_interval(), self.tick, 0)
 
 def show_figure(scheme, **kwds):
     """显示或保存画布
@@ -203,7 +144,10 @@ def show_figure(scheme, **kwds):
     fig._assemble()
 
     glutDisplayFunc(fig.draw)
-    glutIdleFunc(fig.idle)
+    if fig.recorder:
+        glutIdleFunc(fig.idle)
+    elif scheme.alive:
+        glutTimerFunc(fig._frame_interval(), fig.tick, 0)
     glutReshapeFunc(fig.reshape)
     glutMouseFunc(fig.click)
     glutMotionFunc(fig.drag)
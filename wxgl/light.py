@@ -2,7 +2,7 @@
 
 import sys
 from OpenGL.GL import *
-from . model import Model
+from . model import Model, CAMERA_BLOCK
 
 class _Light:
     """光照模型基类"""
@@ -31,9 +31,11 @@ class _Light:
         self.platform = sys.platform.lower()            # 操作系统
         self.glsl_version = '#version 330 core \n\n'    # 适配的GLSL版本
         self.glsl_functions = ''                        # 低版本GLSL的扩展函数
+        self.camera_block = not self.fixed              # 使用场景共享的相机uniform块
 
         if self.platform == 'darwin':
             self.glsl_version = ''
+            self.camera_block = False
             self.glsl_functions = """
                 mat4 inverse(mat4 m) {
                     float Coef00 = m[2][2] * m[3][3] - m[3][2] * m[2][3];
@@ -148,6 +150,9 @@ class _Light:
 
         vshader = self.get_vshader(texture)
         fshader = self.get_fshader(texture)
+
+        if self.camera_block:
+            vshader = self._bind_camera_block(vshader)
  
         m = Model(gltype, vshader, fshader, visible=visible, opacity=opacity, inside=inside)
         m.set_vertex('a_Position', vs, indices)
@@ -186,7 +191,7 @@ class _Light:
             m.set_argument('u_Pellucid', self.pellucid)
         if not self.factor is None:
             m.set_argument('u_ScaleFactor', self.factor)
-        if not self.cpos is None:
+        if not self.cpos is None and not self.camera_block:
             m.set_cam_pos('u_CamPos')
         if not lw is None or not ls is None:
             m.set_line_style(width=lw, stipple=ls)
@@ -201,13 +206,25 @@ class _Light:
         m.set_fill_mode(fill)
         m.set_slide(slide)
 
-        if not self.fixed:
+        if self.camera_block:
+            m.set_camera_block('Camera')
+            m.set_model_matrix('u_ModelMatrix', transform)
+        elif not self.fixed:
             m.set_proj_matrix('u_ProjMatrix')
             m.set_view_matrix('u_ViewMatrix')
             m.set_model_matrix('u_ModelMatrix', transform)
 
         return m
 
+    def _bind_camera_block(self, src):
+        """将着色器中投影矩阵、视点矩阵和相机位置的uniform声明替换为相机uniform块"""
+
+        src = src.replace('uniform mat4 u_ProjMatrix;', CAMERA_BLOCK, 1)
+        src = src.replace('uniform mat4 u_ViewMatrix;', '', 1)
+        src = src.replace('uniform vec3 u_CamPos;', '', 1)
+
+        return src
+
     def get_vshader(self, texture):
         """返回顶点着色器源码"""
 
@@ -3,6 +3,17 @@
 import re
 import numpy as np
 from OpenGL.GL import *
+from . bvh import BVH, triangulate
+
+CAMERA_BLOCK = """
+                layout(std140) uniform Camera {
+                    mat4 u_ProjMatrix;
+                    mat4 u_ViewMatrix;
+                    vec3 u_CamPos;
+                    float u_Timestamp;
+                    vec2 u_Ae;
+                };
+""" # 场景共享的相机uniform块声明，每帧只更新一次
 
 class Model:
     """模型类"""
@@ -19,9 +30,10 @@ class Model:
             inside      - 模型显示在视锥体内，默认True
             sprite      - 开启点精灵，默认False
             alive       - 启动渲染计时器，默认False
+            interleaved - 顶点属性交错存储于同一个缓冲区，默认False
         """
  
-        keys = ['visible', 'opacity', 'inside', 'sprite', 'alive']
+        keys = ['visible', 'opacity', 'inside', 'sprite', 'alive', 'interleaved']
         for key in kwds:
             if key not in keys:
                 raise KeyError('不支持的关键字参数：%s'%key)
@@ -49,11 +61,19 @@ class Model:
         self.inside = kwds.get('inside', True)          # 模型顶点是否影响模型空间，默认True
         self.sprite = kwds.get('sprite', False)         # 开启点精灵，默认False
         self.alive = kwds.get('alive', False)           # 启动渲染计时器，默认False
+        self.interleaved = kwds.get('interleaved', False) # 顶点属性交错存储，默认False
         self.slide = None                               # 幻灯片函数
         self.depth = dict()                             # 深度轴均值
         self.picked = False                             # 模型被拾取
  
         self.program = None                             # 着色器程序
+        self.vao = None                                 # 顶点数组对象
+        self.vbo = None                                 # 交错存储顶点属性的缓冲区对象
+        self.camera_block = None                        # 相机uniform块名
+        self.commands = list()                          # 预编译的绘制命令列表
+        self.vcount = 0                                 # 每次绘制提交的顶点数量（细节层次模型按当前层次另行统计）
+        self.icount = 0                                 # 每次绘制提交的索引数量（细节层次模型按当前层次另行统计）
+        self.ucount = 0                                 # 每次绘制上传的uniform变量数量
         self.cshaders = list()                          # 编译后的着色器
         self.shaders = list()                           # 着色器源码
         self.other = dict()                             # 着色器中其他变量
@@ -65,7 +85,16 @@ class Model:
         self.r_x = None                                 # 顶点坐标x的动态范围
         self.r_y = None                                 # 顶点坐标y的动态范围
         self.r_z = None                                 # 顶点坐标z的动态范围
- 
+        self.bvh = None                                 # 三角面的包围体层次结构（BVH），用于CPU射线拾取
+        self.instances = 0                              # 实例数量，0表示非实例化模型
+        self.instance_box = None                        # 各实例在模型坐标系中的包围盒（下界数组和上界数组）
+        self.lods = list()                              # 细节层次：各层次在索引数据中的起始位置、数量和几何误差，由细到粗
+        self.lod = 0                                    # 当前绘制的细节层次
+        self.stream = None                              # 流式数据的环形缓冲区：容量、下一个写入位置和有效数据数量
+        self.pending = dict()                           # 等待上传到显存的数据：顶点属性名（索引为None）和改变的行范围列表，None表示重新分配缓冲区
+        self.listener = None                            # 数据更新时通知场景的回调函数，由场景装配模型时设置
+ 
+        self.state = dict()                             # 绘制状态（面剔除、多边形模式、线宽、线型、点精灵），由场景的状态跟踪器设置
         self.before = list()                            # 绘制前执行的GL命令
         self.after = list()                             # 绘制后执行的GL命令
  
@@ -73,10 +102,7 @@ class Model:
         self.add_shader(fshader, GL_FRAGMENT_SHADER)
  
         if self.sprite:
-            self.before.append((glPushAttrib, (GL_POINT_BIT,)))
-            self.before.append((glEnable, (GL_POINT_SPRITE,)))
-            self.before.append((glEnable, (GL_PROGRAM_POINT_SIZE,)))
-            self.after.append((glPopAttrib, ()))
+            self.state.update({'sprite': True})
  
     def add_shader(self, shader_src, shader_type):
         """添加着色器
@@ -112,15 +138,8 @@ class Model:
             data = data.reshape(-1, data.shape[-1])
  
         self.attribute.update({var_name: {'tag':'vertex', 'data':data, 'un':data.shape[-1], 'usize':data.itemsize}})
-        self.depth.update({'y': data[:, 2].mean() if data.shape[-1] == 3 else 0})
-        self.depth.update({'z': -data[:, 1].mean() if data.shape[-1] == 3 else 0})
-        self.vshape = data.shape
- 
-        if self.inside:
-            self.r_x = (data[:,0].min(), data[:,0].max())
-            self.r_y = (data[:,1].min(), data[:,1].max())
-            if self.vshape[1] == 3:
-                self.r_z = (data[:,2].min(), data[:,2].max())
+        self.bvh = None
+        self._vertex_bounds(data)
  
         if not indices is None:
             indices = np.array(indices, dtype=np.int32)
@@ -169,12 +188,276 @@ class Model:
         data = np.array(data, dtype=np.float32)
         self.attribute.update({var_name: {'tag':'psize', 'data':data, 'un':1, 'usize':data.itemsize}})
  
-        if not self.sprite:
-            self.sprite = True
-            self.before.append((glPushAttrib, (GL_POINT_BIT,)))
-            self.before.append((glEnable, (GL_POINT_SPRITE,)))
-            self.before.append((glEnable, (GL_PROGRAM_POINT_SIZE,)))
-            self.after.append((glPopAttrib, ()))
+        self.sprite = True
+        self.state.update({'sprite': True})             # 由GL状态跟踪器开启点精灵，绘制其他模型时恢复
+ 
+    def set_lods(self, models, errors):
+        """设置细节层次：将较粗层次模型的顶点和索引数据追加到本模型之后，绘制时按屏幕空间误差选择其中一个层次
+ 
+        models      - 由细到粗的较粗层次模型，图元类型和顶点属性与本模型相同
+        errors      - 本模型和各较粗层次模型的几何误差（模型坐标系中的长度），由小到大
+        """
+ 
+        levels = [self] + list(models)
+        indices, lods = list(), list()
+        base, first = 0, 0
+ 
+        for m, err in zip(levels, errors):
+            seq = np.arange(m.vshape[0]) if m.indices is None else m.indices['data'].ravel()
+            indices.append(seq + base)
+            lods.append((first, seq.size, err))
+            base += m.vshape[0]
+            first += seq.size
+ 
+        for key, item in self.attribute.items():
+            item['data'] = np.vstack([m.attribute[key]['data'].reshape(m.vshape[0], -1) for m in levels])
+ 
+        self.vshape = (base, self.vshape[1])
+        self.indices = {'data':np.concatenate(indices).astype(np.int32), 'n':first}
+        self.lods = lods
+        self.lod = 0
+        self.bvh = None
+ 
+    def set_instances(self, var_name, data, mmat_name='u_ModelMatrix'):
+        """设置实例化绘制的实例模型矩阵：顶点着色器中的模型矩阵替换为模型矩阵与实例模型矩阵之积
+ 
+        var_name    - 实例模型矩阵在着色器中的变量名
+        data        - 实例模型矩阵数据，shape=(n,4,4)
+        mmat_name   - 顶点着色器中模型矩阵的变量名
+        """
+ 
+        data = np.array(data, dtype=np.float32).reshape(-1, 4, 4)
+        decl = 'uniform mat4 %s;'%mmat_name
+ 
+        for k, (src, genre) in enumerate(self.shaders):
+            if genre == GL_VERTEX_SHADER and not self.instances:
+                if decl not in src:
+                    raise ValueError('顶点着色器中未声明模型矩阵“%s”'%mmat_name)
+ 
+                head, body = src.split(decl, 1)
+                body = re.sub(r'\b%s\b'%mmat_name, '(%s * %s)'%(mmat_name, var_name), body)
+                self.shaders[k] = (head + decl + '\n                attribute mat4 %s;'%var_name + body, genre)
+ 
+        self.attribute.update({var_name: {'tag':'instance', 'data':data.reshape(-1, 16), 'un':16, 'usize':data.itemsize, 'divisor':1}})
+        self.instances = data.shape[0]
+        self._instance_bounds()
+ 
+    def set_instance_color(self, var_name, data):
+        """设置实例颜色：每个实例使用一种颜色，替代顶点颜色
+ 
+        var_name    - 颜色在着色器中的变量名
+        data        - 实例颜色数据，shape=(n,3|4)
+        """
+ 
+        data = np.array(data, dtype=np.float32).reshape(-1, np.shape(data)[-1])
+        self.attribute.update({var_name: {'tag':'color', 'data':data, 'un':data.shape[-1], 'usize':data.itemsize, 'divisor':1}})
+ 
+    def set_stream(self, capacity, n=None):
+        """设置流式数据：全部顶点属性转为固定容量的环形缓冲区，调用append方法追加数据，超出容量时覆盖最早的数据
+ 
+        capacity    - 环形缓冲区容量（顶点数量）
+        n           - 已有顶点中有效数据的数量，默认全部有效；无效的顶点仅作为append未提供的顶点属性的默认值
+        """
+ 
+        if self.indices or self.instances or self.lods:
+            raise ValueError('流式数据模型不支持顶点索引、实例化和细节层次')
+ 
+        if self.gltype not in (GL_POINTS, GL_LINE_STRIP):
+            raise ValueError('流式数据模型只支持GL_POINTS和GL_LINE_STRIP图元')
+ 
+        n = min(self.vshape[0] if n is None else n, capacity)
+        for item in self.attribute.values():
+            old = item['data'].reshape(-1, item['un'])
+            data = np.zeros((capacity+1, item['un']), dtype=old.dtype) # 最后一行是首行的镜像，写满后的线条分两段绘制时保持连续
+            data[:max(n, 1)] = old[-max(n, 1):]
+            data[capacity] = data[0]
+            item['data'] = data
+ 
+        self.vshape = (capacity+1, self.vshape[1])
+        self.stream = (capacity, n % capacity, n)
+        self.bvh = None
+ 
+    def append(self, data):
+        """向流式数据的环形缓冲区追加数据，超出容量时覆盖最早的数据，模型已装配到场景中时只上传追加的部分
+ 
+        data        - 顶点属性名和数据组成的字典，各顶点属性的数据长度相同；未提供的顶点属性沿用最近一个顶点的数据
+        """
+ 
+        if self.stream is None:
+            raise ValueError('模型不是流式数据模型')
+ 
+        capacity, head, count = self.stream
+        last = (head - 1) % capacity if count else 0
+ 
+        arrays = dict()
+        for key, item in self.attribute.items():
+            if key in data:
+                arrays[key] = np.array(data[key], dtype=item['data'].dtype).reshape(-1, item['un'])
+ 
+        if not arrays:
+            return
+ 
+        n = max([arr.shape[0] for arr in arrays.values()])
+        for key, item in self.attribute.items():
+            if key not in arrays:
+                arrays[key] = np.repeat(item['data'][last:last+1], n, axis=0)
+            elif arrays[key].shape[0] != n:
+                raise ValueError('顶点属性数据长度不一致：%s'%key)
+ 
+        if n > capacity:
+            arrays = {key: arr[-capacity:] for key, arr in arrays.items()}
+            head, n = (head + n - capacity) % capacity, capacity
+ 
+        k = min(n, capacity - head)                     # 写入环形缓冲区尾部的数量，其余从头部开始写入
+        for key, arr in arrays.items():
+            item = self.attribute[key]
+            item['data'][head:head+k] = arr[:k]
+            item['data'][:n-k] = arr[k:]
+            if head == 0 or n > k:
+                item['data'][capacity] = item['data'][0]
+ 
+            self._notify(key, head, k, False)
+            if n > k:
+                self._notify(key, 0, n-k, False)
+            if head == 0 or n > k:
+                self._notify(key, capacity, 1, False)
+ 
+        self.stream = (capacity, (head + n) % capacity, min(count + n, capacity))
+ 
+    def update_attribute(self, var_name, data, offset=0):
+        """更新顶点属性数据：模型已装配到场景中时，场景在下一次绘制前以glBufferSubData上传改变的部分，数据长度改变时重新分配缓冲区
+ 
+        var_name    - 顶点属性在着色器中的变量名
+        data        - 顶点属性数据，shape=(n,un)，逐实例的属性为各实例的数据
+        offset      - 起始顶点（逐实例的属性为起始实例）序号，None表示替换全部数据（长度可以改变）
+        """
+ 
+        if var_name not in self.attribute:
+            raise KeyError('模型没有顶点属性：%s'%var_name)
+ 
+        if self.lods:
+            raise ValueError('细节层次模型不支持更新顶点属性')
+ 
+        if self.stream:
+            raise ValueError('流式数据模型请使用append方法追加数据')
+ 
+        item = self.attribute[var_name]
+        old = item['data'].reshape(-1, item['un'])
+        data = np.array(data, dtype=old.dtype).reshape(-1, item['un'])
+        item['data'] = self._splice(old, data, offset)
+ 
+        if item['tag'] == 'vertex':
+            self.bvh = None
+            self._vertex_bounds(item['data'])
+        elif item['tag'] == 'instance':
+            if item['data'].shape[0] == 0:
+                item['data'] = old
+                raise ValueError('实例数量不能为0')
+            self.instances = item['data'].shape[0]
+ 
+        if self.instances and item['tag'] in ('vertex', 'instance'):
+            self._instance_bounds()
+ 
+        self._notify(var_name, offset, data.shape[0], item['data'].shape[0] != old.shape[0])
+ 
+    def update_indices(self, data, offset=0):
+        """更新顶点索引数据：模型已装配到场景中时，场景在下一次绘制前以glBufferSubData上传改变的部分，数据长度改变时重新分配缓冲区
+ 
+        data        - 顶点索引数据
+        offset      - 起始位置，None表示替换全部数据（长度可以改变）
+        """
+ 
+        if self.indices is None:
+            raise ValueError('模型没有顶点索引')
+ 
+        if self.lods:
+            raise ValueError('细节层次模型不支持更新顶点索引')
+ 
+        old = self.indices['data'].ravel()
+        data = np.array(data, dtype=np.int32).ravel()
+        self.indices['data'] = self._splice(old, data, offset)
+        self.indices['n'] = self.indices['data'].size
+        self.bvh = None
+ 
+        self._notify(None, offset, data.shape[0], self.indices['n'] != old.shape[0])
+ 
+    def _splice(self, old, data, offset):
+        """将数据写入原数据从offset开始的位置，超出原数据长度时扩展，返回写入后的数据"""
+ 
+        if offset is None:
+            return data
+ 
+        if offset < 0 or offset > old.shape[0]:
+            raise ValueError('起始位置超出数据范围：%d'%offset)
+ 
+        if offset + data.shape[0] > old.shape[0]:
+            old = np.concatenate((old[:offset], data))
+        else:
+            old[offset:offset+data.shape[0]] = data
+ 
+        return old
+ 
+    def _notify(self, key, offset, n, resized):
+        """记录等待上传到显存的数据范围并通知场景，模型未装配到场景中时什么也不做"""
+ 
+        if self.listener is None:
+            return
+ 
+        if resized or offset is None:
+            self.pending[key] = None
+        elif key not in self.pending:
+            self.pending[key] = [(offset, offset+n)]
+        elif self.pending[key] is not None:
+            ranges = list()
+            for lo, hi in sorted(self.pending[key] + [(offset, offset+n)]): # 合并重叠或相邻的行范围
+                if ranges and lo <= ranges[-1][1]:
+                    ranges[-1] = (ranges[-1][0], max(hi, ranges[-1][1]))
+                else:
+                    ranges.append((lo, hi))
+            self.pending[key] = ranges
+ 
+        self.listener(self)
+ 
+    def _vertex_bounds(self, data):
+        """由顶点数据计算模型的深度和坐标范围"""
+ 
+        self.depth.update({'y': data[:, 2].mean() if data.shape[-1] == 3 else 0})
+        self.depth.update({'z': -data[:, 1].mean() if data.shape[-1] == 3 else 0})
+        self.vshape = data.shape
+ 
+        if self.inside:
+            self.r_x = (data[:,0].min(), data[:,0].max())
+            self.r_y = (data[:,1].min(), data[:,1].max())
+            if self.vshape[1] == 3:
+                self.r_z = (data[:,2].min(), data[:,2].max())
+ 
+    def _instance_bounds(self):
+        """由顶点数据和实例模型矩阵计算各实例的包围盒以及模型的深度和坐标范围"""
+ 
+        vs = [item['data'] for item in self.attribute.values() if item['tag'] == 'vertex']
+        if not vs:
+            return
+ 
+        data = [item['data'] for item in self.attribute.values() if item['tag'] == 'instance'][0].reshape(-1, 4, 4)
+ 
+        lo, hi = np.zeros(3), np.zeros(3)
+        lo[:vs[0].shape[-1]], hi[:vs[0].shape[-1]] = vs[0].min(axis=0), vs[0].max(axis=0)
+        corners = np.array([[x, y, z, 1] for x in (lo[0], hi[0]) for y in (lo[1], hi[1]) for z in (lo[2], hi[2])])
+        corners = np.einsum('ck,nkj->ncj', corners, data.astype(np.float64))
+        corners = corners[...,:3] / corners[...,3:]
+        self.instance_box = corners.min(axis=1), corners.max(axis=1)
+ 
+        center = np.einsum('k,nkj->nj', [*((lo+hi)/2), 1], data.astype(np.float64))
+        center = (center[:,:3] / center[:,3:]).mean(axis=0)
+        self.depth.update({'y': center[2], 'z': -center[1]})
+ 
+        if self.inside:
+            lo, hi = self.instance_box[0].min(axis=0), self.instance_box[1].max(axis=0)
+            self.r_x = (lo[0], hi[0])
+            self.r_y = (lo[1], hi[1])
+            if self.vshape[1] == 3:
+                self.r_z = (lo[2], hi[2])
+ 
  
     def add_texture(self, var_name, texture):
         """添加纹理
@@ -217,6 +500,14 @@ class Model:
  
         self.uniform.update({var_name: {'tag':'picked'}})
  
+    def set_camera_block(self, block_name='Camera'):
+        """使用场景共享的相机uniform块，着色器中以CAMERA_BLOCK声明投影矩阵、视点矩阵、相机位置、渲染时间戳和相机方位角高度角
+ 
+        block_name  - 相机uniform块在着色器中的块名
+        """
+ 
+        self.camera_block = block_name
+ 
     def set_view_matrix(self, var_name, vmatrix=None):
         """设置视点矩阵
  
@@ -287,14 +578,10 @@ class Model:
         stipple     - 线型，重复因子（整数）和模式（16位二进制）组成的元组
         """
  
-        if not width is None or not stipple is None:
-            self.before.append((glPushAttrib, (GL_LINE_BIT,)))
-            if not width is None:
-                self.before.append((glLineWidth,(width,)))
-            if not stipple is None:
-                self.before.append((glEnable, (GL_LINE_STIPPLE,)))
-                self.before.append((glLineStipple, stipple))
-            self.after.append((glPopAttrib, ()))
+        if not width is None:
+            self.state.update({'line_width': width})
+        if not stipple is None:
+            self.state.update({'stipple': tuple(stipple)})
  
     def set_cull_mode(self, mode):
         """设置面剔除方式
@@ -309,10 +596,7 @@ class Model:
             mode = mode.upper()
  
         if mode in ('FRONT', 'BACK'):
-            self.before.append((glPushAttrib, (GL_ALL_ATTRIB_BITS,)))
-            self.before.append((glEnable, (GL_CULL_FACE,)))
-            self.before.append((glCullFace, (GL_FRONT if mode=='FRONT' else GL_BACK,)))
-            self.after.append((glPopAttrib, ()))
+            self.state.update({'cull': GL_FRONT if mode=='FRONT' else GL_BACK})
         else:
             raise ValueError('不支持的面剔除参数：%s'%mode)
  
@@ -329,18 +613,14 @@ class Model:
             mode = mode.upper()
  
         if mode in ('FCBC', 'FLBC', 'FCBL', 'FLBL', True, False):
-            self.before.append((glPushAttrib, (GL_ALL_ATTRIB_BITS,)))
             if mode == 'FCBC' or mode == True:
-                self.before.append((glPolygonMode,(GL_FRONT_AND_BACK, GL_FILL)))
+                self.state.update({'polygon': (GL_FILL, GL_FILL)})
             elif mode == 'FLBL' or mode == False:
-                self.before.append((glPolygonMode,(GL_FRONT_AND_BACK, GL_LINE)))
+                self.state.update({'polygon': (GL_LINE, GL_LINE)})
             elif mode == 'FCBL':
-                self.before.append((glPolygonMode,(GL_FRONT, GL_FILL)))
-                self.before.append((glPolygonMode,(GL_BACK, GL_LINE)))
+                self.state.update({'polygon': (GL_FILL, GL_LINE)})
             else:
-                self.before.append((glPolygonMode,(GL_FRONT, GL_LINE)))
-                self.before.append((glPolygonMode,(GL_BACK, GL_FILL)))
-            self.after.append((glPopAttrib, ()))
+                self.state.update({'polygon': (GL_LINE, GL_FILL)})
         else:
             raise ValueError('不支持的填充模式：%s'%mode)
  
@@ -351,6 +631,48 @@ class Model:
         if hasattr(slide, '__call__'):
             self.alive = True
  
+    def get_bvh(self):
+        """返回模型三角面的包围体层次结构（BVH），首次调用时构建并缓存，顶点改变后重新构建；非面片模型返回None"""
+ 
+        if self.bvh is None:
+            vs = [item['data'] for item in self.attribute.values() if item['tag'] == 'vertex']
+            indices = None if self.indices is None else self.indices['data']
+            if self.lods:
+                indices = indices[:self.lods[0][1]]     # 只使用最精细的层次
+            tris = triangulate(self.gltype, self.vshape[0], indices) if vs else None
+ 
+            if tris is None:
+                return None
+ 
+            self.bvh = BVH(vs[0], tris)
+ 
+        return self.bvh
+ 
+    def interleave(self):
+        """将全部顶点属性打包为一个连续的交错数组，返回该数组；不满足交错存储条件时返回None
+ 
+        每个顶点属性的stride和offset记录在self.attribute中，供glVertexAttribPointer使用
+        """
+ 
+        items = list(self.attribute.values())
+        if not items or self.vshape is None:
+            return None
+ 
+        for item in items:
+            if 'divisor' in item or item['data'].dtype != np.float32 or item['data'].size != self.vshape[0]*item['un']:
+                return None
+ 
+        stride = sum([item['un'] for item in items])
+        data = np.empty((self.vshape[0], stride), dtype=np.float32)
+ 
+        offset = 0
+        for item in items:
+            data[:, offset:offset+item['un']] = item['data'].reshape(self.vshape[0], -1)
+            item.update({'stride': stride*item['usize'], 'offset': offset*item['usize']})
+            offset += item['un']
+ 
+        return data
+ 
     def verify(self):
         """验证并返回正确的模型对象"""
 
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+import os, ctypes
+import itertools
+import multiprocessing as mp
+import numpy as np
+from collections import deque
+from PIL import Image
+from OpenGL import platform
+from OpenGL.GL import *
+from . scene import BaseScene
+from . recorder import FrameEncoder
+
+class OffscreenScene(BaseScene):
+    """离屏场景类：在EGL或OSMesa上下文中绘制到帧缓冲区对象，不依赖wx、Qt或GLUT"""
+
+    def __init__(self, scheme, **kwds):
+        """构造函数
+
+        scheme      - 展示方案
+        kwds        - 关键字参数，同App类的关键字参数
+        """
+
+        super().__init__(scheme, **kwds)
+
+        self.context = None                             # 离屏GL上下文：上下文类型（egl或osmesa）和相关对象组成的元组
+        self.fbo = None                                 # 帧缓冲区对象
+        self.rbos = None                                # 颜色和深度模板渲染缓冲区对象
+
+    def _create_context(self):
+        """创建离屏GL上下文并设为当前上下文：PyOpenGL使用OSMesa平台时创建OSMesa上下文，否则创建EGL上下文"""
+
+        if type(platform.PLATFORM).__name__ == 'OSMesaPlatform':
+            from OpenGL import osmesa, arrays
+
+            ctx = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 8, 0, None)
+            buf = arrays.GLubyteArray.zeros((self.csize[1], self.csize[0], 4))
+            if not ctx or not osmesa.OSMesaMakeCurrent(ctx, buf, GL_UNSIGNED_BYTE, *self.csize):
+                raise RuntimeError('创建OSMesa上下文失败')
+
+            self.context = ('osmesa', ctx, buf)
+            return
+
+        from OpenGL import EGL
+
+        if not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY'):
+            os.environ.setdefault('EGL_PLATFORM', 'surfaceless') # 没有显示设备时使用Mesa的surfaceless平台
+
+        try:
+            dpy = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+            major, minor = EGL.EGLint(), EGL.EGLint()
+            EGL.eglInitialize(dpy, ctypes.pointer(major), ctypes.pointer(minor))
+
+            attrs = [
+                EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+                EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8, EGL.EGL_ALPHA_SIZE, 8,
+                EGL.EGL_DEPTH_SIZE, 24, EGL.EGL_STENCIL_SIZE, 8,
+                EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                EGL.EGL_NONE
+            ]
+            cfg, n = EGL.EGLConfig(), EGL.EGLint()
+            EGL.eglChooseConfig(dpy, (EGL.EGLint*len(attrs))(*attrs), ctypes.pointer(cfg), 1, ctypes.pointer(n))
+            if n.value == 0:
+                raise RuntimeError('没有可用的EGL配置')
+
+            surface = EGL.eglCreatePbufferSurface(dpy, cfg, (EGL.EGLint*5)(EGL.EGL_WIDTH, 1, EGL.EGL_HEIGHT, 1, EGL.EGL_NONE))
+            EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+            ctx = EGL.eglCreateContext(dpy, cfg, EGL.EGL_NO_CONTEXT, None)
+            EGL.eglMakeCurrent(dpy, surface, surface, ctx)
+        except Exception as e:
+            raise RuntimeError('创建EGL上下文失败（也可以在导入wxgl之前设置环境变量PYOPENGL_PLATFORM=osmesa使用OSMesa）：%s'%e)
+
+        self.context = ('egl', dpy, surface, ctx)
+
+    def _create_fbo(self):
+        """创建与画布等大的帧缓冲区对象（颜色和深度模板附件），绑定为绘制和读取的目标"""
+
+        self.rbos = [int(rbo) for rbo in glGenRenderbuffers(2)]
+        for rbo, fmt in zip(self.rbos, (GL_RGBA8, GL_DEPTH24_STENCIL8)):
+            glBindRenderbuffer(GL_RENDERBUFFER, rbo)
+            glRenderbufferStorage(GL_RENDERBUFFER, fmt, *self.csize)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+
+        self.fbo = int(glGenFramebuffers(1))
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self.rbos[0])
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_STENCIL_ATTACHMENT, GL_RENDERBUFFER, self.rbos[1])
+
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError('创建离屏帧缓冲区失败')
+
+        glDrawBuffer(GL_COLOR_ATTACHMENT0)
+        glReadBuffer(GL_COLOR_ATTACHMENT0)
+
+    def setup(self):
+        """创建离屏GL上下文和帧缓冲区，初始化GL并装配模型"""
+
+        self._create_context()
+        self._create_fbo()
+        self._resize()
+        self._initialize_gl()
+        self._assemble()
+
+    def render(self, duration=None, mode='RGBA', crop=False):
+        """绘制一帧，返回shape为(h,w,3|4)的numpy数组
+
+        duration    - 渲染时长（毫秒），None表示按实际经过的时间计时
+        mode        - 'RGB'或'RGBA'
+        crop        - 是否将宽高裁切为16的倍数
+        """
+
+        if not duration is None:
+            self.increment = False
+            self.duration = duration
+
+        self._paint()
+        glFinish()
+
+        return np.array(self._get_buffer(mode=mode, crop=crop))
+
+    def record(self, durations, mode='RGBA', crop=False):
+        """按渲染时长序列逐帧绘制，依次生成各帧图像的numpy数组；像素以异步方式读取，绘制当前帧时读取此前的帧
+
+        durations   - 各帧的渲染时长（毫秒）
+        mode        - 'RGB'或'RGBA'
+        crop        - 是否将宽高裁切为16的倍数
+        """
+
+        self.increment = False
+        for t in durations:
+            self.duration = t
+            self._paint()
+            glFlush()
+
+            for im, _ in self._capture_async(mode=mode, crop=crop):
+                yield np.array(im)
+
+        for im, _ in self._flush_capture():
+            yield np.array(im)
+
+    def profile_stats(self):
+        """返回滑动窗口内逐模型和逐部件的CPU和GPU平均耗时（毫秒），按耗时降序排列；未开启性能分析时返回None"""
+
+        return self._profile_stats()
+
+    def render_stats(self):
+        """返回最近一帧的绘制计数：剔除和绘制的模型数量、绘制调用次数、提交的顶点和索引数量、着色器程序切换和纹理绑定次数、uniform变量和缓冲区上传数量"""
+
+        return self._frame_counters()
+
+    def close(self):
+        """删除显存对象和帧缓冲区，销毁离屏GL上下文"""
+
+        if self.context is None:
+            return
+
+        self._clear_buffer()
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        glDeleteFramebuffers(1, [self.fbo])
+        glDeleteRenderbuffers(2, self.rbos)
+
+        if self.context[0] == 'osmesa':
+            from OpenGL import osmesa
+            osmesa.OSMesaDestroyContext(self.context[1])
+        else:
+            from OpenGL import EGL
+            dpy, surface, ctx = self.context[1:]
+            EGL.eglMakeCurrent(dpy, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroySurface(dpy, surface)
+            EGL.eglDestroyContext(dpy, ctx)
+
+        self.context = None
+        self.fbo = None
+        self.rbos = None
+
+_farm_scheme = None                                     # 渲染进程从主进程继承的展示方案
+_farm_fig = None                                        # 渲染进程的离屏场景
+
+def _farm_init(threads):
+    """渲染进程初始化函数
+
+    threads     - llvmpipe光栅化线程数，未设置LP_NUM_THREADS环境变量时生效
+    """
+
+    os.environ.setdefault('LP_NUM_THREADS', str(threads))
+
+def _farm_render(durations, mode, crop):
+    """渲染进程任务函数：绘制一段连续的帧，返回各帧图像的numpy数组的列表
+
+    首次执行时为继承的展示方案创建离屏上下文和场景：创建失败时异常随任务结果返回主进程，
+    不在初始化函数中抛出（否则进程池会不断重启渲染进程，主进程无限等待）
+    """
+
+    global _farm_fig
+
+    if _farm_fig is None:
+        fig = OffscreenScene(_farm_scheme, **_farm_scheme.kwds)
+        fig.setup()
+        _farm_fig = fig
+
+    return list(_farm_fig.record(durations, mode=mode, crop=crop))
+
+def render_frames(scheme, durations, mode='RGB', crop=False, workers=1, chunk=8):
+    """离线渲染动画：按渲染时长序列逐帧离屏绘制，依次生成各帧图像的numpy数组
+
+    workers大于1时，渲染时长序列按chunk帧一段分配给多个渲染进程，各进程以fork方式继承展示方案并创建各自的离屏上下文，
+    主进程按顺序取回各段的帧；不支持fork的平台上仍在当前进程中渲染
+    scheme      - 展示方案
+    durations   - 各帧的渲染时长（毫秒）
+    mode        - 'RGB'或'RGBA'
+    crop        - 是否将宽高裁切为16的倍数
+    workers     - 渲染进程数
+    chunk       - 每次分配给渲染进程的帧数
+    """
+
+    global _farm_scheme
+
+    if workers > 1 and 'fork' in mp.get_all_start_methods():
+        chunks = iter([durations[i:i+chunk] for i in range(0, len(durations), chunk)])
+        threads = max(1, (os.cpu_count() or 1)//workers)
+        pending = deque()
+
+        _farm_scheme = scheme
+        try:
+            with mp.get_context('fork').Pool(workers, initializer=_farm_init, initargs=(threads,)) as pool:
+                for item in itertools.islice(chunks, 2*workers): # 每个进程最多两段排队，限制主进程缓存的帧数
+                    pending.append(pool.apply_async(_farm_render, (item, mode, crop)))
+
+                while pending:
+                    frames = pending.popleft().get()
+                    item = next(chunks, None)
+                    if item:
+                        pending.append(pool.apply_async(_farm_render, (item, mode, crop)))
+
+                    yield from frames
+        finally:
+            _farm_scheme = None
+    else:
+        fig = OffscreenScene(scheme, **scheme.kwds)
+        fig.setup()
+
+        try:
+            yield from fig.record(durations, mode=mode, crop=crop)
+        finally:
+            fig.close()
+
+def show_offscreen(scheme, **kwds):
+    """离屏绘制画布并保存为文件，返回最后一帧图像的numpy数组
+
+    kwds        - 关键字参数
+        outfile     - 输出文件名，None表示不保存文件
+        ext         - 输出文件扩展名
+        dpi         - 图像文件每英寸像素数
+        fps         - 动画文件帧率
+        frames      - 动画文件总帧数
+        loop        - gif文件播放次数，0表示循环播放
+        quality     - webp文件质量，100表示最高品质
+        workers     - 动画文件的渲染进程数
+    """
+
+    outfile, ext = kwds.get('outfile'), kwds.get('ext')
+    fps, frames = kwds.get('fps', 25), kwds.get('frames', 100)
+
+    ft = round(1000/fps)
+    mode = 'RGB' if ext in ('.jpg', '.jpeg') else 'RGBA'
+    crop = ext in ('.mp4', '.avi', '.wmv', '.mov')
+    im = None
+
+    if outfile is None:
+        fig = OffscreenScene(scheme, **scheme.kwds)
+        fig.setup()
+        im = fig.render(0, mode=mode)
+        fig.close()
+    else:
+        encoder = FrameEncoder(outfile, ext, dpi=kwds.get('dpi'), fps=fps, loop=kwds.get('loop', 0), quality=kwds.get('quality', 100))
+        encoder.start()
+
+        if ext in ('.png', '.jpg', '.jpeg'):
+            durations, workers = [0], 1
+        else:
+            durations, workers = [cn*ft for cn in range(frames)], kwds.get('workers', 1)
+
+        for im in render_frames(scheme, durations, mode=mode, crop=crop, workers=workers):
+            encoder.put(Image.fromarray(im, mode=mode))
+
+        encoder.close()
+
+    return im
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+
+import re
+from OpenGL.GL import *
+from OpenGL.error import GLError
+
+COMPOSITE_VSHADER = """
+    #version 330 core
+
+    void main() {
+        vec2 p = vec2((gl_VertexID << 1) & 2, gl_VertexID & 2); // 覆盖视口的三角形
+        gl_Position = vec4(p * 2.0 - 1.0, 0.0, 1.0);
+    }
+"""
+
+COMPOSITE_FSHADER = """
+    #version 330 core
+
+    uniform sampler2D u_Accum;
+    uniform sampler2D u_Weight;
+    uniform ivec2 u_Offset;
+
+    void main() {
+        ivec2 p = ivec2(gl_FragCoord.xy) - u_Offset;
+        vec4 accum = texelFetch(u_Accum, p, 0);
+        float reveal = accum.a;
+        if (reveal >= 0.9999) {
+            discard;
+        }
+
+        float weight = texelFetch(u_Weight, p, 0).r;
+        if (isinf(max(max(abs(accum.r), abs(accum.g)), abs(accum.b)))) {
+            accum.rgb = vec3(weight);
+        }
+
+        gl_FragColor = vec4(accum.rgb / clamp(weight, 1e-4, 5e4), 1.0 - reveal);
+    }
+"""
+
+OIT_OUTPUT = """
+void main() {
+    wxgl_FragColor = vec4(0.0);
+    wxgl_main();
+
+    float a = wxgl_FragColor.a;
+    if (a <= 0.05) {
+        discard;
+    }
+
+    float w = clamp(pow(min(1.0, a*10.0) + 0.01, 3.0) * 1e8 * pow(1.0 - gl_FragCoord.z*0.9, 3.0), 1e-2, 3e3);
+    gl_FragData[0] = vec4(wxgl_FragColor.rgb * a * w, a); // 颜色加权累积，alpha通道累乘揭示度
+    gl_FragData[1] = vec4(a * w);                       // 权重累积
+}
+"""
+
+def oit_shaders(shader_list):
+    """返回加权混合OIT版本的着色器源码和类型组成的元组的列表，片元着色器无法改写时返回None
+
+    shader_list - 着色器源码和着色器类型组成的元组的列表
+    """
+
+    result = list()
+    for src, genre in shader_list:
+        if genre == GL_FRAGMENT_SHADER:
+            if 'gl_FragColor' not in src or not re.search(r'void\s+main\s*\(\s*\)', src):
+                return None
+
+            src = src.replace('gl_FragColor', 'wxgl_FragColor')
+            src = re.sub(r'void\s+main\s*\(\s*\)', 'void wxgl_main()', src, count=1)
+            head = re.match(r'\s*#version[^\n]*\n', src)
+            pos = head.end() if head else 0
+            src = src[:pos] + '\nvec4 wxgl_FragColor;\n' + src[pos:] + OIT_OUTPUT
+
+        result.append((src, genre))
+
+    return result
+
+class WeightedOIT:
+    """加权混合顺序无关透明（Weighted Blended OIT）：半透明模型不排序，一次绘制到累积缓冲区和权重缓冲区，再合成到当前帧缓冲区"""
+
+    def __init__(self, program_cache):
+        """构造函数
+
+        program_cache   - 着色器程序缓存
+        """
+
+        self.program_cache = program_cache              # 着色器程序缓存
+        self.fbo = None                                 # 离屏帧缓冲区对象
+        self.rbo = None                                 # 深度（模板）渲染缓冲区对象
+        self.textures = None                            # 累积纹理（alpha通道为揭示度）和权重纹理
+        self.size = None                                # 离屏帧缓冲区尺寸
+        self.program = None                             # 合成着色器程序
+        self.vao = None                                 # 合成用的空顶点数组对象
+        self.prev_fbo = 0                               # 绘制半透明模型前绑定的帧缓冲区
+        self.viewport = None                            # 绘制半透明模型的视口
+        self.blit_depth = True                          # 可以从当前帧缓冲区复制深度缓冲区
+
+    def _depth_format(self):
+        """返回与当前帧缓冲区深度缓冲区相同的内部格式"""
+
+        depth, stencil = int(glGetIntegerv(GL_DEPTH_BITS)), int(glGetIntegerv(GL_STENCIL_BITS))
+        if stencil > 0:
+            return GL_DEPTH24_STENCIL8
+        if depth == 16:
+            return GL_DEPTH_COMPONENT16
+        if depth == 32:
+            return GL_DEPTH_COMPONENT32
+
+        return GL_DEPTH_COMPONENT24
+
+    def create(self, width, height):
+        """创建或按尺寸重建离屏帧缓冲区，成功返回True"""
+
+        if self.size == (width, height):
+            return True
+
+        self.delete()
+        try:
+            prev = int(glGetIntegerv(GL_FRAMEBUFFER_BINDING))
+            fmt = self._depth_format()
+
+            self.textures = [int(tid) for tid in glGenTextures(2)]
+            for tid, internal, channels in zip(self.textures, (GL_RGBA16F, GL_R16F), (GL_RGBA, GL_RED)):
+                glBindTexture(GL_TEXTURE_2D, tid)
+                glTexImage2D(GL_TEXTURE_2D, 0, internal, width, height, 0, channels, GL_FLOAT, None)
+                glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+                glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+            glBindTexture(GL_TEXTURE_2D, 0)
+
+            self.rbo = glGenRenderbuffers(1)
+            glBindRenderbuffer(GL_RENDERBUFFER, self.rbo)
+            glRenderbufferStorage(GL_RENDERBUFFER, fmt, width, height)
+            glBindRenderbuffer(GL_RENDERBUFFER, 0)
+
+            self.fbo = glGenFramebuffers(1)
+            glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+            glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.textures[0], 0)
+            glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT1, GL_TEXTURE_2D, self.textures[1], 0)
+            attachment = GL_DEPTH_STENCIL_ATTACHMENT if fmt == GL_DEPTH24_STENCIL8 else GL_DEPTH_ATTACHMENT
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, attachment, GL_RENDERBUFFER, self.rbo)
+            glDrawBuffers(2, [GL_COLOR_ATTACHMENT0, GL_COLOR_ATTACHMENT1])
+            complete = glCheckFramebufferStatus(GL_FRAMEBUFFER) == GL_FRAMEBUFFER_COMPLETE
+            glBindFramebuffer(GL_FRAMEBUFFER, prev)
+
+            if complete and self.program is None:
+                self.program = self.program_cache.get_program([(COMPOSITE_VSHADER, GL_VERTEX_SHADER), (COMPOSITE_FSHADER, GL_FRAGMENT_SHADER)])
+                self.vao = glGenVertexArrays(1)
+        except Exception:
+            complete = False
+
+        if not complete:
+            self.delete()
+            return False
+
+        self.size = (width, height)
+        return True
+
+    def begin(self, viewport, opaque=None):
+        """开始绘制半透明模型：复制当前帧缓冲区视口内的深度，绑定并清除离屏帧缓冲区
+
+        viewport    - 当前视口
+        opaque      - 无法复制深度缓冲区时，重绘不透明模型深度的函数
+        """
+
+        vx, vy, vw, vh = viewport
+        self.viewport = viewport
+        self.prev_fbo = int(glGetIntegerv(GL_FRAMEBUFFER_BINDING))
+
+        if self.blit_depth:
+            try:
+                glBindFramebuffer(GL_READ_FRAMEBUFFER, self.prev_fbo)
+                glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self.fbo)
+                glBlitFramebuffer(vx, vy, vx+vw, vy+vh, 0, 0, vw, vh, GL_DEPTH_BUFFER_BIT, GL_NEAREST)
+            except GLError:
+                self.blit_depth = False
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glViewport(0, 0, vw, vh)
+
+        if not self.blit_depth:
+            glDepthMask(True)
+            glClear(GL_DEPTH_BUFFER_BIT)
+            if opaque:
+                glDrawBuffer(GL_NONE)
+                opaque()
+                glDrawBuffers(2, [GL_COLOR_ATTACHMENT0, GL_COLOR_ATTACHMENT1])
+
+        glClearBufferfv(GL_COLOR, 0, (0.0, 0.0, 0.0, 1.0))
+        glClearBufferfv(GL_COLOR, 1, (0.0, 0.0, 0.0, 0.0))
+
+        glDepthMask(False)
+        glDisable(GL_ALPHA_TEST)
+        glBlendFuncSeparate(GL_ONE, GL_ONE, GL_ZERO, GL_ONE_MINUS_SRC_ALPHA)
+
+    def end(self):
+        """结束绘制半透明模型，将累积结果合成到原帧缓冲区"""
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.prev_fbo)
+        glViewport(*self.viewport)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+
+        glDisable(GL_DEPTH_TEST)
+        glUseProgram(self.program)
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D, self.textures[0])
+        glUniform1i(glGetUniformLocation(self.program, 'u_Accum'), 0)
+        glActiveTexture(GL_TEXTURE1)
+        glBindTexture(GL_TEXTURE_2D, self.textures[1])
+        glUniform1i(glGetUniformLocation(self.program, 'u_Weight'), 1)
+        glUniform2i(glGetUniformLocation(self.program, 'u_Offset'), self.viewport[0], self.viewport[1])
+        glBindVertexArray(self.vao)
+        glDrawArrays(GL_TRIANGLES, 0, 3)
+        glBindVertexArray(0)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glUseProgram(0)
+
+        glEnable(GL_DEPTH_TEST)
+        glEnable(GL_ALPHA_TEST)
+
+    def delete(self):
+        """删除离屏帧缓冲区及其附件"""
+
+        if self.fbo:
+            glDeleteFramebuffers(1, [self.fbo])
+        if self.rbo:
+            glDeleteRenderbuffers(1, [self.rbo])
+        if self.textures:
+            glDeleteTextures(len(self.textures), self.textures)
+
+        self.fbo = None
+        self.rbo = None
+        self.textures = None
+        self.size = None
+
+    def clear(self):
+        """删除全部显存对象"""
+
+        self.delete()
+
+        if self.program:
+            self.program_cache.release(self.program)
+        if self.vao:
+            glDeleteVertexArrays(1, [self.vao])
+
+        self.program = None
+        self.vao = None
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+import time
+import ctypes
+import numpy as np
+from collections import deque
+from OpenGL.GL import *
+from OpenGL.raw.GL.VERSION.GL_3_3 import glGetQueryObjectui64v as raw_query_result
+from . import util
+
+class FrameProfiler:
+    """逐模型帧性能分析器：以GL_TIME_ELAPSED查询对象测量每个模型的GPU绘制时间（若干帧后异步读取），以perf_counter测量CPU提交时间，在滑动窗口内按模型汇总"""
+
+    def __init__(self, window=120, overlay=False):
+        """构造函数
+
+        window      - 滑动窗口内每个模型保留的最近采样数
+        overlay     - 是否在画布左上角显示耗时最多的模型
+        """
+
+        self.window = window                            # 滑动窗口长度
+        self.overlay = overlay                          # 显示叠加层
+        self.gpu_timer = None                           # GL上下文支持计时查询，None表示尚未检查
+        self.samples = dict()                           # 模型键（视区序号和模型id）到CPU和GPU耗时采样（毫秒）的映射
+        self.free = list()                              # 空闲的查询对象
+        self.pending = deque()                          # 已结束、尚未读取结果的查询对象和模型键
+        self.current = None                             # 正在测量的模型键、查询对象和CPU开始时刻
+        self.panel = None                               # 叠加层图像（行序自下而上）
+        self.panel_time = 0                             # 叠加层图像的生成时刻
+
+    def _check(self):
+        """检查是否支持计时查询；部分驱动的首个计时查询返回无效值，先执行一次空查询"""
+
+        try:
+            self.gpu_timer = int(glGetQueryiv(GL_TIME_ELAPSED, GL_QUERY_COUNTER_BITS)) > 0
+        except Exception:
+            self.gpu_timer = False
+
+        if self.gpu_timer:
+            query = self._query()
+            glBeginQuery(GL_TIME_ELAPSED, query)
+            glEndQuery(GL_TIME_ELAPSED)
+            self.pending.append((query, None))
+
+    def _query(self):
+        """返回一个空闲的查询对象"""
+
+        return self.free.pop() if self.free else int(glGenQueries(1)[0])
+
+    def collect(self):
+        """读取已经完成的查询结果：按发出的顺序读取，遇到尚未完成的查询即停止，不等待GPU"""
+
+        while self.pending:
+            query, key = self.pending[0]
+            if not glGetQueryObjectiv(query, GL_QUERY_RESULT_AVAILABLE):
+                break
+
+            self.pending.popleft()
+            self.free.append(query)
+
+            if key in self.samples:
+                ns = ctypes.c_uint64()
+                raw_query_result(query, GL_QUERY_RESULT, ctypes.byref(ns))
+                self.samples[key][1].append(ns.value/1e6)
+
+    def begin(self, key):
+        """开始测量模型的绘制
+
+        key         - 视区序号和模型id组成的元组
+        """
+
+        if self.gpu_timer is None:
+            self._check()
+
+        query = None
+        if self.gpu_timer:
+            query = self._query()
+            glBeginQuery(GL_TIME_ELAPSED, query)
+
+        self.current = (key, query, time.perf_counter())
+
+    def end(self, drawn=True):
+        """结束测量，drawn为False（模型不可见）时丢弃本次采样"""
+
+        key, query, t0 = self.current
+        cpu = (time.perf_counter() - t0)*1000
+        self.current = None
+
+        if query:
+            glEndQuery(GL_TIME_ELAPSED)
+
+        if drawn:
+            if key not in self.samples:
+                self.samples[key] = (deque(maxlen=self.window), deque(maxlen=self.window))
+            self.samples[key][0].append(cpu)
+
+        if query:
+            self.pending.append((query, key if drawn else None))
+
+    def stats(self, widgets=None):
+        """返回按模型和部件汇总的统计结果，按GPU耗时（不支持计时查询时按CPU耗时）降序排列
+
+        widgets     - 部件名到模型id列表的映射
+        """
+
+        widget_of = dict()
+        for name, mids in (widgets or dict()).items():
+            for mid in mids:
+                if mid != name:                         # 未命名的模型以模型id作为部件名
+                    widget_of[mid] = name
+
+        models = list()
+        for (i, mid), (cpu, gpu) in self.samples.items():
+            models.append({
+                'viewport': i,
+                'name': mid,
+                'widget': widget_of.get(mid) if i == 0 else None,
+                'samples': len(cpu),
+                'cpu_ms': float(np.mean(cpu)) if cpu else 0.0,
+                'gpu_ms': float(np.mean(gpu)) if gpu else None
+            })
+
+        groups = dict()
+        for item in models:
+            if item['widget'] is None:
+                continue
+
+            group = groups.setdefault(item['widget'], {'name':item['widget'], 'models':0, 'cpu_ms':0.0, 'gpu_ms':None})
+            group['models'] += 1
+            group['cpu_ms'] += item['cpu_ms']
+            if item['gpu_ms'] is not None:
+                group['gpu_ms'] = (group['gpu_ms'] or 0.0) + item['gpu_ms']
+
+        order = lambda item: (item['gpu_ms'] or 0.0, item['cpu_ms'])
+        return {
+            'models': sorted(models, key=order, reverse=True),
+            'widgets': sorted(groups.values(), key=order, reverse=True)
+        }
+
+    def draw_overlay(self, width, height, widgets=None, rows=10, interval=0.5):
+        """在画布左上角绘制耗时最多的模型列表，列表图像每interval秒更新一次
+
+        width       - 画布宽度
+        height      - 画布高度
+        widgets     - 部件名到模型id列表的映射
+        rows        - 显示的模型数量
+        interval    - 列表更新间隔，单位秒
+        """
+
+        if self.panel is None or time.perf_counter() - self.panel_time > interval:
+            self.panel_time = time.perf_counter()
+            lines = ['model  widget  gpu(ms)  cpu(ms)']
+            for item in self.stats(widgets=widgets)['models'][:rows]:
+                gpu = '-' if item['gpu_ms'] is None else '%.3f'%item['gpu_ms']
+                lines.append('%s  %s  %s  %.3f'%(item['name'], item['widget'] or '-', gpu, item['cpu_ms']))
+
+            images = [util.text2img(line, 14, np.array([1.0, 1.0, 1.0])) for line in lines]
+            w = max(im.shape[1] for im in images) + 8
+            h = sum(im.shape[0] + 2 for im in images) + 6
+            panel = np.zeros((h, w, 4), dtype=np.uint8)
+            panel[..., 3] = 160
+
+            y = 4
+            for im in images:
+                alpha = im[..., 3:]/255
+                block = panel[y:y+im.shape[0], 4:4+im.shape[1]]
+                block[..., :3] = (im[..., :3]*alpha + block[..., :3]*(1-alpha)).astype(np.uint8)
+                block[..., 3] = np.maximum(block[..., 3], im[..., 3])
+                y += im.shape[0] + 2
+
+            self.panel = np.ascontiguousarray(panel[::-1])
+
+        h, w = self.panel.shape[:2]
+        w, h = min(w, width), min(h, height)
+        glDisable(GL_DEPTH_TEST)
+        glWindowPos2i(0, height-h)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        glDrawPixels(w, h, GL_RGBA, GL_UNSIGNED_BYTE, np.ascontiguousarray(self.panel[-h:, :w]))
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+        glEnable(GL_DEPTH_TEST)
+
+    def delete(self):
+        """删除全部查询对象"""
+
+        queries = self.free + [query for query, key in self.pending]
+        if queries:
+            glDeleteQueries(len(queries), queries)
+
+        self.free = list()
+        self.pending.clear()
+        self.gpu_timer = None
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+import os
+import struct
+import ctypes
+import hashlib
+from OpenGL.GL import *
+from OpenGL.GL import shaders
+from OpenGL.error import GLError
+from OpenGL.raw.GL.VERSION.GL_4_1 import glGetProgramBinary as _glGetProgramBinary
+from OpenGL.raw.GL.VERSION.GL_4_1 import glProgramBinary as _glProgramBinary
+from OpenGL.raw.GL.VERSION.GL_4_1 import glProgramParameteri as _glProgramParameteri
+
+class ProgramCache:
+    """着色器程序缓存：源码和类型完全相同的着色器组合只编译链接一次，由多个模型共享"""
+
+    _MAGIC = b'WXGL'
+
+    def __init__(self, cache_dir=None):
+        """构造函数
+
+        cache_dir   - 着色器程序二进制文件的缓存路径，None表示不使用磁盘缓存
+        """
+
+        self.cache_dir = cache_dir                      # 磁盘缓存路径
+        self.programs = dict()                          # 键为着色器源码和类型组成的元组，值为[着色器程序, 引用计数]
+        self.keys = dict()                              # 着色器程序到键的映射
+        self.hits = 0                                   # 命中次数
+        self.misses = 0                                 # 未命中次数
+        self.disk_hits = 0                              # 磁盘缓存命中次数
+        self.disk_misses = 0                            # 磁盘缓存未命中（含二进制被驱动拒绝）次数
+        self.signature = None                           # GL驱动签名（渲染器、版本和厂商）
+
+    def _binary_supported(self):
+        """返回当前GL上下文是否支持读写着色器程序二进制数据"""
+
+        if not self.cache_dir or not bool(_glGetProgramBinary) or not bool(_glProgramBinary) or not bool(_glProgramParameteri):
+            return False
+
+        try:
+            return glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) > 0
+        except GLError:
+            return False
+
+    def _binary_file(self, key):
+        """返回着色器程序二进制数据的缓存文件名"""
+
+        if self.signature is None:
+            self.signature = b'|'.join([glGetString(item) or b'' for item in (GL_RENDERER, GL_VERSION, GL_VENDOR)])
+
+        h = hashlib.sha1(self.signature)
+        for src, genre in key:
+            h.update(struct.pack('<I', int(genre)))
+            h.update(src.encode('utf-8'))
+
+        return os.path.join(self.cache_dir, '%s.bin'%h.hexdigest())
+
+    def _load_binary(self, fn):
+        """从缓存文件加载着色器程序，失败则返回None"""
+
+        try:
+            with open(fn, 'rb') as fp:
+                data = fp.read()
+        except OSError:
+            return None
+
+        if len(data) <= 8 or data[:4] != self._MAGIC:
+            return None
+
+        fmt = struct.unpack('<I', data[4:8])[0]
+        binary = ctypes.create_string_buffer(data[8:], len(data)-8)
+        program = shaders.ShaderProgram(glCreateProgram())
+
+        try:
+            _glProgramBinary(program, fmt, binary, len(data)-8)
+            program.check_linked()
+        except (GLError, RuntimeError):
+            glDeleteProgram(program)
+            return None
+
+        return program
+
+    def _save_binary(self, fn, program):
+        """将着色器程序的二进制数据写入缓存文件"""
+
+        try:
+            size = int(glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH))
+            binary = ctypes.create_string_buffer(size)
+            length, fmt = ctypes.c_int(0), ctypes.c_uint(0)
+            _glGetProgramBinary(program, size, ctypes.byref(length), ctypes.byref(fmt), binary)
+
+            if length.value > 0:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with open(fn+'.tmp', 'wb') as fp:
+                    fp.write(self._MAGIC + struct.pack('<I', fmt.value) + binary.raw[:length.value])
+                os.replace(fn+'.tmp', fn)
+        except (GLError, OSError):
+            pass
+
+    def _link_retrievable(self, cshaders):
+        """链接着色器程序并设置可读取二进制数据的提示：部分驱动（如Mesa的兼容模式上下文）缺少包装后的glProgramParameteri，直接调用原始函数"""
+
+        program = shaders.ShaderProgram(glCreateProgram())
+        for shader in cshaders:
+            glAttachShader(program, shader)
+
+        try:
+            _glProgramParameteri(program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+            glLinkProgram(program)
+            program.check_linked()
+        except Exception:
+            glDeleteProgram(program)
+            raise
+        finally:
+            for shader in cshaders:
+                glDeleteShader(shader)
+
+        return program
+
+    def _compile(self, key):
+        """编译并链接着色器程序，优先从磁盘缓存加载；读写二进制数据失败时按不使用缓存的方式编译"""
+
+        if self._binary_supported():
+            try:
+                fn = self._binary_file(key)
+                program = self._load_binary(fn)
+                if program:
+                    self.disk_hits += 1
+                    return program
+
+                cshaders = [shaders.compileShader(src, genre) for src, genre in key]
+                program = self._link_retrievable(cshaders)
+                self.disk_misses += 1
+                self._save_binary(fn, program)
+
+                return program
+            except Exception:
+                pass
+
+        cshaders = [shaders.compileShader(src, genre) for src, genre in key]
+        return shaders.compileProgram(*cshaders)
+
+    def get_program(self, shader_list):
+        """返回着色器程序，引用计数加1
+
+        shader_list - 着色器源码和着色器类型组成的元组的列表
+        """
+
+        key = tuple(shader_list)
+        if key in self.programs:
+            self.programs[key][1] += 1
+            self.hits += 1
+        else:
+            program = self._compile(key)
+            self.programs.update({key: [program, 1]})
+            self.keys.update({program: key})
+            self.misses += 1
+
+        return self.programs[key][0]
+
+    def release(self, program):
+        """着色器程序引用计数减1，计数归零时删除着色器程序
+
+        program     - 着色器程序
+        """
+
+        key = self.keys.get(program)
+        if key is None:
+            return
+
+        self.programs[key][1] -= 1
+        if self.programs[key][1] <= 0:
+            glDeleteProgram(program)
+            del self.programs[key]
+            del self.keys[program]
+
+    def clear(self):
+        """删除全部着色器程序"""
+
+        for program, count in self.programs.values():
+            glDeleteProgram(program)
+
+        self.programs.clear()
+        self.keys.clear()
+
+    def stats(self):
+        """返回缓存统计信息"""
+
+        return {
+            'hits':         self.hits,
+            'misses':       self.misses,
+            'programs':     len(self.programs),
+            'disk_hits':    self.disk_hits,
+            'disk_misses':  self.disk_misses
+        }
@@ -1,119 +1,14 @@
 #!/usr/bin/env python3
 
-import sys, os, time
-import numpy as np
-import imageio
+import sys, os
 from PyQt6.QtWidgets import QApplication, QMainWindow, QWidget, QToolBar, QHBoxLayout, QFileDialog, QLabel
 from PyQt6.QtGui import QIcon, QAction, QImage, QPixmap
-from PyQt6.QtCore import Qt, QByteArray, pyqtSignal, QThread
+from PyQt6.QtCore import Qt, QByteArray
 
 from . qtscene import QtScene
+from . recorder import FrameRecorder
 from . import imgres
 
-if sys.platform.lower() != 'darwin':
-    import webp
-
-class FileCreator(QThread):
-    """图像或动画文件生成器"""
-
-    shoot = pyqtSignal(str, bool)
-    refresh = pyqtSignal()
-    finish = pyqtSignal()
-
-    def __init__(self, fig):
-        """构造函数"""
-
-        super(FileCreator, self).__init__()
-        self.fig = fig
-
-    def run(self):
-        """启动服务"""
-
-        self.fig.scene.increment = False
-        self.fig.scene.duration = 0
-        ft = round(1000/self.fig.fps)
-
-        while not self.fig.scene.gl_init_done:
-            time.sleep(0.01)
-
-        if self.fig.ext in ('.png', '.jpg', '.jpeg'):
-            self.fig.scene.duration = 0
-
-            time.sleep(0.01)
-            self.fig.scene.painted = False
-            self.refresh.emit()
-            while not self.fig.scene.painted:
-                time.sleep(0.01)
-            
-            time.sleep(0.03)
-            self.fig.scene.im_pil = None
-            self.shoot.emit('RGBA' if self.fig.ext=='.png' else 'RGB', False)
-            while self.fig.scene.im_pil is None:
-                time.sleep(0.01)
-            
-            if isinstance(self.fig.dpi, (int, float)):
-                self.fig.scene.im_pil.save(self.fig.outfile, dpi=(self.fig.dpi, self.fig.dpi))
-            else:
-                self.fig.scene.im_pil.save(self.fig.outfile)
-        elif self.fig.ext == '.webp':
-            w, h = self.fig.scene.csize
-            enc = webp.WebPAnimEncoder.new(w-self.fig.scene.offset[1], h-self.fig.scene.offset[0])
-            cfg = webp.WebPConfig.new(quality=100)
-            timestamp_ms = 0
-            while self.fig.cn < self.fig.frames:
-                self.fig.scene.duration = self.fig.cn * ft
-
-                time.sleep(0.01)
-                self.fig.scene.painted = False
-                self.refresh.emit()
-                while not self.fig.scene.painted:
-                    time.sleep(0.01)
-            
-                time.sleep(0.03)
-                self.fig.scene.im_pil = None
-                self.shoot.emit('RGBA', False)
-                while not self.fig.scene.im_pil:
-                    time.sleep(0.01)
-
-                pic = webp.WebPPicture.from_pil(self.fig.scene.im_pil)
-                enc.encode_frame(pic, timestamp_ms, cfg)
-                timestamp_ms += ft
-                self.fig.cn += 1
- 
-            anim_data = enc.assemble(timestamp_ms)
-            with open(self.fig.outfile, 'wb') as fp:
-                fp.write(anim_data.buffer())
-        else:
-            if self.fig.ext == '.gif':
-                writer = imageio.get_writer(self.fig.outfile, fps=self.fig.fps, loop=self.fig.loop)
-                crop = False
-            else:
-                writer = imageio.get_writer(self.fig.outfile, fps=self.fig.fps)
-                crop = True
-
-            while self.fig.cn < self.fig.frames:
-                self.fig.scene.duration = self.fig.cn * ft
-
-                time.sleep(0.01)
-                self.fig.scene.painted = False
-                self.refresh.emit()
-                while not self.fig.scene.painted:
-                    time.sleep(0.01)
-            
-                time.sleep(0.03)
-                self.fig.scene.im_pil = None
-                self.shoot.emit('RGBA', crop)
-                while not self.fig.scene.im_pil:
-                    time.sleep(0.01)
-
-                im = np.array(self.fig.scene.im_pil)
-                writer.append_data(im)
-                self.fig.cn +=1
- 
-            writer.close()
-
-        self.finish.emit()
-
 class QtFigure(QMainWindow):
     """基于qt的画布类"""
 
@@ -194,12 +89,20 @@ class QtFigure(QMainWindow):
         self.sb.addPermanentWidget(self.time_info)
 
         if not self.outfile is None:
-            self.cn = 0
-            self.creator = FileCreator(self)
-            self.creator.shoot.connect(self.scene.capture)
-            self.creator.refresh.connect(self.scene.update)
-            self.creator.finish.connect(self.close)
-            self.creator.start()
+            self.recorder = FrameRecorder(self.scene, qt=self.scene.offset, **kwds)
+            self.scene.frameSwapped.connect(self.create_file)
+
+    def create_file(self):
+        """画布的帧合成到窗口后捕捉该帧并请求绘制下一帧，全部帧录制完成后关闭窗口；帧图像由编码线程写入文件"""
+
+        self.recorder.capture()
+
+        if self.recorder.next_frame():
+            self.scene.update()
+        else:
+            self.scene.frameSwapped.disconnect(self.create_file)
+            self.recorder.finish()
+            self.close()
 
     def closeEvent(self, evt):
         """重写关闭事件函数"""
@@ -25,19 +25,14 @@ class QtScene(BaseScene, QOpenGLWidget):
         else:
             self.offset = (80*self.factor, 108*self.factor)
 
-        self.timer_id = self.startTimer(0, Qt.TimerType.CoarseTimer)
+        self.timer_id = None
+        self.start_idle()
 
     def timerEvent(self, evt):
-        """重写定时事件函数"""
+        """重写定时事件函数：仅在场景需要重绘时刷新"""
 
-        if self.is_wxgl_app:
-            if self.scheme.cinfo:
-                self.parent.cam_info.setText(self.scheme.cinfo(self.azim, self.elev, self.dist))
-        
-            if self.scheme.tinfo:
-                self.parent.time_info.setText(self.scheme.tinfo(self.duration))
-        
-        self.update()
+        if self._frame_due():
+            self.update()
 
     #def initializeGL(self):
     #    """重写初始化函数"""
@@ -56,6 +51,13 @@ class QtScene(BaseScene, QOpenGLWidget):
         self._paint()
         self.painted = True
 
+        if self.is_wxgl_app:
+            if self.scheme.cinfo:
+                self.parent.cam_info.setText(self.scheme.cinfo(self.azim, self.elev, self.dist))
+        
+            if self.scheme.tinfo:
+                self.parent.time_info.setText(self.scheme.tinfo(self.duration))
+
     def resizeGL(self, width, height):
         """重写改变窗口事件函数"""
  
@@ -84,6 +86,22 @@ class QtScene(BaseScene, QOpenGLWidget):
 
         self._capture(mode=mode, crop=crop, buffer=buffer, qt=self.offset)
 
+    def capture_async(self, mode='RGBA', crop=False, buffer='front', tag=None):
+        """异步捕捉缓冲区数据：读取请求写入像素缓冲区对象后立即返回，返回此前已经完成读取的帧（PIL对象和附加信息组成的元组）的列表
+ 
+        mode        - 'RGB'或'RGBA'
+        crop        - 是否将宽高裁切为16的倍数
+        buffer      - 'front'（前缓冲区）或'back'（后缓冲区）
+        tag         - 与该帧图像一起返回的附加信息
+        """
+
+        return self._capture_async(mode=mode, crop=crop, buffer=buffer, qt=self.offset, tag=tag)
+
+    def flush_capture(self):
+        """完成全部尚未完成的异步捕捉，返回各帧PIL对象和附加信息组成的元组的列表"""
+
+        return self._flush_capture()
+
     def get_buffer(self, mode='RGBA', crop=False, buffer='front'):
         """以PIL对象的格式返回场景缓冲区数据
  
@@ -131,15 +149,41 @@ class QtScene(BaseScene, QOpenGLWidget):
         self._wheel(evt.angleDelta().y())
         self.update()
 
+    def _request_redraw(self):
+        """请求重绘"""
+
+        self.update()
+
     def start_idle(self):
-        """启动idle"""
+        """启动idle：动画场景按目标帧率定时刷新，静态场景只在交互时刷新"""
  
-        self.timer_id = self.startTimer(0, Qt.TimerType.CoarseTimer)
+        if self.scheme.alive and self.timer_id is None:
+            self.timer_id = self.startTimer(self._frame_interval(), Qt.TimerType.CoarseTimer)
 
     def stop_idle(self):
         """停止idle"""
  
-        self.killTimer(self.timer_id)
+        if self.timer_id is not None:
+            self.killTimer(self.timer_id)
+            self.timer_id = None
+
+    def raycast(self, x, y):
+        """CPU射线拾取，返回离相机最近的模型id、三角形顶点索引和交点世界坐标组成的元组，未命中返回None
+
+        x, y        - 拾取点的窗口坐标（原点位于左下角）
+        """
+
+        return self._raycast(x, y)
+
+    def profile_stats(self):
+        """返回滑动窗口内逐模型和逐部件的CPU和GPU平均耗时（毫秒），按耗时降序排列；未开启性能分析时返回None"""
+
+        return self._profile_stats()
+
+    def render_stats(self):
+        """返回最近一帧的绘制计数：剔除和绘制的模型数量、绘制调用次数、提交的顶点和索引数量、着色器程序切换和纹理绑定次数、uniform变量和缓冲区上传数量"""
+
+        return self._frame_counters()
 
     def set_visible(self, name, visible):
         """设置部件或模型的可见性
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import ctypes
+import numpy as np
+from collections import deque
+from OpenGL.GL import *
+from OpenGL.raw.GL.VERSION.GL_1_0 import glReadPixels as raw_read_pixels
+
+class AsyncReader:
+    """异步像素读取器：多个像素缓冲区对象（PBO）轮流接收glReadPixels的结果，延迟一到两帧后映射读取，绘制第N帧时GPU仍可传输第N-1帧的像素"""
+
+    def __init__(self, count=3):
+        """构造函数
+
+        count       - 像素缓冲区对象数量，不小于2；读取结果延迟count-1帧返回
+        """
+
+        self.count = max(2, count)                      # 像素缓冲区对象数量
+        self.pbos = None                                # 像素缓冲区对象
+        self.size = None                                # 像素缓冲区对应的读取宽度、高度和通道数
+        self.pending = deque()                          # 已发出读取请求、尚未映射的像素缓冲区序号和附加信息
+        self.next = 0                                   # 下一个接收读取结果的像素缓冲区序号
+
+    def create(self, width, height, channels):
+        """按读取尺寸创建像素缓冲区对象"""
+
+        self.delete()
+
+        nbytes = width * height * channels
+        self.pbos = [int(pbo) for pbo in np.atleast_1d(glGenBuffers(self.count))]
+        for pbo in self.pbos:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+            glBufferData(GL_PIXEL_PACK_BUFFER, nbytes, None, GL_STREAM_READ)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+        self.size = (width, height, channels)
+        self.next = 0
+
+    def read(self, x, y, width, height, mode='RGBA', tag=None):
+        """发出读取当前读缓冲区像素的请求，返回已经完成的读取结果（numpy数组和附加信息组成的元组）的列表
+
+        x, y        - 读取区域左下角
+        width       - 读取区域宽度
+        height      - 读取区域高度
+        mode        - 'RGB'或'RGBA'
+        tag         - 与读取结果一起返回的附加信息
+        """
+
+        channels = 4 if mode == 'RGBA' else 3
+        result = list()
+
+        if self.size != (width, height, channels):
+            result = self.flush()
+            self.create(width, height, channels)
+
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)                 # 像素行紧密排列
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.pbos[self.next])
+        raw_read_pixels(x, y, width, height, GL_RGBA if channels == 4 else GL_RGB, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        glPixelStorei(GL_PACK_ALIGNMENT, 4)
+
+        self.pending.append((self.next, tag))
+        self.next = (self.next + 1) % self.count
+
+        if len(self.pending) == self.count:             # 保留一个空闲的像素缓冲区，映射最早的读取结果
+            result.append(self._map(*self.pending.popleft()))
+
+        return result
+
+    def flush(self):
+        """映射全部尚未完成的读取，返回读取结果的列表"""
+
+        result = list()
+        while self.pending:
+            result.append(self._map(*self.pending.popleft()))
+
+        return result
+
+    def _map(self, i, tag):
+        """映射像素缓冲区，返回shape为(h,w,c)的numpy数组（行序自下而上）和附加信息组成的元组"""
+
+        width, height, channels = self.size
+        nbytes = width * height * channels
+
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self.pbos[i])
+        ptr = glMapBufferRange(GL_PIXEL_PACK_BUFFER, 0, nbytes, GL_MAP_READ_BIT)
+        data = np.ctypeslib.as_array((ctypes.c_ubyte*nbytes).from_address(ptr)).copy()
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+        return data.reshape(height, width, channels), tag
+
+    def delete(self):
+        """删除像素缓冲区对象，丢弃尚未完成的读取"""
+
+        if self.pbos:
+            glDeleteBuffers(len(self.pbos), self.pbos)
+
+        self.pbos = None
+        self.size = None
+        self.pending.clear()
+        self.next = 0
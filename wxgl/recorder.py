@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+import queue
+import threading
+import numpy as np
+import imageio
+
+class FrameEncoder(threading.Thread):
+    """帧编码线程：从有界队列中依次取出帧图像（PIL对象），写入图像文件或动画文件"""
+
+    def __init__(self, outfile, ext, dpi=None, fps=25, loop=0, quality=100, maxsize=16):
+        """构造函数
+
+        outfile     - 输出文件名
+        ext         - 输出文件扩展名
+        dpi         - 图像文件每英寸像素数
+        fps         - 动画文件帧率
+        loop        - gif文件播放次数，0表示循环播放
+        quality     - webp文件质量，100表示最高品质
+        maxsize     - 队列容量，队列满时放入帧图像的线程等待编码线程取出
+        """
+
+        super().__init__(daemon=True)
+
+        self.outfile = outfile
+        self.ext = ext
+        self.dpi = dpi
+        self.fps = fps
+        self.loop = loop
+        self.quality = quality
+        self.frames = queue.Queue(maxsize)              # 等待编码的帧图像，None表示结束
+        self.error = None                               # 编码线程中发生的异常
+
+    def put(self, im):
+        """放入一帧图像，队列满时等待"""
+
+        self.frames.put(im)
+
+    def close(self):
+        """通知编码线程结束并等待文件写入完成，编码出错时抛出异常"""
+
+        self.frames.put(None)
+        self.join()
+
+        if self.error:
+            raise self.error
+
+    def _frames(self):
+        """依次生成队列中的帧图像，直至结束"""
+
+        while True:
+            im = self.frames.get()
+            if im is None:
+                break
+            yield im
+
+    def run(self):
+        """线程函数"""
+
+        frames = self._frames()
+        try:
+            if self.ext in ('.png', '.jpg', '.jpeg'):
+                for im in frames:
+                    if isinstance(self.dpi, (int, float)):
+                        im.save(self.outfile, dpi=(self.dpi, self.dpi))
+                    else:
+                        im.save(self.outfile)
+            elif self.ext == '.webp':
+                import webp                             # 仅输出webp文件时需要webp模块
+
+                enc, cfg = None, webp.WebPConfig.new(quality=self.quality)
+                ft, timestamp_ms = round(1000/self.fps), 0
+                for im in frames:
+                    if enc is None:
+                        enc = webp.WebPAnimEncoder.new(*im.size)
+                    enc.encode_frame(webp.WebPPicture.from_pil(im), timestamp_ms, cfg)
+                    timestamp_ms += ft
+
+                if enc:
+                    anim_data = enc.assemble(timestamp_ms)
+                    with open(self.outfile, 'wb') as fp:
+                        fp.write(anim_data.buffer())
+            else:
+                if self.ext == '.gif':
+                    writer = imageio.get_writer(self.outfile, fps=self.fps, loop=self.loop)
+                else:
+                    writer = imageio.get_writer(self.outfile, fps=self.fps)
+
+                for im in frames:
+                    writer.append_data(np.array(im))
+
+                writer.close()
+        except Exception as e:
+            self.error = e
+            for im in frames:                           # 继续取出剩余的帧，避免放入帧图像的线程等待
+                pass
+
+class FrameRecorder:
+    """帧录制器：在GUI线程中按固定的渲染时长逐帧绘制场景并异步捕捉，帧图像经有界队列交给编码线程写入文件
+
+    后端的绘制循环调用next_frame准备下一帧，绘制完成后调用capture捕捉该帧，全部帧完成后调用finish
+    """
+
+    def __init__(self, scene, qt=None, **kwds):
+        """构造函数
+
+        scene       - 场景对象
+        qt          - 使用Qt作为后端的偏移量
+        kwds        - 关键字参数
+            outfile     - 输出文件名
+            ext         - 输出文件扩展名
+            dpi         - 图像文件每英寸像素数
+            fps         - 动画文件帧率
+            frames      - 动画文件总帧数
+            loop        - gif文件播放次数，0表示循环播放
+            quality     - webp文件质量，100表示最高品质
+        """
+
+        ext = kwds.get('ext')
+        fps = kwds.get('fps', 25)
+
+        self.scene = scene
+        self.qt = qt
+        self.ft = round(1000/fps)                       # 帧间隔，单位毫秒
+        self.total = 1 if ext in ('.png', '.jpg', '.jpeg') else kwds.get('frames', 100) # 总帧数
+        self.mode = 'RGB' if ext in ('.jpg', '.jpeg') else 'RGBA'
+        self.crop = ext in ('.mp4', '.avi', '.wmv', '.mov')
+        self.cn = 0                                     # 已捕捉的帧数
+        self.requested = False                          # 已准备好下一帧，等待绘制和捕捉
+
+        self.encoder = FrameEncoder(
+            kwds.get('outfile'), ext,
+            dpi = kwds.get('dpi'),
+            fps = fps,
+            loop = kwds.get('loop', 0),
+            quality = kwds.get('quality', 100)
+        )
+        self.encoder.start()
+
+        self.scene.increment = False
+        self.scene.duration = 0
+
+    def next_frame(self):
+        """准备绘制下一帧：设置场景的渲染时长并返回True；上一帧尚未捕捉时直接返回True，全部帧已捕捉时返回False"""
+
+        if self.requested:
+            return True
+
+        if self.cn >= self.total:
+            return False
+
+        self.scene.duration = self.cn * self.ft
+        self.requested = True
+
+        return True
+
+    def capture(self, buffer='front'):
+        """捕捉刚绘制完成的帧，将此前已经完成读取的帧交给编码线程
+
+        buffer      - 'front'（前缓冲区）或'back'（后缓冲区）
+        """
+
+        if not self.requested:
+            return
+
+        for im, _ in self.scene._capture_async(mode=self.mode, crop=self.crop, buffer=buffer, qt=self.qt):
+            self.encoder.put(im)
+
+        self.cn += 1
+        self.requested = False
+
+    def finish(self):
+        """取回尚未完成读取的帧，等待编码线程写入文件"""
+
+        for im, _ in self.scene._flush_capture():
+            self.encoder.put(im)
+
+        self.encoder.close()
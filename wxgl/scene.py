@@ -1,12 +1,24 @@
 #!/usr/bin/env python3
 
 import time
+import ctypes
+import logging
 import numpy as np
+from functools import partial
 from PIL import Image
+from OpenGL import GL
 from OpenGL.GL import *
 from OpenGL.arrays import vbo
-from OpenGL.GL import shaders
+from OpenGL.error import GLError
 from . import util
+from . program import ProgramCache
+from . oit import WeightedOIT, oit_shaders
+from . state import GLState
+from . readback import AsyncReader
+from . profiler import FrameProfiler
+from . batch import batch_key, merge_models
+
+logger = logging.getLogger('wxgl')
 
 class BaseScene:
     """场景基类"""
@@ -14,6 +26,9 @@ class BaseScene:
     _DIST = 6.0
     _NEAR = 3.0
     _FAR = 1000.0
+    _CAMERA_BINDING = 0
+    _COUNTERS = ('culled', 'drawn', 'draws', 'vertices', 'indices', 'programs', 'textures', 'uniforms', 'uploads')
+    _FLIP_CULL = {None: None, 'front': 'back', 'back': 'front'}
 
     def __init__(self, scheme, **kwds):
         """构造函数"""
@@ -22,6 +37,8 @@ class BaseScene:
         self.viewport = [None, None, None]                              # 主视区、标题区、调色板区视口
         self.mns = [[[],[]], [[],[]], [[],[]]]                          # 主视区、标题区、调色板区不透明/透明模型名列表
         self.selected = list()                                          # 选中的模型
+        self.program_cache = ProgramCache(kwds.get('shader_cache'))     # 着色器程序缓存
+        self.gl_state = GLState()                                       # GL渲染状态跟踪器
 
         self.csize = kwds.get('size', (960, 640))                       # 画布分辨率
         self.bg = util.format_color(kwds.get('bg', [0.0, 0.0, 0.0]))    # 背景色
@@ -32,6 +49,16 @@ class BaseScene:
         self.azim_range = kwds.get('azim_range', (-180.0, 180.0))       # 方位角变化范围
         self.elev_range = kwds.get('elev_range', (-180.0, 180.0))       # 高度角变化范围
         self.smooth = kwds.get('smooth', True)                          # 直线和点的反走样开关
+        self.interleaved = kwds.get('interleaved', False)               # 全部模型的顶点属性交错存储
+        self.pick_mode = kwds.get('pick_mode', 'gpu')                   # 拾取模式：gpu或cpu
+        self.culling = kwds.get('culling', True)                        # 视椎体剔除开关
+        self.transparency = kwds.get('transparency', 'sort')            # 半透明模型绘制模式：sort或oit
+        self.target_fps = kwds.get('target_fps', 60)                    # 动画播放时的目标帧率
+        self.batching = kwds.get('batching', False)                     # 静态模型合批绘制开关
+        self.lod_error = kwds.get('lod_error', 1.0)                     # 细节层次的屏幕空间误差阈值（像素）
+        self.profile = kwds.get('profile', False)                       # 逐模型性能分析：False、True或overlay（同时显示叠加层）
+        self.budgets = dict(kwds.get('budgets') or dict())              # 逐帧计数预算：计数名到上限的映射，超出时记录警告
+        self.frame_callback = kwds.get('frame_callback')                # 每帧绘制完成后以逐帧计数字典为参数调用的函数
 
         self.oecs = [0.0, 0.0, 0.0]                                     # 视点坐标系ECS原点
         self.dist = self._DIST                                          # 相机ECS原点的距离
@@ -46,7 +73,36 @@ class BaseScene:
         self.pmat = np.eye(4, dtype=np.float32)                         # 投影矩阵
 
         self.gl_init_done = False                                       # GL初始化标志
+        self.vao_supported = False                                      # GL上下文支持顶点数组对象（VAO）
+        self.ubo = None                                                 # 相机uniform缓冲区对象
+        self.camera_data = np.zeros(40, dtype=np.float32)               # 相机uniform块数据（std140布局）
+        self.pick_fbo = None                                            # 拾取用的离屏帧缓冲区对象
+        self.pick_rbo = None                                            # 拾取用的深度模板渲染缓冲区对象
+        self.pick_size = None                                           # 拾取用的离屏帧缓冲区尺寸
+        self.oit = None                                                 # 加权混合顺序无关透明（OIT）渲染器
+        self.profiler = None                                            # 逐模型帧性能分析器
+        self.oit_mids = set()                                           # 使用OIT绘制的主视区半透明模型id
+        self.batches = list()                                           # 合批：合并后的模型及成员模型id和索引范围
+        self.batch_of = dict()                                          # 合批成员模型id到合批序号、共享的顶点数组对象和索引范围的映射
+        self.updated = set()                                            # 数据已更新、等待上传到显存的模型（视区序号和模型id）
+        self.aabb_mids = list()                                         # 参与视椎体剔除的主视区模型id
+        self.aabb_lo = np.zeros((0,3))                                  # 参与视椎体剔除的模型世界坐标包围盒下界
+        self.aabb_hi = np.zeros((0,3))                                  # 参与视椎体剔除的模型世界坐标包围盒上界
+        self.lod_mids = list()                                          # 主视区中细节层次模型id
+        self.lod_centers = np.zeros((0,3))                              # 细节层次模型世界坐标包围球球心
+        self.lod_radii = np.zeros(0)                                    # 细节层次模型世界坐标包围球半径
+        self.lod_errors = np.zeros((0,0))                               # 细节层次模型各层次在世界坐标系中的几何误差
+        self.culled = 0                                                 # 当前帧被视椎体剔除的模型数量
+        self.drawn = 0                                                  # 当前帧绘制的模型数量
+        self.vertices = 0                                               # 当前帧提交的顶点数量
+        self.indices = 0                                                # 当前帧提交的索引数量
+        self.draws = 0                                                  # 当前帧的绘制调用次数
+        self.uniforms = 0                                               # 当前帧上传的uniform变量数量
+        self.uploads = 0                                                # 当前帧上传的缓冲区数据块数量
+        self.over_budget = set()                                        # 当前超出预算的计数名
         self.painted = False                                            # 期望的重绘已完成 
+        self.dirty = True                                               # 场景需要重绘
+        self.frame_time = 0                                             # 最近一帧开始绘制的时刻，单位秒
         self.left_down = False                                          # 左键按下
         self.ctrl_down = False                                          # Ctr键按下
         self.wheel_lag = 0                                              # 滚轮迟滞（消除抖动）
@@ -54,12 +110,29 @@ class BaseScene:
         self.scale = 1.0                                                # 眼睛位置自适应调整系数
 
         self.im_pil = None                                              # 缓冲区图像数据
+        self.reader = None                                              # 异步捕捉缓冲区数据的像素读取器
         self.increment = True                                           # 计时器自动增量
         self.start= 1000 * time.time()                                  # 开始渲染时的时间戳
         self.duration = 0                                               # 累计渲染时长，单位毫秒
         self.tbase = 0                                                  # 累计渲染时长基数，单位毫秒
         self.playing = False                                            # 动画播放中
 
+        if self.pick_mode not in ('gpu', 'cpu'):
+            raise ValueError('不支持的拾取模式：%s'%self.pick_mode)
+
+        if self.transparency not in ('sort', 'oit'):
+            raise ValueError('不支持的半透明模式：%s'%self.transparency)
+
+        if self.profile not in (False, True, 'overlay'):
+            raise ValueError('不支持的性能分析模式：%s'%self.profile)
+
+        for key in self.budgets:
+            if key not in self._COUNTERS:
+                raise KeyError('不支持的预算计数：%s'%key)
+
+        if self.frame_callback is not None and not callable(self.frame_callback):
+            raise TypeError('frame_callback必须是可调用对象')
+
         self._update_cam_and_up()                                       # 更新眼睛位置和指向观察者上方的单位向量
         self._update_view_matrix()                                      # 更新视点矩阵
         self._update_proj_matrix()                                      # 更新投影矩阵
@@ -107,11 +180,13 @@ class BaseScene:
         """更新投影矩阵"""
  
         self.pmat[:] = util.proj_matrix(self.fovy, self.aspect, self.near, self.far)
+        self.dirty = True
 
     def _update_view_matrix(self):
         """更新视点矩阵"""
  
         self.vmat[:] = util.view_matrix(self.cam, self.up, self.oecs)
+        self.dirty = True
 
     def _capture(self, mode='RGBA', crop=False, buffer='front', qt=None):
         """捕捉缓冲区数据
@@ -134,9 +209,22 @@ class BaseScene:
         """
 
         gl_mode = GL_RGBA if mode=='RGBA' else GL_RGB
-        glReadBuffer(GL_FRONT if buffer=='front' else GL_BACK)
+        if not glGetIntegerv(GL_READ_FRAMEBUFFER_BINDING): # 绑定了帧缓冲区对象时读取其颜色附件
+            glReadBuffer(GL_FRONT if buffer=='front' else GL_BACK)
         data = glReadPixels(0, 0, self.csize[0], self.csize[1], gl_mode, GL_UNSIGNED_BYTE, outputType=None)
         data = data.reshape(data.shape[1], data.shape[0], -1)
+ 
+        return self._to_image(data, mode=mode, crop=crop, qt=qt)
+
+    def _to_image(self, data, mode='RGBA', crop=False, qt=None):
+        """将行序自下而上的缓冲区像素数组转为PIL对象
+ 
+        data        - shape为(h,w,3|4)的numpy数组
+        mode        - 'RGB'或'RGBA'
+        crop        - 是否将宽高裁切为16的倍数
+        qt          - 使用Qt作为后端的偏移量
+        """
+
         im = Image.fromarray(data[qt[0]:, qt[1]:] if qt else data, mode=mode)
         im = im.transpose(Image.FLIP_TOP_BOTTOM)
  
@@ -149,6 +237,35 @@ class BaseScene:
  
         return im
 
+    def _capture_async(self, mode='RGBA', crop=False, buffer='front', qt=None, tag=None):
+        """异步捕捉缓冲区数据：读取请求写入像素缓冲区对象后立即返回，不等待GPU完成绘制
+ 
+        返回此前已经完成读取的帧（PIL对象和附加信息组成的元组）的列表，读取结果比请求延迟一到两帧
+        mode        - 'RGB'或'RGBA'
+        crop        - 是否将宽高裁切为16的倍数
+        buffer      - 'front'（前缓冲区）或'back'（后缓冲区）
+        qt          - 使用Qt作为后端的偏移量
+        tag         - 与该帧图像一起返回的附加信息
+        """
+
+        if self.reader is None:
+            self.reader = AsyncReader()
+
+        if not glGetIntegerv(GL_READ_FRAMEBUFFER_BINDING):
+            glReadBuffer(GL_FRONT if buffer=='front' else GL_BACK)
+
+        frames = self.reader.read(0, 0, *self.csize, mode=mode, tag=(mode, crop, qt, tag))
+        return [(self._to_image(data, *info[:3]), info[3]) for data, info in frames]
+
+    def _flush_capture(self):
+        """完成全部尚未完成的异步捕捉，返回各帧PIL对象和附加信息组成的元组的列表"""
+
+        if self.reader is None:
+            return list()
+
+        frames = self.reader.flush()
+        return [(self._to_image(data, *info[:3]), info[3]) for data, info in frames]
+
     def _resize(self):
         """改变窗口"""
  
@@ -174,9 +291,34 @@ class BaseScene:
 
         self._update_proj_matrix()
 
+    def _frame_due(self):
+        """返回场景是否需要重绘：场景被标记为需要重绘，或者动画播放中且距上一帧已达到目标帧间隔"""
+
+        if self.dirty:
+            return True
+
+        if self.scheme.alive and self.playing:
+            return not self.target_fps or time.perf_counter() - self.frame_time >= 1/self.target_fps
+
+        return False
+
+    def _frame_interval(self):
+        """返回动画播放时的目标帧间隔，单位毫秒"""
+
+        return max(1, round(1000/self.target_fps)) if self.target_fps else 1
+
+    def _request_redraw(self):
+        """请求后端重绘：场景在GUI事件之外被标记为需要重绘时调用（如模型数据更新），静态场景不依赖定时器即可显示更新，由各后端重写"""
+
+        pass
+
     def _paint(self):
         """绘制函数"""
  
+        self.dirty = False
+        self.frame_time = time.perf_counter()
+        self.culled, self.drawn, self.draws, self.vertices, self.indices, self.uniforms, self.uploads = 0, 0, 0, 0, 0, 0, 0
+        self.gl_state.program_switches, self.gl_state.texture_binds, self.gl_state.sampler_uploads = 0, 0, 0
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT) # 清除屏幕及深度缓存
 
         if self.scheme.alive and self.playing:
@@ -188,26 +330,394 @@ class BaseScene:
                 self._update_cam_and_up(azim=v.get('azim'), elev=v.get('elev'), dist=v.get('dist'))
                 self._update_view_matrix()
 
+        self._update_camera_ubo()
+        self.gl_state.reset()
+        self._apply_updates()
+
+        if self.profiler:
+            self.profiler.collect()
+
+        outside = self._cull()
+        self._select_lods()
+
         for i in range(3):
             if self.scheme.models[i]:
                 glViewport(*self.viewport[i])
+                batched = set()
                 for mid, depth in self.mns[i][0]:
-                    self._render(self.scheme.models[i][mid])
+                    if i == 0 and mid in self.batch_of:
+                        k = self.batch_of[mid][0]
+                        if k not in batched:
+                            batched.add(k)
+                            self._render_batch(k, outside)
+                    else:
+                        self._render_culled(i, mid, outside)
 
                 glDepthMask(False) # 对于半透明模型，禁用深度缓冲（锁定）
+                translucent = self.mns[i][1]
+                if i == 0 and self.oit_mids:
+                    self._paint_oit(outside)
+                    translucent = [item for item in translucent if item[0] not in self.oit_mids]
+
                 if (self.up[1]+self.up[2]) > 0 and -90 <= self.azim < 90 or (self.up[1]+self.up[2]) < 0 and (self.azim < -90 or self.azim >= 90):
-                    for mid, depth in self.mns[i][1]:
-                        self._render(self.scheme.models[i][mid])
+                    for mid, depth in translucent:
+                        self._render_culled(i, mid, outside)
                 else:
-                    for mid, depth in self.mns[i][1][::-1]:
-                        self._render(self.scheme.models[i][mid])
+                    for mid, depth in translucent[::-1]:
+                        self._render_culled(i, mid, outside)
                 glDepthMask(True) # 释放深度缓冲区
 
+        counters = self._frame_counters()
+        self.gl_state.restore()
+
+        if self.profiler and self.profiler.overlay:
+            self.profiler.draw_overlay(*self.csize, widgets=self.scheme.widgets)
+
+        if self.budgets:
+            self._check_budgets(counters)
+
+        if self.frame_callback:
+            self.frame_callback(counters)
+
+    def _frame_counters(self):
+        """返回当前帧的绘制计数字典"""
+
+        return {
+            'culled': self.culled,                      # 被视椎体剔除的模型数量
+            'drawn': self.drawn,                        # 绘制的模型数量
+            'draws': self.draws,                        # 绘制调用次数
+            'vertices': self.vertices,                  # 提交的顶点数量
+            'indices': self.indices,                    # 提交的索引数量
+            'programs': self.gl_state.program_switches, # 着色器程序切换次数
+            'textures': self.gl_state.texture_binds,    # 纹理绑定次数
+            'uniforms': self.uniforms + self.gl_state.sampler_uploads, # 上传的uniform变量数量
+            'uploads': self.uploads                     # 上传的缓冲区数据块数量
+        }
+
+    def _check_budgets(self, counters):
+        """检查逐帧计数是否超出预算：计数由预算之内变为超出时记录一次警告，回到预算之内后再次超出时重新警告"""
+
+        for key, limit in self.budgets.items():
+            if counters[key] <= limit:
+                self.over_budget.discard(key)
+            elif key not in self.over_budget:
+                self.over_budget.add(key)
+                logger.warning('渲染时长%d毫秒的帧超出预算：%s为%d，预算为%d', self.duration, key, counters[key], limit)
+
+    def _count_render(self, m):
+        """统计模型一次绘制的绘制调用、顶点、索引和uniform变量上传"""
+
+        self.draws += 1
+        self.uniforms += m.ucount
+
+        if m.lods:
+            count = m.lods[m.lod][1]
+            self.vertices += count
+            self.indices += count
+        elif m.stream:
+            self.vertices += m.stream[2]
+        else:
+            self.vertices += m.vcount
+            self.indices += m.icount
+
+    def _paint_oit(self, outside):
+        """不排序一次绘制主视区全部OIT半透明模型，再合成到当前帧缓冲区"""
+
+        if not self.oit.create(*self.viewport[0][2:]):
+            return
+
+        self.oit.begin(self.viewport[0], opaque=self._render_opaque)
+        for mid, depth in self.mns[0][1]:
+            if mid in self.oit_mids:
+                self._render_culled(0, mid, outside)
+        self.oit.end()
+        self.gl_state.reset()
+
+    def _render_opaque(self):
+        """重绘主视区全部不透明模型"""
+
+        for mid, depth in self.mns[0][0]:
+            m = self.scheme.models[0][mid]
+            if self._render(m):
+                self._count_render(m)
+
+    def _render_batch(self, k, outside):
+        """绘制合批中可见且未被剔除的成员模型：相邻的索引范围合并，一次glMultiDrawElements调用绘制；被拾取的成员模型单独绘制"""
+
+        batch = self.batches[k]
+        firsts, counts = list(), list()
+
+        for mid, first, count in batch['spans']:
+            m = self.scheme.models[0][mid]
+            if not m.visible:
+                continue
+
+            if mid in outside:
+                self.culled += 1
+                continue
+
+            self.drawn += 1
+            if m.picked:
+                self._render(m)
+                self._count_render(m)
+            elif counts and firsts[-1] + counts[-1] == first:
+                counts[-1] += count
+            else:
+                firsts.append(first)
+                counts.append(count)
+
+        if counts:
+            self.draws += 1
+            self.vertices += sum(counts)
+            self.indices += sum(counts)
+            self.uniforms += batch['model'].ucount
+            if self.profiler:
+                self.profiler.begin((0, '<batch %d>'%k))
+
+            for cmd in batch['setup']:
+                cmd()
+            glMultiDrawElements(batch['model'].gltype, np.array(counts, dtype=np.int32), GL_UNSIGNED_INT, np.array(firsts, dtype=np.intp)*4, len(counts))
+
+            if self.profiler:
+                self.profiler.end()
+
+    def _render_culled(self, i, mid, outside):
+        """绘制视椎体之内的模型，并统计剔除和绘制的模型数量以及绘制计数"""
+
+        m = self.scheme.models[i][mid]
+        if i == 0 and mid in outside:
+            if m.visible and (not m.slide or m.slide(self.duration)):
+                self.culled += 1
+            return
+
+        if self.profiler:
+            self.profiler.begin((i, mid))
+
+        drawn = self._render(m)
+        if drawn:
+            self.drawn += 1
+            self._count_render(m)
+
+        if self.profiler:
+            self.profiler.end(drawn)
+
+    def _cull(self):
+        """返回世界坐标包围盒完全位于视椎体之外的主视区模型id集合"""
+
+        if not self.culling or not self.aabb_mids:
+            return set()
+
+        # 行向量约定下clip = p·(V·P)，视椎体的6个裁剪面由V·P的第4列与前3列相加减得到
+        mvp = np.dot(self.vmat, self.pmat).astype(np.float64)
+        planes = np.vstack((mvp[:,3]+mvp[:,:3].T, mvp[:,3]-mvp[:,:3].T))
+
+        # 对每个裁剪面取包围盒上沿法线方向最远的顶点，该顶点在裁剪面之外则整个包围盒在视椎体之外
+        pv = np.where(planes[:,None,:3] > 0, self.aabb_hi, self.aabb_lo)
+        dist = np.einsum('pnk,pk->pn', pv, planes[:,:3]) + planes[:,3:]
+
+        return {self.aabb_mids[k] for k in np.where(np.any(dist < 0, axis=0))[0]}
+
+    def _select_lods(self):
+        """为主视区的细节层次模型选择细分层次：几何误差投影到屏幕上不超过阈值的最粗层次"""
+
+        if not self.lod_mids:
+            return
+
+        dist = np.maximum(np.linalg.norm(self.lod_centers - self.cam, axis=1) - self.lod_radii, self.near)
+        px = self.lod_errors * (self.viewport[0][3] * self.pmat[1,1] / 2) / dist[:,None] # 各层次几何误差投影到屏幕上的像素数
+        levels = np.maximum((px <= self.lod_error).sum(axis=1) - 1, 0)
+
+        for mid, level in zip(self.lod_mids, levels.tolist()):
+            self.scheme.models[0][mid].lod = level
+
+    def _world_aabb(self, m):
+        """返回模型在世界坐标系中的包围盒（下界和上界），无法确定时返回None"""
+
+        if m.stream:                                    # 流式数据模型的顶点不断变化
+            return None
+
+        tags = [item['tag'] for item in m.uniform.values()]
+        if 'tsize' in tags or 'ae' in tags or 'timestamp' in tags: # 顶点着色器中会移动顶点的模型
+            return None
+
+        if not m.camera_block and 'pmat' not in tags:   # 未使用场景相机的模型
+            return None
+
+        for item in m.uniform.values():
+            if item['tag'] == 'pmat' and item.get('v') is not self.pmat or item['tag'] == 'vmat' and item.get('v') is not self.vmat:
+                return None                             # 使用自定义投影矩阵或视点矩阵
+            if item['tag'] == 'mmat' and 'f' in item:   # 模型矩阵随时间变化
+                return None
+
+        vs = None
+        for item in m.attribute.values():
+            if item['tag'] == 'vertex':
+                vs = item['data']
+        if vs is None or vs.shape[0] == 0:
+            return None
+
+        lo, hi = np.zeros(3), np.zeros(3)
+        if m.instance_box:
+            lo, hi = m.instance_box[0].min(axis=0), m.instance_box[1].max(axis=0)
+        else:
+            lo[:vs.shape[-1]], hi[:vs.shape[-1]] = vs.min(axis=0), vs.max(axis=0)
+        corners = np.array([[x, y, z, 1] for x in (lo[0], hi[0]) for y in (lo[1], hi[1]) for z in (lo[2], hi[2])])
+        corners = np.dot(corners, self._get_model_matrix(m).astype(np.float64))
+        corners = corners[:,:3] / corners[:,3:]
+
+        return corners.min(axis=0), corners.max(axis=0)
+
     def _pick(self, x, y):
         """拾取渲染"""
 
+        self._apply_updates()
+
+        if self.pick_mode == 'cpu':
+            hit = self._raycast(x, y)
+            mid_hit = hit[0] if hit else None
+        elif self._create_pick_fbo():
+            mid_hit = self._pick_by_id(x, y)
+        else:
+            mid_hit = self._pick_by_depth(x, y)
+            
+        if mid_hit:
+            self.dirty = True
+            name = self.scheme.models[0][mid_hit].name
+            for mid in self.scheme.widgets[name]:
+                m = self.scheme.models[0][mid]
+                m.picked = not m.picked
+
+                if m.picked:
+                    self.selected.append(mid)
+                else:
+                    self.selected.remove(mid)
+
+    def _raycast(self, x, y):
+        """CPU射线拾取：由相机状态构造经过拾取点的射线，与主视区中各面片模型的BVH求交
+
+        x, y        - 拾取点的窗口坐标（与_pick相同，原点位于左下角）
+        返回离相机最近的模型id、三角形顶点索引和交点世界坐标组成的元组，未命中返回None
+        """
+
+        vx, vy, vw, vh = self.viewport[0]
+        nx, ny = 2*(x-vx+0.5)/vw - 1, 2*(y-vy+0.5)/vh - 1
+        inv = np.linalg.inv(np.dot(self.vmat, self.pmat).astype(np.float64))
+        p0, p1 = np.dot([nx, ny, -1, 1], inv), np.dot([nx, ny, 1, 1], inv)
+        p0, p1 = p0[:3]/p0[3], p1[:3]/p1[3]
+        d = p1 - p0
+        result = None
+
+        for i in (0,1):
+            for mid, depth in self.mns[0][i]:
+                m = self.scheme.models[0][mid]
+                if not m.visible or m.slide and not m.slide(self.duration):
+                    continue
+
+                if 'tsize' in [item['tag'] for item in m.uniform.values()]: # 2D文本始终面向屏幕，不参与射线拾取
+                    continue
+
+                cull = self._raycast_cull(m)
+                if cull == 'both':
+                    continue
+
+                bvh = m.get_bvh()
+                if bvh is None:
+                    continue
+
+                mmat = self._get_model_matrix(m).astype(np.float64)
+                inv_m = np.linalg.inv(mmat)
+                origin = np.dot([*p0, 1], inv_m)
+                origin = origin[:3]/origin[3]
+                direction = np.dot(d, inv_m[:3,:3])
+                if np.linalg.det(mmat[:3,:3]) < 0: # 镜像变换使三角形的绕向反转
+                    cull = self._FLIP_CULL[cull]
+
+                if m.instances:
+                    hit = self._raycast_instances(m, bvh, origin, direction, cull)
+                else:
+                    hit = bvh.intersect(origin, direction, cull)
+                if hit is None:
+                    continue
+
+                t, tri = hit
+                point = np.dot([*(origin + t*direction), 1], mmat)
+                point = point[:3]/point[3]
+                dist = np.dot(point - p0, d)
+
+                if result is None or dist < result[0]:
+                    result = (dist, mid, tri, point)
+
+        return result[1:] if result else None
+
+    def _raycast_cull(self, m):
+        """返回射线拾取时模型应剔除的面：None、'front'、'back'或'both'
+
+        被面剔除的面，以及以线框或点模式绘制的面，在屏幕上都没有实心的面片，射线不应与之相交
+        """
+
+        cull = m.state.get('cull')
+        front, back = m.state.get('polygon', (GL_FILL, GL_FILL))
+        hide_front = cull in (GL_FRONT, GL_FRONT_AND_BACK) or front != GL_FILL
+        hide_back = cull in (GL_BACK, GL_FRONT_AND_BACK) or back != GL_FILL
+
+        if hide_front and hide_back:
+            return 'both'
+        if hide_front:
+            return 'front'
+        if hide_back:
+            return 'back'
+
+        return None
+
+    def _raycast_instances(self, m, bvh, origin, direction, cull=None):
+        """实例化模型的射线求交：先与各实例的包围盒求交，再由近及远变换到实例坐标系与BVH求交
+
+        返回射线参数t和三角形顶点索引组成的元组，未相交返回None
+        """
+
+        lo, hi = m.instance_box
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inv = np.where(direction == 0, 1e300, 1/direction)
+            t1, t2 = (lo - origin) * inv, (hi - origin) * inv
+        tmin = np.maximum(np.minimum(t1, t2).max(axis=1), 0)
+        tmax = np.maximum(t1, t2).min(axis=1)
+
+        candidates = np.where(tmin <= tmax)[0]
+        candidates = candidates[np.argsort(tmin[candidates])]
+        mats = m.attribute[[key for key in m.attribute if m.attribute[key]['tag'] == 'instance'][0]]['data']
+
+        result = None
+        for k in candidates:
+            if result and tmin[k] > result[0]:
+                break
+
+            mat_k = mats[k].reshape(4, 4).astype(np.float64)
+            inv_k = np.linalg.inv(mat_k)
+            o = np.dot([*origin, 1], inv_k)
+            cull_k = self._FLIP_CULL[cull] if np.linalg.det(mat_k[:3,:3]) < 0 else cull
+            hit = bvh.intersect(o[:3]/o[3], np.dot(direction, inv_k[:3,:3]), cull_k)
+            if hit and (result is None or hit[0] < result[0]):
+                result = hit
+
+        return result
+
+    def _get_model_matrix(self, m):
+        """返回模型当前的模型矩阵"""
+
+        for item in m.uniform.values():
+            if item['tag'] == 'mmat':
+                if 'f' in item:
+                    return util.model_matrix(*item['f'](self.duration))
+                return item.get('v', self.mmat)
+
+        return self.mmat
+
+    def _pick_by_depth(self, x, y):
+        """逐个模型绘制并读取深度值，返回离相机最近的模型id"""
+
         glViewport(*self.viewport[0])
         mid_hit, depth_hit = None, 1
+        self.gl_state.reset()
 
         for i in (0,1):
             for mid, depth in self.mns[0][i]:
@@ -219,17 +729,95 @@ class BaseScene:
                 d = glReadPixels(x, y, 1, 1, GL_DEPTH_COMPONENT, GL_FLOAT, None)[0,0]
                 if d < depth_hit:
                     mid_hit, depth_hit = mid, d
-            
-        if mid_hit:
-            name = self.scheme.models[0][mid_hit].name
-            for mid in self.scheme.widgets[name]:
-                m = self.scheme.models[0][mid]
-                m.picked = not m.picked
 
-                if m.picked:
-                    self.selected.append(mid)
-                else:
-                    self.selected.remove(mid)
+        self.gl_state.restore()
+        return mid_hit
+
+    def _pick_by_id(self, x, y):
+        """全部模型一次绘制到离屏帧缓冲区，模型编号写入模板缓冲区，只读回一个像素，返回模型id
+
+        模板缓冲区为8位，每遍绘制写入编号的一个字节：255个模型以内只需绘制一遍，65280个模型以内两遍。
+        编号跳过低字节为0的值，第一遍读回0即表示未命中任何模型，无需继续绘制。
+        裁剪区域限定为拾取点所在的像素，片元着色只发生在该像素上。
+        """
+
+        mids = [mid for i in (0,1) for mid, depth in self.mns[0][i]]
+        ids = [k+1+k//255 for k in range(len(mids))] # 模型编号，低字节不为0
+        fbo = int(glGetIntegerv(GL_FRAMEBUFFER_BINDING))
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.pick_fbo)
+        glViewport(*self.viewport[0])
+        glEnable(GL_SCISSOR_TEST)
+        glScissor(x, y, 1, 1)
+        glEnable(GL_STENCIL_TEST)
+        glStencilOp(GL_KEEP, GL_KEEP, GL_REPLACE)
+        self.gl_state.reset()
+
+        pid, shift = 0, 0
+        while mids and ids[-1] >> shift:
+            glClear(GL_DEPTH_BUFFER_BIT | GL_STENCIL_BUFFER_BIT) # 清除深度缓存及模板缓存
+            for mid, k in zip(mids, ids):
+                glStencilFunc(GL_ALWAYS, (k >> shift) & 0xFF, 0xFF)
+                self._render(self.scheme.models[0][mid])
+
+            pid |= int(glReadPixels(x, y, 1, 1, GL_STENCIL_INDEX, GL_UNSIGNED_BYTE, outputType=None)[0,0]) << shift
+            if pid == 0:
+                break
+            shift += 8
+
+        self.gl_state.restore()
+        glDisable(GL_STENCIL_TEST)
+        glDisable(GL_SCISSOR_TEST)
+        glBindFramebuffer(GL_FRAMEBUFFER, fbo)
+
+        k = pid - 1 - pid//256
+        return mids[k] if pid and 0 <= k < len(mids) else None
+
+    def _create_pick_fbo(self):
+        """创建与画布等大的拾取用离屏帧缓冲区（仅含深度模板附件），不支持时返回False"""
+
+        if self.pick_fbo and self.pick_size == tuple(self.csize):
+            return True
+
+        self._delete_pick_fbo()
+        if not bool(glGenFramebuffers) or not bool(glGenRenderbuffers):
+            return False
+
+        try:
+            fbo = int(glGetIntegerv(GL_FRAMEBUFFER_BINDING))
+            self.pick_fbo = int(glGenFramebuffers(1))
+            self.pick_rbo = int(glGenRenderbuffers(1))
+            self.pick_size = tuple(self.csize)
+
+            glBindRenderbuffer(GL_RENDERBUFFER, self.pick_rbo)
+            glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH24_STENCIL8, *self.pick_size)
+            glBindRenderbuffer(GL_RENDERBUFFER, 0)
+
+            glBindFramebuffer(GL_FRAMEBUFFER, self.pick_fbo)
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_STENCIL_ATTACHMENT, GL_RENDERBUFFER, self.pick_rbo)
+            glDrawBuffer(GL_NONE)
+            glReadBuffer(GL_NONE)
+            complete = glCheckFramebufferStatus(GL_FRAMEBUFFER) == GL_FRAMEBUFFER_COMPLETE
+            glBindFramebuffer(GL_FRAMEBUFFER, fbo)
+        except Exception:
+            complete = False
+
+        if not complete:
+            self._delete_pick_fbo()
+
+        return complete
+
+    def _delete_pick_fbo(self):
+        """删除拾取用的离屏帧缓冲区"""
+
+        if self.pick_fbo:
+            glDeleteFramebuffers(1, [self.pick_fbo])
+        if self.pick_rbo:
+            glDeleteRenderbuffers(1, [self.pick_rbo])
+
+        self.pick_fbo = None
+        self.pick_rbo = None
+        self.pick_size = None
 
     def _initialize_gl(self):
         """GL初始化函数"""
@@ -242,6 +830,16 @@ class BaseScene:
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)                   # 设置混合函数
         glEnable(GL_ALPHA_TEST)                                             # 启用Alpha测试 
         glAlphaFunc(GL_GREATER, 0.05)                                       # 设置Alpha测试条件为大于0.05则通过
+        self.vao_supported = self._check_vao()                              # 检查是否支持顶点数组对象
+        self.ubo = self._create_camera_ubo()                                # 创建相机uniform缓冲区对象
+
+        if self.transparency == 'oit':
+            self.oit = WeightedOIT(self.program_cache)                      # 加权混合OIT渲染器，不支持时仍按深度排序
+            if not self.oit.create(*self.csize):
+                self.oit = None
+
+        if self.profile:
+            self.profiler = FrameProfiler(overlay=self.profile=='overlay')  # 逐模型帧性能分析器
         
         if self.smooth:
             glEnable(GL_POINT_SMOOTH)                                       # 开启点反走样
@@ -295,6 +893,8 @@ class BaseScene:
             self.start = 1000 * time.time()
             self.playing = True
 
+        self.dirty = True
+
     def _drag(self, dx, dy):
         """鼠标拖拽"""
 
@@ -331,59 +931,27 @@ class BaseScene:
         """模型装配"""
 
         if self.scheme.expost:
-            if 'grid' in self.scheme.expost:
-                self.scheme._grid()
-            if 'axes' in self.scheme.expost:
-                self.scheme._axes()
+            self.scheme._expost_models()
+
+        if self.batching and self.vao_supported:
+            self._build_batches()
 
         for i in range(3):
             for mid in self.scheme.models[i]:
                 m = self.scheme.models[i][mid]
 
-                if i == 1 and mid == 'caption_text':
-                    m.attribute['a_Position']['data'][:,0] /= self.viewport[i][2]/self.viewport[i][3]
-
-                if i == 2 and mid == 'cb_label':
-                    m.attribute['a_Position']['data'][:,0] /= self.viewport[i][2]/self.viewport[i][3]
+                if i == 1 and mid == 'caption_text' or i == 2 and mid == 'cb_label':
+                    item = m.attribute['a_Position']
+                    aspect = self.viewport[i][2]/self.viewport[i][3]
+                    item['data'][:,0] *= item.get('aspect', 1)/aspect # 记录已按其缩放的视区宽高比，重复装配时不累积
+                    item.update({'aspect': aspect})
 
-                for src, genre in m.shaders:
-                    m.cshaders.append(shaders.compileShader(src, genre))
- 
-                m.program = shaders.compileProgram(*m.cshaders)
-                glUseProgram(m.program)
+                shaders = oit_shaders(m.shaders) if self.oit and i == 0 and not m.opacity else None
+                if shaders:
+                    self.oit_mids.add(mid)
 
-                if m.indices:
-                    m.indices.update({'ibo':vbo.VBO(m.indices['data'], target=GL_ELEMENT_ARRAY_BUFFER)})
-
-                for key in m.attribute:
-                    item = m.attribute[key]
-                    item.update({'bo': vbo.VBO(item['data'])})
- 
-                    if 'loc' not in item:
-                        item.update({'loc': glGetAttribLocation(m.program, key)})
- 
-                for key in m.uniform:
-                    item = m.uniform[key]
-                    if item['tag'] == 'texture':
-                        if item['data'].tid is None:
-                            item['data'].create_texture()
-                        item.update({'tid': item['data'].tid})
-                    elif item['tag'] == 'pmat':
-                        if 'v' not in item and 'f' not in item:
-                            item.update({'v': self.pmat})
-                    elif item['tag'] == 'vmat':
-                        if 'v' not in item and 'f' not in item:
-                            item.update({'v': self.vmat})
-                    elif item['tag'] == 'mmat':
-                        if 'v' not in item and 'f' not in item:
-                            item.update({'v': self.mmat})
-                        elif 'v' in item:
-                            item.update({'v': util.model_matrix(*item['v'])})
- 
-                    if 'loc' not in item:
-                        item.update({'loc': glGetUniformLocation(m.program, key)})
- 
-                glUseProgram(0)
+                self._load_model(m, shaders or m.shaders, *(self.batch_of[mid][1:] if i == 0 and mid in self.batch_of else ()))
+                m.listener = partial(self._model_updated, i, mid)
 
                 if m.opacity:
                     self.mns[i][0].append((mid, m.depth[self.haxis]))
@@ -392,6 +960,34 @@ class BaseScene:
             
             self.mns[i][1].sort(key=lambda item:item[1])
 
+        self.mns[0][0].sort(key=lambda item:self._state_key(self.scheme.models[0][item[0]])) # 不透明模型按着色器程序、纹理和绘制状态排序
+
+        self.aabb_mids, lo, hi = list(), list(), list()
+        for mid in self.scheme.models[0]:
+            aabb = self._world_aabb(self.scheme.models[0][mid])
+            if aabb:
+                self.aabb_mids.append(mid)
+                lo.append(aabb[0])
+                hi.append(aabb[1])
+
+        self.aabb_lo = np.array(lo).reshape(-1, 3)
+        self.aabb_hi = np.array(hi).reshape(-1, 3)
+
+        self.lod_mids, centers, radii, errors = list(), list(), list(), list()
+        for mid, lo, hi in zip(self.aabb_mids, self.aabb_lo, self.aabb_hi):
+            m = self.scheme.models[0][mid]
+            if m.lods:
+                k = np.linalg.norm(self._get_model_matrix(m)[:3,:3].astype(np.float64), axis=1).max() # 模型矩阵的最大缩放系数
+                self.lod_mids.append(mid)
+                centers.append((lo + hi)/2)
+                radii.append(np.linalg.norm(hi - lo)/2)
+                errors.append([item[2]*k for item in m.lods])
+
+        levels = max([len(item) for item in errors], default=0)
+        self.lod_centers = np.array(centers).reshape(-1, 3)
+        self.lod_radii = np.array(radii)
+        self.lod_errors = np.array([item + [np.inf]*(levels-len(item)) for item in errors]).reshape(len(errors), levels)
+
         dx = self.scheme.r_x[1]-self.scheme.r_x[0]
         dy = self.scheme.r_y[1]-self.scheme.r_y[0]
         dz = self.scheme.r_z[1]-self.scheme.r_z[0]
@@ -440,113 +1036,507 @@ class BaseScene:
         
         self.gl_init_done = True
 
-    def _render(self, m):
-        """绘制单个模型"""
+    def _load_model(self, m, shaders, vao=None, span=None):
+        """创建模型的着色器程序、缓冲区和顶点数组对象，获取变量位置并编译绘制命令
 
-        if not m.visible or m.slide and not m.slide(self.duration):
-            return
- 
+        m           - 模型
+        shaders     - 着色器源码和着色器类型组成的元组的列表
+        vao         - 合批成员模型共享的顶点数组对象，None表示创建模型自己的缓冲区和顶点数组对象
+        span        - 合批成员模型的图元、索引起始位置和数量组成的元组
+        """
+
+        m.program = self.program_cache.get_program(shaders)
+        self.gl_state.forget_program(m.program)
         glUseProgram(m.program)
-        tsid = 0
- 
-        for key in m.attribute:
-            loc = m.attribute[key].get('loc')
-            bo = m.attribute[key]['bo']
-            un = m.attribute[key]['un']
-            usize = m.attribute[key]['usize']
-            bo.bind()
-            glVertexAttribPointer(loc, un, GL_FLOAT, GL_FALSE, un*usize, bo)
-            glEnableVertexAttribArray(loc)
-            bo.unbind()
+
+        if vao:
+            m.vao = vao
+        else:
+            self._create_buffers(m)
+
+        if m.camera_block and self.ubo:
+            idx = glGetUniformBlockIndex(m.program, m.camera_block)
+            if idx != GL_INVALID_INDEX:
+                glUniformBlockBinding(m.program, idx, self._CAMERA_BINDING)
  
         for key in m.uniform:
-            tag = m.uniform[key]['tag']
-            loc = m.uniform[key].get('loc')
+            item = m.uniform[key]
+            if item['tag'] == 'texture':
+                if item['data'].tid is None:
+                    item['data'].create_texture()
+                item.update({'tid': item['data'].tid})
+            elif item['tag'] in ('pmat', 'vmat', 'mmat'):
+                if item.get('scene') or 'v' not in item and 'f' not in item: # 使用场景的矩阵，重复装配时改用新场景的矩阵
+                    item.update({'v': {'pmat':self.pmat, 'vmat':self.vmat, 'mmat':self.mmat}[item['tag']], 'scene': True})
+                elif item['tag'] == 'mmat' and 'v' in item:
+                    item.setdefault('seq', item['v'])   # 保留几何变换序列，重复装配时不会再次转换已经转换的矩阵
+                    item.update({'v': util.model_matrix(*item['seq'])})
  
-            if tag == 'pmat' or tag == 'vmat':
-                if 'v' in m.uniform[key]:
-                    glUniformMatrix4fv(loc, 1, GL_FALSE, m.uniform[key]['v'], None)
+            if 'loc' not in item:
+                item.update({'loc': glGetUniformLocation(m.program, key)})
+ 
+        glUseProgram(0)
+        self._compile_model(m, span)
+
+    def _create_buffers(self, m):
+        """创建模型自己的顶点属性和索引缓冲区，获取顶点属性位置，支持时创建顶点数组对象"""
+
+        if m.indices:
+            m.indices.update({'ibo':vbo.VBO(m.indices['data'], target=GL_ELEMENT_ARRAY_BUFFER)})
+
+        if m.interleaved or self.interleaved:
+            data = m.interleave()
+            if not data is None:
+                m.vbo = vbo.VBO(data)
+
+        for key in m.attribute:
+            item = m.attribute[key]
+            item.update({'bo': vbo.VBO(item['data']) if m.vbo is None else m.vbo})
+
+            if 'loc' not in item:
+                item.update({'loc': glGetAttribLocation(m.program, key)})
+
+        if self.vao_supported:
+            self._create_vao(m)
+
+    def _build_batches(self):
+        """将主视区中可合批的静态模型合并到共享的缓冲区中，成员模型仍各自拾取、剔除和设置可见性"""
+
+        groups = dict()
+        for mid, m in self.scheme.models[0].items():
+            key = batch_key(m)
+            if key:
+                groups.setdefault(key, list()).append(mid)
+
+        self.batches, self.batch_of = list(), dict()
+        for mids in groups.values():
+            if len(mids) < 2:
+                continue
+
+            b, spans = merge_models([self.scheme.models[0][mid] for mid in mids])
+            self._load_model(b, b.shaders)
+
+            for mid, (first, count) in zip(mids, spans):
+                self.batch_of.update({mid: (len(self.batches), b.vao, (b.gltype, first, count))})
+
+            self.batches.append({'model':b, 'setup':b.commands[:-1], 'spans':[(mid, *span) for mid, span in zip(mids, spans)]})
+
+    def _unbatch(self, mid):
+        """将合批成员模型移出合批，为其创建自己的缓冲区和顶点数组对象并重新编译绘制命令；着色器程序和uniform变量沿用装配时的结果"""
+
+        k = self.batch_of.pop(mid)[0]
+        self.batches[k]['spans'] = [item for item in self.batches[k]['spans'] if item[0] != mid]
+
+        m = self.scheme.models[0][mid]
+        m.vao = None
+        self._create_buffers(m)
+        self._compile_model(m)
+
+    def _model_updated(self, i, mid, m):
+        """模型数据更新的回调函数：记录等待上传的模型，标记场景需要重绘"""
+
+        self.updated.add((i, mid))
+        self.dirty = True
+        self._request_redraw()
+
+    def _apply_updates(self):
+        """将模型更新的顶点属性和索引数据上传到显存，顶点、索引或实例数量改变时重新编译绘制命令"""
+
+        if not self.updated:
+            return
+
+        if self.vao_supported:
+            glBindVertexArray(0)                        # 避免绑定索引缓冲区时改变顶点数组对象的状态
+            self.gl_state.reset()
+
+        for i, mid in list(self.updated):
+            m = self.scheme.models[i][mid]
+            rows = [(m.instances if 'divisor' in item else m.vshape[0])*item['un'] for item in m.attribute.values()]
+            if any([item['data'].size != n for item, n in zip(m.attribute.values(), rows)]):
+                continue                                # 各顶点属性长度不一致，等待其余顶点属性的更新
+
+            self.updated.discard((i, mid))
+            if i == 0 and mid in self.batch_of:
+                m.pending.clear()
+                self._unbatch(mid)                      # 合批成员模型移出合批后以更新后的数据创建缓冲区
+            else:
+                self._upload_model(m)
+
+            if i == 0 and mid in self.aabb_mids:
+                k = self.aabb_mids.index(mid)
+                aabb = self._world_aabb(m)
+                if aabb:
+                    self.aabb_lo[k], self.aabb_hi[k] = aabb
                 else:
-                    glUniformMatrix4fv(loc, 1, GL_FALSE, m.uniform[key]['f'](self.duration), None)
+                    del self.aabb_mids[k]
+                    self.aabb_lo = np.delete(self.aabb_lo, k, axis=0)
+                    self.aabb_hi = np.delete(self.aabb_hi, k, axis=0)
+
+    def _upload_model(self, m):
+        """上传模型等待更新的数据，数据长度改变时重新编译绘制命令"""
+
+        pending, resized = dict(), False
+        while m.pending:
+            key, rows = m.pending.popitem()
+            pending.update({key: rows})
+            resized = resized or rows is None
+
+        if None in pending:
+            self._upload_buffer(m.indices['ibo'], m.indices['data'], pending.pop(None))
+
+        if m.vbo is not None and pending:
+            if None in pending.values():
+                m.vbo.set_array(m.interleave())
+                self._upload_buffer(m.vbo, m.vbo.data, None)
+            else:
+                ranges = sorted(set(sum(pending.values(), list())))
+                for lo, hi in ranges:
+                    for item in m.attribute.values(): # 交错缓冲区中改变的行按各顶点属性的当前数据重写
+                        col = item['offset'] // item['usize']
+                        m.vbo.data[lo:hi, col:col+item['un']] = item['data'].reshape(-1, item['un'])[lo:hi]
+                self._upload_buffer(m.vbo, m.vbo.data, ranges)
+        else:
+            for key, rows in pending.items():
+                item = m.attribute[key]
+                self._upload_buffer(item['bo'], item['data'].reshape(-1, item['un']), rows)
+
+        if resized:
+            self._compile_model(m)
+
+    def _upload_buffer(self, bo, data, rows):
+        """以glBufferSubData更新缓冲区中改变的行，rows为None时以glBufferData重新分配缓冲区（孤立原来的存储空间）
+
+        bo          - 缓冲区对象
+        data        - 缓冲区全部数据
+        rows        - 改变的行范围列表，None表示全部
+        """
+
+        data = np.ascontiguousarray(data)
+        glBindBuffer(bo.target, int(bo))
+
+        if rows is None:
+            bo.set_array(data)
+            glBufferData(bo.target, data.nbytes, data, bo.usage)
+            bo.copied = True
+            self.uploads += 1
+        else:
+            row = data[:1].nbytes
+            for lo, hi in rows:
+                if hi > lo:
+                    glBufferSubData(bo.target, lo*row, (hi-lo)*row, data[lo:hi])
+                    self.uploads += 1
+
+        glBindBuffer(bo.target, 0)
+
+    def _state_key(self, m):
+        """返回模型绘制状态的排序键：着色器程序、纹理和绘制状态相同的模型相邻绘制，可减少状态切换"""
+
+        tids = tuple(item['tid'] for item in m.uniform.values() if item['tag'] == 'texture')
+        return (int(m.program), tids, str(sorted(m.state.items())))
+
+    def _check_vao(self):
+        """返回当前GL上下文是否支持顶点数组对象"""
+
+        if not bool(glGenVertexArrays):
+            return False
+
+        try:
+            vao = glGenVertexArrays(1)
+            glDeleteVertexArrays(1, [vao])
+        except Exception:
+            return False
+
+        return True
+
+    def _create_camera_ubo(self):
+        """创建相机uniform缓冲区对象并绑定到相机绑定点，不支持时返回None"""
+
+        try:
+            ubo = glGenBuffers(1)
+            glBindBuffer(GL_UNIFORM_BUFFER, ubo)
+            glBufferData(GL_UNIFORM_BUFFER, self.camera_data.nbytes, None, GL_DYNAMIC_DRAW)
+            glBindBuffer(GL_UNIFORM_BUFFER, 0)
+            glBindBufferBase(GL_UNIFORM_BUFFER, self._CAMERA_BINDING, ubo)
+        except Exception:
+            return None
+
+        return ubo
+
+    def _update_camera_ubo(self):
+        """更新相机uniform块：投影矩阵、视点矩阵、相机位置、渲染时间戳、方位角和高度角，每帧只上传一次"""
+
+        if not self.ubo:
+            return
+
+        self.camera_data[:16] = self.pmat.ravel()
+        self.camera_data[16:32] = self.vmat.ravel()
+        self.camera_data[32:35] = self.cam
+        self.camera_data[35] = self.duration
+        self.camera_data[36:38] = self.azim, self.elev
+
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, self.camera_data.nbytes, self.camera_data)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        self.uploads += 1
+
+    def _create_vao(self, m):
+        """将模型的顶点属性和索引缓冲区布局记录到顶点数组对象中"""
+
+        m.vao = glGenVertexArrays(1)
+        glBindVertexArray(m.vao)
+
+        for key in m.attribute:
+            item = m.attribute[key]
+            if item['loc'] < 0:
+                continue
+
+            item['bo'].bind()
+            for loc, un, stride, pointer in self._attrib_slots(item):
+                glVertexAttribPointer(loc, un, GL_FLOAT, GL_FALSE, stride, pointer)
+                glEnableVertexAttribArray(loc)
+                if 'divisor' in item:
+                    glVertexAttribDivisor(loc, item['divisor'])
+
+        if m.indices:
+            m.indices['ibo'].bind()
+
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def _attrib_layout(self, item):
+        """返回顶点属性的步长和缓冲区指针，交错存储时指针带有该属性的字节偏移量"""
+
+        if 'offset' in item:
+            return item['stride'], item['bo'] + item['offset']
+
+        return item['un']*item['usize'], item['bo']
+
+    def _attrib_slots(self, item):
+        """返回顶点属性占用的各个位置、分量数、步长和缓冲区指针组成的元组的列表，mat4类型的属性按列占用4个连续位置"""
+
+        stride, pointer = self._attrib_layout(item)
+        if item['un'] != 16:
+            return [(item['loc'], item['un'], stride, pointer)]
+
+        return [(item['loc']+k, 4, stride, pointer + 4*k*item['usize']) for k in range(4)]
+
+    def _compile_model(self, m, span=None):
+        """将模型的绘制过程编译为预先绑定参数的GL命令列表，逐帧只需依次执行"""
+
+        cmds = [partial(self.gl_state.use_program, m.program)]
+
+        if m.vao:
+            cmds.append(partial(self.gl_state.bind_vertex_array, m.vao))
+        else:
+            for key in m.attribute:
+                item = m.attribute[key]
+                cmds.append(item['bo'].bind)
+                for loc, un, stride, pointer in self._attrib_slots(item):
+                    cmds.append(partial(glVertexAttribPointer, loc, un, GL_FLOAT, GL_FALSE, stride, pointer))
+                    cmds.append(partial(glEnableVertexAttribArray, loc))
+                    if 'divisor' in item:
+                        cmds.append(partial(glVertexAttribDivisor, loc, item['divisor']))
+                cmds.append(item['bo'].unbind)
+
+        tsid, ucount = 0, 0
+        for key in m.uniform:
+            item = m.uniform[key]
+            tag = item['tag']
+            loc = item.get('loc')
+
+            if tag == 'texture':
+                cmds.append(partial(self.gl_state.bind_texture, GL_TEXTURE0+tsid, item['data'].ttype, item['tid']))
+                if loc >= 0:
+                    cmds.append(partial(self.gl_state.set_sampler, m.program, loc, tsid))
+                tsid += 1
+                continue
+
+            if loc < 0:                                 # 着色器中不存在或未使用的变量（如相机uniform块的成员），不必上传
+                continue
+
+            ucount += 1
+            if tag in ('pmat', 'vmat'):
+                if 'v' in item:
+                    cmds.append(partial(glUniformMatrix4fv, loc, 1, GL_FALSE, item['v'], None))
+                else:
+                    cmds.append(lambda loc=loc, f=item['f']: glUniformMatrix4fv(loc, 1, GL_FALSE, f(self.duration), None))
             elif tag == 'mmat':
-                if 'v' in m.uniform[key]:
-                    glUniformMatrix4fv(loc, 1, GL_FALSE, m.uniform[key]['v'], None)
+                if 'v' in item:
+                    cmds.append(partial(glUniformMatrix4fv, loc, 1, GL_FALSE, item['v'], None))
                 else:
-                    args = m.uniform[key]['f'](self.duration)
-                    mmat = util.model_matrix(*args)
-                    glUniformMatrix4fv(loc, 1, GL_FALSE, mmat, None)
-            elif tag == 'texture':
-                eval('glActiveTexture(GL_TEXTURE%d)'%tsid)
-                glBindTexture(m.uniform[key]['data'].ttype, m.uniform[key]['tid'])
-                glUniform1i(loc, tsid)
-                tsid += 1
+                    cmds.append(lambda loc=loc, f=item['f']: glUniformMatrix4fv(loc, 1, GL_FALSE, util.model_matrix(*f(self.duration)), None))
             elif tag == 'picked':
-                glUniform1i(loc, m.picked)
+                cmds.append(lambda loc=loc: glUniform1i(loc, m.picked))
             elif tag == 'timestamp':
-                glUniform1f(loc, self.duration)
+                cmds.append(lambda loc=loc: glUniform1f(loc, self.duration))
             elif tag == 'campos':
-                glUniform3f(loc, *self.cam)
+                cmds.append(lambda loc=loc: glUniform3f(loc, *self.cam))
             elif tag == 'ae':
-                glUniform2f(loc, self.azim, self.elev)
+                cmds.append(lambda loc=loc: glUniform2f(loc, self.azim, self.elev))
             elif tag == 'tsize':
-                k = 0.3/(32*self.scale)
-                tw, th = m.uniform[key].get('v')
-                glUniform2f(loc, tw*k/self.aspect, th*k)
+                tw, th = item.get('v')
+                cmds.append(lambda loc=loc, tw=tw, th=th: glUniform2f(loc, tw*0.3/(32*self.scale*self.aspect), th*0.3/(32*self.scale)))
             else:
-                value = m.uniform[key].get('v')
-                if value is None:
-                    value = m.uniform[key].get('f')(self.duration)
-                
-                dtype = m.uniform[key]['dtype']
-                ndim = m.uniform[key]['ndim']
-                if ndim is None:
-                    try:
-                        eval('glUniform%s(loc, value)'%dtype)
-                    except:
-                        print('渲染函数出现异常，请通知xufive@gmail.com，如可能的话，请提供shader源码。')
+                func = getattr(GL, 'glUniform%s'%item['dtype'])
+                args = (loc,) if item['ndim'] is None else (loc, item['ndim'])
+
+                if 'v' in item:
+                    cmds.append(partial(self._set_uniform, func, *args, item['v']))
                 else:
-                    eval('glUniform%s(loc, ndim, value)'%dtype)
+                    cmds.append(lambda func=func, args=args, f=item['f']: self._set_uniform(func, *args, f(self.duration)))
 
+        cmds.append(partial(self.gl_state.apply, m.state))
         for glcmd, args in m.before:
-            glcmd(*args)
- 
-        if m.indices:
-            m.indices['ibo'].bind()
-            glDrawElements(m.gltype, m.indices['n'], GL_UNSIGNED_INT, None)
-            m.indices['ibo'].unbind()
+            cmds.append(partial(glcmd, *args))
+
+        if span:
+            gltype, first, count = span
+            draw_elements = partial(glDrawElements, gltype, count, GL_UNSIGNED_INT, ctypes.c_void_p(4*first))
+            draw_arrays = None                          # 合批成员模型只绘制合批索引缓冲区中的一段
+            vertices = indices = count
+        elif m.lods:
+            draw_elements = partial(self._draw_lod, m)
+            draw_arrays = None
+            vertices = indices = 0                      # 按当前层次统计
+        elif m.stream:
+            draw_elements = None
+            draw_arrays = partial(self._draw_stream, m)
+            vertices = indices = 0                      # 按有效数据统计
+        elif m.instances:
+            draw_elements = partial(glDrawElementsInstanced, m.gltype, m.indices['n'], GL_UNSIGNED_INT, None, m.instances) if m.indices else None
+            draw_arrays = partial(glDrawArraysInstanced, m.gltype, 0, m.vshape[0], m.instances)
+            vertices = (m.indices['n'] if m.indices else m.vshape[0]) * m.instances
+            indices = vertices if m.indices else 0
         else:
-            glDrawArrays(m.gltype, 0, m.vshape[0])
- 
+            draw_elements = partial(glDrawElements, m.gltype, m.indices['n'], GL_UNSIGNED_INT, None) if m.indices else None
+            draw_arrays = partial(glDrawArrays, m.gltype, 0, m.vshape[0])
+            vertices = m.indices['n'] if m.indices else m.vshape[0]
+            indices = vertices if m.indices else 0
+
+        if m.vao:
+            cmds.append(draw_elements or draw_arrays)
+        elif m.indices:
+            cmds.append(m.indices['ibo'].bind)
+            cmds.append(draw_elements)
+            cmds.append(m.indices['ibo'].unbind)
+        else:
+            cmds.append(draw_arrays)
+
+        if not m.vao:
+            for item in m.attribute.values():
+                if 'divisor' in item:
+                    for slot in self._attrib_slots(item):
+                        cmds.append(partial(glVertexAttribDivisor, slot[0], 0)) # 未使用顶点数组对象时，恢复逐顶点读取
+
         for glcmd, args in m.after:
-            glcmd(*args)
- 
-        glUseProgram(0)
+            cmds.append(partial(glcmd, *args))
+
+        m.commands = cmds
+        m.vcount = vertices
+        m.icount = indices
+        m.ucount = ucount                               # 每次绘制执行的glUniform调用次数（不含只在改变时上传的采样器）
+
+    def _draw_lod(self, m):
+        """绘制细节层次模型的当前层次"""
+
+        first, count, err = m.lods[m.lod]
+        glDrawElements(m.gltype, count, GL_UNSIGNED_INT, ctypes.c_void_p(4*first))
+
+    def _draw_stream(self, m):
+        """绘制流式数据模型环形缓冲区中的有效数据：写满之后按从早到晚的顺序分两段绘制"""
+
+        capacity, head, count = m.stream
+        if count < capacity or head == 0 or m.gltype == GL_POINTS:
+            glDrawArrays(m.gltype, 0, count)
+        else:
+            glMultiDrawArrays(m.gltype, np.array([head, 0], dtype=np.int32), np.array([capacity+1-head, head], dtype=np.int32), 2)
+
+    def _set_uniform(self, func, *args):
+        """设置通用uniform变量"""
+
+        try:
+            func(*args)
+        except GLError as e:
+            logger.error('设置uniform变量失败（%s，location=%s）：%s', getattr(func, '__name__', func), args[0] if args else None, e)
+            raise
+
+    def _render(self, m):
+        """绘制单个模型，返回是否绘制"""
+
+        if not m.visible or m.slide and not m.slide(self.duration):
+            return False
+
+        for cmd in m.commands:
+            cmd()
+
+        return True
 
     def _clear_buffer(self):
         """删除纹理、顶点缓冲区等显存对象"""
 
-        for i in range(3):
-            for name in self.scheme.models[i]:
-                m = self.scheme.models[i][name]
-                #for item in m.cshaders:
-                #    glDeleteShader(item)
-                
-                if m.program:
-                    glDeleteProgram(m.program)
-                
-                if m.indices and 'ibo' in m.indices:
-                    m.indices['ibo'].delete()
-                
-                for key in m.attribute:
-                    if 'bo' in m.attribute[key]:
-                        m.attribute[key]['bo'].delete()
-                
-                textures = list()
-                for key in m.uniform:
-                    if 'texture' in m.uniform[key]:
-                        textures.append(m.attribute[key]['texture'])
-                if textures:
-                    glDeleteTextures(len(textures), textures)
+        models = [(name, m) for i in range(3) for name, m in self.scheme.models[i].items()]
+        models += [(None, batch['model']) for batch in self.batches]
+        textures = dict()                               # 多个模型可能共用同一个纹理对象
+
+        for name, m in models:
+            if m.program:
+                self.program_cache.release(m.program)
+                m.program = None
+
+            m.listener = None
+            m.pending.clear()
+
+            if m.vao and name not in self.batch_of:     # 合批成员模型共享合批的顶点数组对象
+                glDeleteVertexArrays(1, [m.vao])
+            m.vao = None
+            
+            if m.indices and 'ibo' in m.indices:
+                m.indices['ibo'].delete()
+            
+            for key in m.attribute:
+                if 'bo' in m.attribute[key]:
+                    m.attribute[key]['bo'].delete()
+            m.vbo = None
+            
+            for key in m.uniform:
+                item = m.uniform[key]
+                if item['tag'] == 'texture':
+                    item.pop('tid', None)
+                    if item['data'].tid is not None:
+                        textures.update({id(item['data']): item['data']})
+
+        if textures:
+            glDeleteTextures(len(textures), [int(texture.tid) for texture in textures.values()])
+            for texture in textures.values():
+                texture.tid = None
+
+        self.batches, self.batch_of = list(), dict()
+        self.updated.clear()
+
+        if self.ubo:
+            glDeleteBuffers(1, [self.ubo])
+            self.ubo = None
+
+        self._delete_pick_fbo()
+
+        if self.oit:
+            self.oit.clear()
+
+        if self.reader:
+            self.reader.delete()
+            self.reader = None
+
+        if self.profiler:
+            self.profiler.delete()
+
+    def _profile_stats(self):
+        """返回滑动窗口内逐模型和逐部件的CPU和GPU平均耗时（毫秒），未开启性能分析时返回None"""
+
+        if self.profiler is None:
+            return None
+
+        return self.profiler.stats(widgets=self.scheme.widgets)
 
     def _set_visible(self, name, visible):
         """设置部件或模型的可见性
@@ -561,3 +1551,5 @@ class BaseScene:
         elif name in self.scheme.models[0]:
             self.scheme.models[0][name].visible = visible
 
+        self.dirty = True
+
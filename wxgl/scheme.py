@@ -13,11 +13,12 @@ PLATFORM = sys.platform.lower()
 class Scheme:
     """应用于三维场景中的展示方案类"""
 
-    def __init__(self, haxis='y', bg=(0.0,0.0,0.0)):
+    def __init__(self, haxis='y', bg=(0.0,0.0,0.0), lod=False):
         """构造函数
 
         haxis       - 高度轴，默认y轴，可选z轴，不支持x轴
         bg          - 背景色，默认0.0, 0.0, 0.0)
+        lod         - 球、球环、圆柱、圆锥和圆管默认生成多个细分层次，绘制时按屏幕空间误差选择，默认False
         """
 
         self._reset()
@@ -25,6 +26,7 @@ class Scheme:
         self.haxis = haxis.lower()                              # 高度轴
         self.bg = util.format_color(bg)                         # 背景色
         self.fg = 1 - self.bg                                   # 前景色
+        self.lod = lod                                          # 生成细节层次（LOD）
 
     def _reset(self):
         """清除模型数据"""
@@ -34,10 +36,13 @@ class Scheme:
         self.r_z = [1e12, -1e12]                                # 数据在z轴上的动态范围
         self.cid = -1                                           # 缺省颜色id
         self.expost = dict()                                    # 需要在模型空间确定后绘制的模型，比如网格或坐标轴 
+        self.expost_mids = list()                               # 已生成的网格和坐标轴模型id
+        self.expost_range = None                                # 生成网格和坐标轴之前和之后的数据动态范围
         self.cruise_func = None                                 # 相机巡航函数
         self.alive = False                                      # 是否使用了动画函数
         self.models = [dict(), dict(), dict()]                  # 主视区、标题区、调色板区模型
         self.widgets = dict()                                   # 由一个或多个模型组成的部件
+        self.captured = None                                    # 非None时，新增的模型暂存于此列表而不加入场景
 
     def _set_range(self, r_x=None, r_y=None, r_z=None):
         """设置坐标轴范围"""
@@ -283,6 +288,61 @@ class Scheme:
             color = self._format_color(color, rows*cols)
             self.model(light.get_model(gltype, vs, normal=normal, color=color, indices=indices, **kwds), name)
 
+    def _lod(self, func, args, cell, radius, **kwds):
+        """按细分精度cell、2cell、4cell……（不超过45°）生成图元的多个细分层次，合并为一个细节层次模型
+
+        func        - 图元方法
+        args        - 图元方法的位置参数
+        cell        - 最精细层次的细分精度
+        radius      - 图元圆周的最大半径，用于计算各层次的几何误差
+        kwds        - 图元方法的关键字参数
+        """
+
+        color = kwds.get('color')
+        if not (color is None or isinstance(color, str) or np.ndim(color) == 1): # 逐顶点颜色无法用于其他层次
+            return func(*args, cell=cell, lod=False, **kwds)
+
+        name = kwds.pop('name') if 'name' in kwds else None
+        if kwds.get('data') is None:
+            kwds.update({'color': self._format_color(color)})
+
+        cells = [cell*2**k for k in range(8) if k == 0 or cell*2**k <= 45]
+        errors = [radius*(1-np.cos(np.radians(c)/2)) for c in cells] # 弦到圆弧的最大距离
+
+        self.captured = list()
+        try:
+            for c in cells:
+                func(*args, cell=c, lod=False, **kwds)
+            levels = self.captured
+        finally:
+            self.captured = None
+
+        levels[0].set_lods(levels[1:], errors)
+        self.model(levels[0], name)
+
+    def _expost_models(self):
+        """生成需要在模型空间确定后绘制的网格和坐标轴：同一展示方案多次装配时，先删除此前生成的模型，恢复生成之前的动态范围"""
+
+        if self.expost_range and self.expost_range[1] == (list(self.r_x), list(self.r_y), list(self.r_z)):
+            self.r_x, self.r_y, self.r_z = [list(r) for r in self.expost_range[0]]
+
+        for mid in self.expost_mids:
+            m = self.models[0].pop(mid, None)
+            if m and m.name in self.widgets:
+                self.widgets[m.name].remove(mid)
+                if not self.widgets[m.name]:
+                    del self.widgets[m.name]
+
+        mids = set(self.models[0])
+        before = (list(self.r_x), list(self.r_y), list(self.r_z))
+        if 'grid' in self.expost:
+            self._grid()
+        if 'axes' in self.expost:
+            self._axes()
+
+        self.expost_mids = [mid for mid in self.models[0] if mid not in mids]
+        self.expost_range = (before, (list(self.r_x), list(self.r_y), list(self.r_z)))
+
     def _axes(self):
         """坐标轴"""
 
@@ -918,6 +978,10 @@ class Scheme:
     def model(self, m, name=None):
         """添加模型"""
 
+        if not self.captured is None:
+            self.captured.append(m)
+            return
+
         m.verify()
 
         if m.inside:
@@ -1116,6 +1180,89 @@ class Scheme:
 
         self._line(vs, GL_LINES, **kwds)
 
+    def stream(self, vs, capacity, **kwds):
+        """流式数据序列：顶点存储于固定容量的环形缓冲区，调用append方法追加数据，超出容量时覆盖最早的数据
+
+        vs          - 初始顶点集：元组、列表或numpy数组，shape=(n,2|3)，n可以为0
+        capacity    - 环形缓冲区容量（顶点数量）
+        kwds        - 关键字参数
+            style       - 绘制风格：'line' - 连点成线（默认），'point' - 散列点
+            color       - 颜色或颜色集：预定义颜色、十六进制颜色，或者浮点型元组、列表或numpy数组，值域范围[0,1]
+            size        - 点的大小，默认3.0，仅用于散列点
+            width       - 线宽：0.0~10.0之间，默认1.0，仅用于连点成线
+            stipple     - 线型：'solid' - 实线（默认），'dashed' - 虚线，'doted' - 点线，'dash-dot' - 点虚线，仅用于连点成线
+            visible     - 是否可见，默认True
+            inside      - 模型顶点是否影响模型空间，默认True（无初始数据时为False）
+            slide       - 幻灯片函数，默认None
+            transform   - 由旋转、平移和缩放组成的模型几何变换序列，默认None
+            ambient     - 环境光，默认(1.0,1.0,1.0)
+            name        - 模型或部件名，追加数据时使用
+        """
+
+        keys = ['style', 'color', 'size', 'width', 'stipple', 'visible', 'inside', 'slide', 'transform', 'ambient', 'name']
+        for key in kwds:
+            if key not in keys:
+                raise KeyError('不支持的关键字参数：%s'%key)
+
+        style = kwds.pop('style') if 'style' in kwds else 'line'
+        if style not in ('line', 'point'):
+            raise ValueError('不支持的绘制风格：%s'%style)
+
+        vs = np.array(vs, dtype=np.float32)
+        n = vs.shape[0] if vs.size else 0
+        if n == 0:
+            vs = np.zeros((1, 3), dtype=np.float32)     # 无初始数据时以一个无效顶点携带颜色等默认数据
+            kwds.update({'inside': False})
+
+        self.captured = list()
+        if style == 'line':
+            kwds.pop('size', None)
+            self._line(vs, GL_LINE_STRIP, **kwds)
+        else:
+            light = ScatterLight(kwds.get('ambient', (1.0,1.0,1.0)))
+            self.model(light.get_model(GL_POINTS, vs, 
+                color       = self._format_color(kwds.get('color'), vs.shape[0]), 
+                psize       = np.ones(vs.shape[0], dtype=np.float32) * kwds.get('size', 3.0),
+                texture     = None,
+                visible     = kwds.get('visible', True),
+                inside      = kwds.get('inside', True),
+                slide       = kwds.get('slide'),
+                transform   = kwds.get('transform')
+            ))
+
+        m, self.captured = self.captured[0], None
+        m.set_stream(capacity, n)
+        self.model(m, kwds.get('name'))
+
+    def append(self, name, vs, color=None):
+        """向流式数据序列追加数据，超出容量时覆盖最早的数据
+
+        name        - 流式数据序列的模型或部件名
+        vs          - 顶点集：元组、列表或numpy数组，shape=(n,2|3)
+        color       - 颜色或颜色集：预定义颜色、十六进制颜色，或者浮点型元组、列表或numpy数组，默认沿用最近一个顶点的颜色
+        """
+
+        if name in self.widgets:
+            mids = self.widgets[name]
+        elif name in self.models[0]:
+            mids = [name]
+        else:
+            raise KeyError('不存在的模型或部件名：%s'%name)
+
+        vs = np.array(vs, dtype=np.float32)
+        vs = vs.reshape(-1, vs.shape[-1])
+
+        for mid in mids:
+            m = self.models[0][mid]
+            data = dict()
+            for key, item in m.attribute.items():
+                if item['tag'] == 'vertex':
+                    data.update({key: vs})
+                elif item['tag'] == 'color' and not color is None:
+                    data.update({key: self._format_color(color, vs.shape[0])})
+
+            m.append(data)
+
     def surface(self, vs, **kwds):
         """曲面
 
@@ -1257,6 +1404,7 @@ class Scheme:
             color       - 颜色或颜色集：预定义颜色、十六进制颜色，或者浮点型元组、列表或numpy数组，值域范围[0,1]
             arc         - 弧度角范围：默认0°~360°
             cell        - 圆周分片精度：默认5°
+            lod         - 生成多个细分层次，绘制时按屏幕空间误差选择，默认与App类的lod参数相同
             visible     - 是否可见，默认True
             inside      - 模型顶点是否影响模型空间，默认True
             opacity     - 模型不透明属性，默认不透明
@@ -1271,6 +1419,10 @@ class Scheme:
         color = kwds.pop('color') if 'color' in kwds else None
         arc = kwds.pop('arc') if 'arc' in kwds else (0,360)
         cell = kwds.pop('cell') if 'cell' in kwds else 5
+        lod = kwds.pop('lod') if 'lod' in kwds else self.lod
+
+        if lod:
+            return self._lod(self.cone, (spire, center, r), cell, r, color=color, arc=arc, **kwds)
 
         spire = np.array(spire)
         center = np.array(center)
@@ -1301,6 +1453,7 @@ class Scheme:
             color       - 颜色：浮点型元组、列表或numpy数组
             arc         - 弧度角范围：默认0°~360°
             cell        - 圆周分片精度：默认5°
+            lod         - 生成多个细分层次，绘制时按屏幕空间误差选择，默认与App类的lod参数相同
             visible     - 是否可见，默认True
             inside      - 模型顶点是否影响模型空间，默认True
             opacity     - 模型不透明属性，默认不透明
@@ -1315,6 +1468,10 @@ class Scheme:
         color = kwds.pop('color') if 'color' in kwds else None
         arc = kwds.pop('arc') if 'arc' in kwds else (0,360)
         cell = kwds.pop('cell') if 'cell' in kwds else 5
+        lod = kwds.pop('lod') if 'lod' in kwds else self.lod
+
+        if lod:
+            return self._lod(self.cylinder, (c1, c2, r), cell, r, color=color, arc=arc, **kwds)
 
         c1 = np.array(c1)
         c2 = np.array(c2)
@@ -1347,6 +1504,7 @@ class Scheme:
             data        - 数据集：元组、列表或numpy数组，shape=(n,)
             cm          - 调色板
             cell        - 圆周分片精度：默认5°
+            lod         - 生成多个细分层次，绘制时按屏幕空间误差选择，默认与App类的lod参数相同
             visible     - 是否可见，默认True
             inside      - 模型顶点是否影响模型空间，默认True
             opacity     - 模型不透明属性，默认不透明
@@ -1362,8 +1520,12 @@ class Scheme:
         data = kwds.pop('data') if 'data' in kwds else None
         cm = kwds.pop('cm') if 'cm' in kwds else 'viridis'
         cell = kwds.pop('cell') if 'cell' in kwds else 5
+        lod = kwds.pop('lod') if 'lod' in kwds else self.lod
         gltype = GL_QUADS
 
+        if lod:
+            return self._lod(self.pipe, (vs, r), cell, r, color=color, data=data, cm=cm, **kwds)
+
         vs = np.array(vs, dtype=np.float32).reshape(-1,3)
         rows, cols = vs.shape[0], int(360/cell)+1
         circles = list()
@@ -1396,6 +1558,7 @@ class Scheme:
             uarc        - u方向范围：默认0°~360°
             varc        - v方向范围：默认-90°~90°
             cell        - 网格精度：默认5°
+            lod         - 生成多个细分层次，绘制时按屏幕空间误差选择，默认与App类的lod参数相同
             visible     - 是否可见，默认True
             inside      - 模型顶点是否影响模型空间，默认True
             opacity     - 模型不透明属性，默认不透明
@@ -1412,6 +1575,10 @@ class Scheme:
         uarc = kwds.pop('uarc') if 'uarc' in kwds else (0,360)
         varc = kwds.pop('varc') if 'varc' in kwds else (-90,90)
         cell = kwds.pop('cell') if 'cell' in kwds else 5
+        lod = kwds.pop('lod') if 'lod' in kwds else self.lod
+
+        if lod:
+            return self._lod(self.sphere, (center, r), cell, r, color=color, vec=vec, uarc=uarc, varc=varc, **kwds)
 
         u0, u1 = np.radians(uarc[0]), np.radians(uarc[1])
         v0, v1 = np.radians(varc[1]), np.radians(varc[0])
@@ -1523,6 +1690,7 @@ class Scheme:
             uarc        - u方向范围：默认0°~360°
             varc        - v方向范围：默认0°~360°
             cell        - 圆周分片精度：默认5°
+            lod         - 生成多个细分层次，绘制时按屏幕空间误差选择，默认与App类的lod参数相同
             visible     - 是否可见，默认True
             inside      - 模型顶点是否影响模型空间，默认True
             opacity     - 模型不透明属性，默认不透明
@@ -1539,6 +1707,10 @@ class Scheme:
         uarc = kwds.pop('uarc') if 'uarc' in kwds else (0,360)
         varc = kwds.pop('varc') if 'varc' in kwds else (0,360)
         cell = kwds.pop('cell') if 'cell' in kwds else 5
+        lod = kwds.pop('lod') if 'lod' in kwds else self.lod
+
+        if lod:
+            return self._lod(self.torus, (center, r1, r2), cell, r1+r2, color=color, vec=vec, uarc=uarc, varc=varc, **kwds)
 
         u_0, u_1 = np.radians(uarc[0]), np.radians(uarc[1])
         v_0, v_1 = np.radians(varc[1]), np.radians(varc[0])
@@ -1608,3 +1780,78 @@ class Scheme:
                 return self.scatter(ds.xyz, color=ds.rgb, size=size)
         else:
             raise RuntimeError(ds.info)
+
+    def instances(self, model_or_primitive, transforms, colors=None, **kwds):
+        """实例化绘制：同一个模型按多个模型矩阵绘制多次，全部实例只需一次绘制调用
+
+        model_or_primitive  - 光照模型返回的wxgl.Model对象，或图元名：'sphere', 'cube', 'cone', 'cylinder', 'circle', 'torus'
+            sphere      - 球心位于原点、半径为1的球
+            cube        - 中心位于原点、棱长为1的立方体
+            cone        - 锥底圆心位于原点、半径为1，锥尖位于(0,1,0)的圆锥
+            cylinder    - 端面圆心位于原点和(0,1,0)、半径为1的圆柱
+            circle      - 圆心位于原点、半径为1的圆
+            torus       - 中心位于原点、球半径为0.25、环半径为1的球环
+        transforms  - 各实例的几何变换：numpy数组或可转为numpy数组的对象
+            shape=(n,3)     - 实例的平移向量
+            shape=(n,4)     - 实例的平移向量和缩放系数
+            shape=(n,4,4)   - 实例的模型矩阵
+            也可以是由各实例的旋转、平移和缩放组成的几何变换序列的列表
+        colors      - 各实例的颜色：None表示使用模型的顶点颜色，预定义颜色、十六进制颜色，或者浮点型元组、列表或numpy数组，shape=(n,3|4)
+        kwds        - 关键字参数：图元的关键字参数（如color、cell、light、cull、fill等），model_or_primitive为模型对象时仅支持name
+            name        - 模型或部件名
+        """
+
+        primitives = {
+            'sphere':   ((0,0,0), 1),
+            'cube':     ((0,0,0), 1),
+            'cone':     ((0,1,0), (0,0,0), 1),
+            'cylinder': ((0,1,0), (0,0,0), 1),
+            'circle':   ((0,0,0), 1),
+            'torus':    ((0,0,0), 0.25, 1)
+        }
+
+        if not isinstance(model_or_primitive, str):
+            for key in kwds:
+                if key != 'name':
+                    raise KeyError('不支持的关键字参数：%s'%key)
+
+        name = kwds.pop('name') if 'name' in kwds else None
+
+        if isinstance(model_or_primitive, str):
+            if model_or_primitive not in primitives:
+                raise ValueError('不支持的图元：%s'%model_or_primitive)
+
+            if model_or_primitive in ('sphere', 'cone', 'cylinder', 'torus'):
+                kwds.update({'lod': False})             # 全部实例共用同一个网格
+
+            self.captured = list()
+            try:
+                getattr(self, model_or_primitive)(*primitives[model_or_primitive], **kwds)
+                m = self.captured[0]
+            finally:
+                self.captured = None
+        else:
+            m = model_or_primitive
+
+        try:
+            mats = np.array(transforms, dtype=np.float64)
+        except ValueError:
+            mats = np.zeros(0)
+
+        if mats.ndim == 2 and mats.shape[-1] in (3, 4):
+            shift, k = mats[:,:3], mats[:,3] if mats.shape[-1] == 4 else np.ones(mats.shape[0])
+            mats = np.zeros((mats.shape[0], 4, 4))
+            mats[:,0,0], mats[:,1,1], mats[:,2,2], mats[:,3,3] = k, k, k, 1
+            mats[:,3,:3] = shift
+        elif mats.ndim != 3 or mats.shape[1:] != (4, 4):
+            mats = np.array([util.model_matrix(*item) for item in transforms], dtype=np.float64)
+
+        m.set_instances('a_InstanceMatrix', mats)
+
+        if not colors is None:
+            if 'a_Color' not in m.attribute:
+                raise ValueError('模型不支持实例颜色')
+
+            m.set_instance_color('a_Color', self._format_color(colors, mats.shape[0]))
+
+        self.model(m, name)
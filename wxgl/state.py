@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+from OpenGL.GL import *
+
+class GLState:
+    """GL渲染状态跟踪器：记录当前的着色器程序、顶点数组对象、纹理绑定和模型绘制状态，只在状态改变时调用GL函数"""
+
+    DEFAULT = {
+        'cull':         None,                           # 剔除的面，None表示不剔除
+        'polygon':      (GL_FILL, GL_FILL),             # 正面和背面的多边形模式
+        'line_width':   1.0,                            # 线宽
+        'stipple':      None,                           # 线型：重复因子和模式组成的元组，None表示实线
+        'sprite':       False                           # 点精灵
+    }
+
+    def __init__(self):
+        """构造函数"""
+
+        self.current = dict()                           # 当前状态，缺少的键表示状态未知
+        self.textures = dict()                          # 纹理单元当前绑定的纹理类型和纹理
+        self.samplers = dict()                          # 着色器程序中采样器变量的纹理单元，键为着色器程序和变量位置
+        self.active = None                              # 当前激活的纹理单元
+        self.changes = 0                                # 实际执行的状态切换次数
+        self.program_switches = 0                       # 实际执行的着色器程序切换次数
+        self.texture_binds = 0                          # 实际执行的纹理绑定次数
+        self.sampler_uploads = 0                        # 实际执行的采样器变量上传次数
+
+    def reset(self):
+        """清除记录的状态：其他代码直接修改了GL状态后调用，此后的每个状态都会重新设置一次"""
+
+        self.current.clear()
+        self.textures.clear()
+        self.active = None
+
+    def _changed(self, key, value):
+        """状态改变时记录新值并返回True"""
+
+        if key in self.current and self.current[key] == value:
+            return False
+
+        self.current[key] = value
+        self.changes += 1
+
+        return True
+
+    def use_program(self, program):
+        """使用着色器程序"""
+
+        if self._changed('program', program):
+            glUseProgram(program)
+            self.program_switches += 1
+
+    def bind_vertex_array(self, vao):
+        """绑定顶点数组对象"""
+
+        if self._changed('vao', vao):
+            glBindVertexArray(vao)
+
+    def bind_texture(self, unit, ttype, tid):
+        """将纹理绑定到纹理单元
+
+        unit        - 纹理单元，如GL_TEXTURE0
+        ttype       - 纹理类型
+        tid         - 纹理
+        """
+
+        if self.textures.get(unit) == (ttype, tid):
+            return
+
+        if self.active != unit:
+            glActiveTexture(unit)
+            self.active = unit
+
+        glBindTexture(ttype, tid)
+        self.textures[unit] = (ttype, tid)
+        self.changes += 1
+        self.texture_binds += 1
+
+    def set_sampler(self, program, loc, unit):
+        """设置当前着色器程序中采样器变量的纹理单元：采样器的值保存在着色器程序中，只在改变时上传
+
+        program     - 当前着色器程序
+        loc         - 采样器变量位置
+        unit        - 纹理单元序号
+        """
+
+        if self.samplers.get((program, loc)) == unit:
+            return
+
+        glUniform1i(loc, unit)
+        self.samplers[(program, loc)] = unit
+        self.sampler_uploads += 1
+
+    def forget_program(self, program):
+        """清除着色器程序的采样器记录：新创建的着色器程序可能复用已删除的着色器程序的编号"""
+
+        for key in [key for key in self.samplers if key[0] == program]:
+            del self.samplers[key]
+
+    def apply(self, state):
+        """设置模型的绘制状态，state中未指定的状态使用默认值
+
+        state       - 模型绘制状态字典
+        """
+
+        cull = state.get('cull', self.DEFAULT['cull'])
+        if self._changed('cull', cull):
+            if cull is None:
+                glDisable(GL_CULL_FACE)
+            else:
+                glEnable(GL_CULL_FACE)
+                glCullFace(cull)
+
+        front, back = state.get('polygon', self.DEFAULT['polygon'])
+        if self._changed('polygon', (front, back)):
+            if front == back:
+                glPolygonMode(GL_FRONT_AND_BACK, front)
+            else:
+                glPolygonMode(GL_FRONT, front)
+                glPolygonMode(GL_BACK, back)
+
+        width = state.get('line_width', self.DEFAULT['line_width'])
+        if self._changed('line_width', width):
+            glLineWidth(width)
+
+        stipple = state.get('stipple', self.DEFAULT['stipple'])
+        if self._changed('stipple', stipple):
+            if stipple is None:
+                glDisable(GL_LINE_STIPPLE)
+            else:
+                glEnable(GL_LINE_STIPPLE)
+                glLineStipple(*stipple)
+
+        sprite = state.get('sprite', self.DEFAULT['sprite'])
+        if self._changed('sprite', sprite):
+            if sprite:
+                glEnable(GL_POINT_SPRITE)
+                glEnable(GL_PROGRAM_POINT_SIZE)
+            else:
+                glDisable(GL_POINT_SPRITE)
+                glDisable(GL_PROGRAM_POINT_SIZE)
+
+    def restore(self):
+        """恢复默认状态，解除着色器程序、顶点数组对象和纹理的绑定"""
+
+        self.apply(self.DEFAULT)
+
+        for unit, (ttype, tid) in list(self.textures.items()):
+            if tid:
+                self.bind_texture(unit, ttype, 0)
+
+        if self.active not in (None, GL_TEXTURE0):
+            glActiveTexture(GL_TEXTURE0)
+            self.active = GL_TEXTURE0
+
+        if self.current.get('vao'):
+            self.bind_vertex_array(0)
+
+        self.use_program(0)
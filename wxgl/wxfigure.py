@@ -1,18 +1,13 @@
 #!/usr/bin/env python3
 
-import os, sys, time
-import numpy as np
-import threading
-import imageio
+import os
 import wx
 import wx.lib.agw.aui as aui
 from wx.lib.embeddedimage import PyEmbeddedImage
 from . wxscene import WxScene
+from . recorder import FrameRecorder
 from . import imgres
 
-if sys.platform.lower() != 'darwin':
-    import webp
-
 class WxFigure(wx.Frame):
     """构造函数"""
 
@@ -87,11 +82,10 @@ class WxFigure(wx.Frame):
         self.scene.Bind(wx.EVT_KEY_DOWN, self.on_key_down)
         self.scene.Bind(wx.EVT_KEY_UP, self.on_key_up)
         
+        self.errors = list()                                        # 生成文件时发生的异常
         if not self.outfile is None:
-            self.cn = 0
-            threading_record = threading.Thread(target=self.create_file)
-            threading_record.setDaemon(True)
-            threading_record.start()
+            self.recorder = FrameRecorder(self.scene, **kwds)
+            self.scene.Bind(wx.EVT_PAINT, self.on_first_paint)      # 画布首次重绘（完成GL初始化）之后开始录制
 
     def on_key_down(self, evt):
         """键盘按下"""
@@ -151,90 +145,29 @@ class WxFigure(wx.Frame):
         
         self.tb.Realize()
 
+    def on_first_paint(self, evt):
+        """画布首次重绘事件函数：由场景的重绘事件函数初始化GL并绘制，之后开始录制"""
+
+        evt.Skip()
+        self.scene.Unbind(wx.EVT_PAINT, handler=self.on_first_paint)
+        wx.CallAfter(self.create_file)
+
     def create_file(self):
-        """生成图像或动画文件的线程函数"""
- 
-        self.scene.increment = False
-        self.scene.duration = 0
-        ft = round(1000/self.fps)
-
-        self.scene.Refresh(False)
-        while not self.scene.gl_init_done:
-            time.sleep(0.01)
-
-        if self.ext in ('.png', '.jpg', '.jpeg'):
-            self.scene.duration = 0
-            time.sleep(0.01)
-
-            self.scene.painted = False
-            self.scene.Refresh(False)
-            while not self.scene.painted:
-                time.sleep(0.01)
-
-            self.scene.im_pil = None
-            wx.CallAfter(self.scene.capture, mode='RGBA' if self.ext=='.png' else 'RGB')
-            while self.scene.im_pil is None:
-                time.sleep(0.01)
-
-            if isinstance(self.dpi, (int, float)):
-                self.scene.im_pil.save(self.outfile, dpi=(self.dpi, self.dpi))
-            else:
-                self.scene.im_pil.save(self.outfile)
-        elif self.ext == '.webp':
-            enc = webp.WebPAnimEncoder.new(*self.scene.csize)
-            cfg = webp.WebPConfig.new(quality=100)
-            timestamp_ms = 0
-            while self.cn < self.frames:
-                self.scene.duration = self.cn * ft
-                time.sleep(0.01)
-
-                self.scene.painted = False
-                self.scene.Refresh(False)
-                while not self.scene.painted:
-                    time.sleep(0.01)
-
-                self.scene.im_pil = None
-                wx.CallAfter(self.scene.capture)
-                while self.scene.im_pil is None:
-                    time.sleep(0.01)
-
-                pic = webp.WebPPicture.from_pil(self.scene.im_pil)
-                enc.encode_frame(pic, timestamp_ms, cfg)
-                timestamp_ms += ft
-                self.cn += 1
-
-            anim_data = enc.assemble(timestamp_ms)
-            with open(self.outfile, 'wb') as fp:
-                fp.write(anim_data.buffer())
-        else:
-            if self.ext == '.gif':
-                writer = imageio.get_writer(self.outfile, fps=self.fps, loop=self.loop)
-                crop = False
+        """录制一帧并安排录制下一帧，全部帧录制完成后关闭窗口；帧图像由编码线程写入文件，出错时记录异常并关闭窗口"""
+
+        try:
+            if self.recorder.next_frame():
+                self.scene.SetCurrent(self.scene.context)
+                self.scene._paint()
+                self.recorder.capture(buffer='back')
+                self.scene.SwapBuffers()
+                wx.CallAfter(self.create_file)
             else:
-                writer = imageio.get_writer(self.outfile, fps=self.fps)
-                crop = True
- 
-            while self.cn < self.frames:
-                self.scene.duration = self.cn * ft
-                time.sleep(0.01)
-
-                self.scene.painted = False
-                self.scene.Refresh(False)
-                while not self.scene.painted:
-                    time.sleep(0.01)
-
-                self.scene.im_pil = None
-                wx.CallAfter(self.scene.capture, crop=crop)
-                while self.scene.im_pil is None:
-                    time.sleep(0.01)
- 
-                im = np.array(self.scene.im_pil)
-                writer.append_data(im)
-                self.cn +=1
- 
-            writer.close()
-
-        wx.CallAfter(self.Close)
+                self.recorder.finish()
+                self.Close()
+        except Exception as e:
+            self.errors.append(e)
+            self.Close()
 
 def show_wxfigure(scheme, **kwds):
     """保存画布为图像文件或动画文件
@@ -251,6 +184,10 @@ def show_wxfigure(scheme, **kwds):
 
     app = wx.App()
     fig = WxFigure(scheme, **kwds)
+    errors = fig.errors
     app.MainLoop()
     app.Destroy()
 
+    if errors:
+        raise RuntimeError('生成文件失败：%s'%errors[0]) from errors[0]
+
@@ -31,9 +31,15 @@ class WxScene(BaseScene, glc.GLCanvas):
         self.Bind(wx.EVT_MOTION, self.on_mouse_motion)              # 绑定鼠标移动事件
         self.Bind(wx.EVT_MOUSEWHEEL, self.on_mouse_wheel)           # 绑定鼠标滚轮事件
 
+        self.timer = wx.Timer(self)                                 # 动画定时器，静态场景不启动
+        self.Bind(wx.EVT_TIMER, self.on_timer, self.timer)          # 绑定定时器事件
+        if self.scheme.alive:
+            self.timer.Start(self._frame_interval())
+
     def on_destroy(self, evt):
         """窗口销毁事件函数"""
  
+        self.timer.Stop()
         self.SetCurrent(self.context)
         self._clear_buffer()
         evt.Skip()
@@ -107,17 +113,29 @@ class WxScene(BaseScene, glc.GLCanvas):
         self.SwapBuffers()
         self.painted = True
 
-    def on_idle(self, evt):
-        """idle事件函数"""
-
         if self.is_wxgl_app:
             if self.scheme.cinfo:
                 wx.CallAfter(self.parent.sb.SetStatusText, self.scheme.cinfo(self.azim, self.elev, self.dist), 1)
         
             if self.scheme.tinfo:
                 wx.CallAfter(self.parent.sb.SetStatusText, self.scheme.tinfo(self.duration), 2)
-        
-        wx.CallAfter(self.Refresh, False)
+
+    def on_idle(self, evt):
+        """idle事件函数：仅在场景需要重绘时刷新"""
+
+        if self._frame_due():
+            wx.CallAfter(self.Refresh, False)
+
+    def on_timer(self, evt):
+        """动画定时器事件函数"""
+
+        if self._frame_due():
+            self.Refresh(False)
+
+    def _request_redraw(self):
+        """请求重绘"""
+
+        self.Refresh(False)
 
     def home(self):
         """恢复初始位置和姿态"""
@@ -141,6 +159,24 @@ class WxScene(BaseScene, glc.GLCanvas):
         self.SetCurrent(self.context)
         self._capture(mode=mode, crop=crop, buffer=buffer)
 
+    def capture_async(self, mode='RGBA', crop=False, buffer='front', tag=None):
+        """异步捕捉缓冲区数据：读取请求写入像素缓冲区对象后立即返回，返回此前已经完成读取的帧（PIL对象和附加信息组成的元组）的列表
+ 
+        mode        - 'RGB'或'RGBA'
+        crop        - 是否将宽高裁切为16的倍数
+        buffer      - 'front'（前缓冲区）或'back'（后缓冲区）
+        tag         - 与该帧图像一起返回的附加信息
+        """
+
+        self.SetCurrent(self.context)
+        return self._capture_async(mode=mode, crop=crop, buffer=buffer, tag=tag)
+
+    def flush_capture(self):
+        """完成全部尚未完成的异步捕捉，返回各帧PIL对象和附加信息组成的元组的列表"""
+
+        self.SetCurrent(self.context)
+        return self._flush_capture()
+
     def get_buffer(self, mode='RGBA', crop=False, buffer='front'):
         """以PIL对象的格式返回场景缓冲区数据
  
@@ -151,6 +187,24 @@ class WxScene(BaseScene, glc.GLCanvas):
 
         return self._get_buffer(mode=mode, crop=crop, buffer=buffer)
 
+    def raycast(self, x, y):
+        """CPU射线拾取，返回离相机最近的模型id、三角形顶点索引和交点世界坐标组成的元组，未命中返回None
+
+        x, y        - 拾取点的窗口坐标（原点位于左下角）
+        """
+
+        return self._raycast(x, y)
+
+    def profile_stats(self):
+        """返回滑动窗口内逐模型和逐部件的CPU和GPU平均耗时（毫秒），按耗时降序排列；未开启性能分析时返回None"""
+
+        return self._profile_stats()
+
+    def render_stats(self):
+        """返回最近一帧的绘制计数：剔除和绘制的模型数量、绘制调用次数、提交的顶点和索引数量、着色器程序切换和纹理绑定次数、uniform变量和缓冲区上传数量"""
+
+        return self._frame_counters()
+
     def set_visible(self, name, visible):
         """设置部件或模型的可见性
 